@@ -0,0 +1,96 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from fastapi import WebSocket
+
+from api import protocols
+from config import settings
+from services.metrics import registry
+
+
+WS_INFLIGHT = registry.gauge(
+    "zeno_ws_inflight_requests", "WebSocket requests dispatched and not yet finished")
+WS_CANCELLED = registry.counter(
+    "zeno_ws_cancelled_requests_total", "WebSocket requests cancelled by the client")
+
+
+class ClientConnection:
+    """Per-socket state: serialized sends and in-flight request tasks"""
+    
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_concurrent: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        protocol=None,
+    ):
+        self.websocket = websocket
+        # Wire format negotiated at connect time (JSON text or MessagePack binary)
+        self.protocol = protocol or protocols.JSON
+        self.max_concurrent = max_concurrent or settings.WS_MAX_CONCURRENT_REQUESTS
+        self.max_pending = max_pending or settings.WS_MAX_PENDING_REQUESTS
+        self._send_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._requests: Dict[str, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+    
+    @property
+    def pending(self) -> int:
+        """Number of dispatched requests that are running or waiting for a slot"""
+        return len(self._tasks)
+    
+    async def receive(self) -> Any:
+        """Receive and decode one message"""
+        if self.protocol.binary:
+            return self.protocol.decode(await self.websocket.receive_bytes())
+        return self.protocol.decode(await self.websocket.receive_text())
+    
+    async def send_json(self, data: Any):
+        """Send one frame; concurrent requests never interleave writes"""
+        frame = self.protocol.encode(data)
+        async with self._send_lock:
+            if self.protocol.binary:
+                await self.websocket.send_bytes(frame)
+            else:
+                await self.websocket.send_text(frame)
+    
+    def dispatch(self, request_id: Optional[str], handler: Callable[[], Awaitable[None]]) -> asyncio.Task:
+        """Run a request as its own task once a concurrency slot is free"""
+        task = asyncio.create_task(self._run(handler))
+        self._tasks.add(task)
+        if request_id:
+            self._requests[request_id] = task
+        WS_INFLIGHT.inc()
+        task.add_done_callback(lambda t: self._forget(request_id, t))
+        return task
+    
+    def cancel(self, request_id: str) -> bool:
+        """Cancel an in-flight request, returning False if it is not running"""
+        task = self._requests.get(request_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        WS_CANCELLED.inc()
+        return True
+    
+    async def close(self):
+        """Cancel every outstanding request and wait for them to unwind"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _run(self, handler: Callable[[], Awaitable[None]]):
+        async with self._slots:
+            try:
+                await handler()
+            except Exception as e:
+                # Errors are reported by the handler; this only catches failed sends
+                print(f"[WS] Request failed: {e}")
+    
+    def _forget(self, request_id: Optional[str], task: asyncio.Task):
+        self._tasks.discard(task)
+        if request_id and self._requests.get(request_id) is task:
+            del self._requests[request_id]
+        WS_INFLIGHT.dec()
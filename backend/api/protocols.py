@@ -0,0 +1,60 @@
+"""WebSocket wire formats negotiated through Sec-WebSocket-Protocol
+
+Clients that send no sub-protocol (or "zeno.json") get JSON text frames.
+Clients that offer "zeno.msgpack" get binary MessagePack frames carrying
+the same messages, provided the optional msgpack package is installed;
+otherwise they fall back to JSON.
+"""
+from typing import Any, Iterable, Optional, Tuple, Union
+
+from services import json_codec
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON_SUBPROTOCOL = "zeno.json"
+MSGPACK_SUBPROTOCOL = "zeno.msgpack"
+
+
+class JsonProtocol:
+    binary = False
+    
+    def encode(self, data: Any) -> str:
+        return json_codec.dumps(data)
+    
+    def decode(self, frame: Union[str, bytes]) -> Any:
+        return json_codec.loads(frame)
+
+
+class MsgpackProtocol:
+    binary = True
+    
+    def encode(self, data: Any) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+    
+    def decode(self, frame: bytes) -> Any:
+        return msgpack.unpackb(frame, raw=False)
+
+
+JSON = JsonProtocol()
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def negotiate(offered: Iterable[str]) -> Tuple[Any, Optional[str]]:
+    """Pick a protocol from the client's offer
+    
+    Returns the protocol and the sub-protocol name to echo in the
+    handshake (None when the client offered nothing we support).
+    """
+    offered = list(offered)
+    if MSGPACK_SUBPROTOCOL in offered and msgpack_available():
+        return MsgpackProtocol(), MSGPACK_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return JSON, JSON_SUBPROTOCOL
+    return JSON, None
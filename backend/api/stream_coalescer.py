@@ -0,0 +1,100 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional
+
+from config import settings
+from services.metrics import registry
+
+
+STREAM_FRAMES = registry.counter(
+    "zeno_stream_frames_total", "Stream chunk frames sent to clients")
+STREAM_CHUNKS_COALESCED = registry.counter(
+    "zeno_stream_chunks_coalesced_total", "Upstream chunks merged into a shared frame")
+
+
+class StreamCoalescer:
+    """Buffers stream chunks and sends them as fewer, larger frames
+    
+    The first chunk is always sent immediately so time-to-first-token is
+    unaffected. Later chunks are flushed once the buffer reaches
+    ``max_bytes`` or ``window`` seconds after the first buffered chunk,
+    whichever comes first.
+    """
+    
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        enabled: Optional[bool] = None,
+        window: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.send = send
+        self.enabled = settings.STREAM_COALESCE_ENABLED if enabled is None else enabled
+        self.window = settings.STREAM_COALESCE_WINDOW_MS / 1000 if window is None else window
+        self.max_bytes = settings.STREAM_COALESCE_MAX_BYTES if max_bytes is None else max_bytes
+        self._buffer: List[str] = []
+        self._size = 0
+        self._first_sent = False
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+    
+    async def add(self, chunk: str):
+        """Queue a chunk, sending it now if it is the first or coalescing is off"""
+        self._raise_pending_error()
+        
+        if not self.enabled or not self._first_sent:
+            self._first_sent = True
+            async with self._lock:
+                await self._send([chunk])
+            return
+        
+        self._buffer.append(chunk)
+        self._size += len(chunk.encode("utf-8"))
+        
+        if self._size >= self.max_bytes:
+            self.cancel()
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+    
+    async def flush(self):
+        """Send everything buffered so far as one frame"""
+        async with self._lock:
+            if not self._buffer:
+                return
+            chunks, self._buffer, self._size = self._buffer, [], 0
+            await self._send(chunks)
+    
+    async def close(self):
+        """Stop the flush timer and send any remaining buffered text"""
+        self.cancel()
+        self._raise_pending_error()
+        await self.flush()
+    
+    async def _send(self, chunks: List[str]):
+        STREAM_FRAMES.inc()
+        if len(chunks) > 1:
+            STREAM_CHUNKS_COALESCED.inc(len(chunks) - 1)
+        await self.send("".join(chunks))
+    
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.window)
+            self._timer = None
+            await self.flush()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Surface send failures to the streaming loop on its next call
+            self._error = e
+    
+    def cancel(self):
+        """Stop the flush timer without sending buffered text"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+    
+    def _raise_pending_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
@@ -1,8 +1,19 @@
-import json
-from typing import Any, Dict
+import asyncio
+import contextlib
+import functools
+import time
+from typing import Any, Dict, Optional
 from fastapi import WebSocket
 
+from api.connection import ClientConnection
+from api.stream_coalescer import StreamCoalescer
+from services.context_service import ContextBuilder
+from services.memory_service import MemoryService
+from services.metrics import ChatMetrics
 from services.ollama_service import OllamaService
+from services.response_cache import ResponseCache
+from services.scheduler import ChatScheduler, SchedulerFull
+from services.search_service import SearchService
 from services.action_service import ActionService
 from services.database_service import DatabaseService
 from security.audit_logger import AuditLogger
@@ -16,18 +27,40 @@ class WebSocketHandler:
         self.action_service = ActionService(audit_logger)
         self.audit_logger = audit_logger
         self.db_service = db_service
+        self.memory = MemoryService(ollama_service)
+        self.context_builder = ContextBuilder(db_service, memory=self.memory)
+        self.response_cache = ResponseCache(ollama_service)
+        self.search = SearchService(db_service)
+        self.scheduler = ChatScheduler()
     
-    async def handle_connection(self, websocket: WebSocket):
+    async def handle_connection(self, websocket: WebSocket, protocol=None):
         """Handle WebSocket connection lifecycle"""
-        while True:
-            # Receive message
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            
-            # Route message
-            await self.route_message(websocket, message)
+        connection = ClientConnection(websocket, protocol=protocol)
+        try:
+            while True:
+                # Receive message
+                message = await connection.receive()
+                received_at = time.perf_counter()
+                request_id = message.get("requestId")
+                
+                # Cancellation must not wait behind the requests it targets
+                if message.get("type") == "cancel":
+                    await self.handle_cancel(connection, message.get("data", {}), request_id)
+                    continue
+                
+                if connection.pending >= connection.max_pending:
+                    await self.send_error(connection, "Too many concurrent requests", request_id)
+                    continue
+                
+                # Route message on its own task
+                connection.dispatch(
+                    request_id,
+                    functools.partial(self.route_message, connection, message, received_at),
+                )
+        finally:
+            await connection.close()
     
-    async def route_message(self, websocket: WebSocket, message: Dict[str, Any]):
+    async def route_message(self, websocket: ClientConnection, message: Dict[str, Any], received_at: Optional[float] = None):
         """Route message to appropriate handler"""
         msg_type = message.get("type")
         msg_data = message.get("data", {})
@@ -35,7 +68,7 @@ class WebSocketHandler:
         
         try:
             if msg_type == "chat":
-                await self.handle_chat(websocket, msg_data, request_id)
+                await self.handle_chat(websocket, msg_data, request_id, received_at)
             elif msg_type == "models":
                 await self.handle_models(websocket, request_id)
             elif msg_type == "action":
@@ -47,21 +80,42 @@ class WebSocketHandler:
             elif msg_type == "save_message":
                 await self.handle_save_message(websocket, msg_data, request_id)
             elif msg_type == "load_conversations":
-                await self.handle_load_conversations(websocket, request_id)
+                await self.handle_load_conversations(websocket, msg_data, request_id)
             elif msg_type == "load_messages":
                 await self.handle_load_messages(websocket, msg_data, request_id)
             elif msg_type == "delete_conversation":
                 await self.handle_delete_conversation(websocket, msg_data, request_id)
+            elif msg_type == "search_messages":
+                await self.handle_search_messages(websocket, msg_data, request_id)
             else:
                 await self.send_error(websocket, f"Unknown message type: {msg_type}", request_id)
         
         except Exception as e:
             await self.send_error(websocket, str(e), request_id)
     
-    async def handle_chat(self, websocket: WebSocket, data: Dict[str, Any], request_id: str):
+    async def handle_chat(self, websocket: ClientConnection, data: Dict[str, Any], request_id: str, received_at: Optional[float] = None):
         """Handle chat message with streaming"""
-        messages = data.get("messages", [])
         model = data.get("model", "llama2")
+        temperature = data.get("temperature", 0.7)
+        # "background" work (e.g. summaries) queues behind interactive chats
+        priority = data.get("priority", "interactive")
+        conversation_id = data.get("conversationId")
+        
+        # The model name keys scheduler state and metric labels, so only known models get that far
+        try:
+            known = await self.ollama_service.has_model(model)
+        except Exception as e:
+            ChatMetrics(model, received_at).finish("error")
+            await self.send_error(websocket, f"Chat error: {str(e)}", request_id)
+            return
+        metrics = ChatMetrics(model, received_at, known=known)
+        if not known:
+            metrics.finish("rejected")
+            await self.send_error(websocket, f"Unknown model: {model}", request_id)
+            return
+        
+        # With a conversationId the history comes from the database and the client sends only the new turn
+        messages = await self.context_builder.build(data.get("messages", []), conversation_id)
         
         print(f"[CHAT] Received chat request - Model: {model}, Messages: {len(messages)}")
         
@@ -71,21 +125,61 @@ class WebSocketHandler:
             "message_count": len(messages),
         })
         
+        async def send_chunk(text: str):
+            await websocket.send_json({
+                "type": "stream",
+                "data": {"chunk": text, "done": False},
+                "requestId": request_id,
+            })
+        
+        async def send_position(position: int):
+            # A stream frame without a chunk, so clients that only read chunks keep waiting
+            await websocket.send_json({
+                "type": "stream",
+                "data": {"done": False, "queue": {"position": position, "model": model}},
+                "requestId": request_id,
+            })
+        
+        coalescer = StreamCoalescer(send_chunk)
+        cached = None
+        response = []
+        
         try:
-            print(f"[CHAT] Starting stream from Ollama...")
-            # Stream response
-            chunk_count = 0
-            async for chunk in self.ollama_service.chat_stream(messages, model):
-                chunk_count += 1
-                if chunk_count == 1:
-                    print(f"[CHAT] First chunk received!")
-                await websocket.send_json({
-                    "type": "stream",
-                    "data": {"chunk": chunk, "done": False},
-                    "requestId": request_id,
-                })
+            if self.response_cache.enabled:
+                cached = await self.response_cache.lookup(model, messages, temperature)
+            
+            async with contextlib.AsyncExitStack() as stack:
+                if cached and cached.hit:
+                    print(f"[CHAT] Replaying cached response")
+                    stream = self.response_cache.replay(cached.response)
+                else:
+                    # Wait for a free Ollama slot for this model (or fail fast if the queue is full)
+                    await stack.enter_async_context(self.scheduler.slot(model, websocket, priority, send_position))
+                    print(f"[CHAT] Starting stream from Ollama...")
+                    stream = self.ollama_service.chat_stream(messages, model, temperature, stats=metrics.ollama_stats)
+                # Close the generator (and the upstream Ollama response) on any exit,
+                # including a cancel that lands while a send is in progress
+                stream = await stack.enter_async_context(contextlib.aclosing(stream))
+                
+                # Stream response
+                metrics.start()
+                async for chunk in stream:
+                    metrics.chunk()
+                    if metrics.chunks == 1:
+                        print(f"[CHAT] First chunk received!")
+                    if cached:
+                        response.append(chunk)
+                    await coalescer.add(chunk)
             
-            print(f"[CHAT] Stream complete - {chunk_count} chunks sent")
+            await coalescer.close()
+            if cached:
+                self.response_cache.store(cached, "".join(response))
+            summary = metrics.finish("cached" if cached and cached.hit else "ok")
+            print(
+                f"[CHAT] Stream complete - {summary['chunks']} chunks sent, "
+                f"first chunk {summary['time_to_first_chunk'] or 0:.3f}s, "
+                f"{summary['tokens_per_second'] or 0:.1f} tok/s"
+            )
             # Send completion
             await websocket.send_json({
                 "type": "stream",
@@ -93,11 +187,33 @@ class WebSocketHandler:
                 "requestId": request_id,
             })
         
+        except asyncio.CancelledError:
+            # The exit stack has already closed the upstream Ollama response
+            coalescer.cancel()
+            metrics.finish("cancelled")
+            print(f"[CHAT] Stream cancelled after {metrics.chunks} chunks")
+            try:
+                await websocket.send_json({
+                    "type": "stream",
+                    "data": {"done": True, "cancelled": True},
+                    "requestId": request_id,
+                })
+            except Exception:
+                pass  # Socket already closed
+            raise
+        
+        except SchedulerFull as e:
+            metrics.finish("rejected")
+            print(f"[CHAT] Rejected: {e}")
+            await self.send_error(websocket, str(e), request_id)
+        
         except Exception as e:
+            coalescer.cancel()
+            metrics.finish("error")
             print(f"[CHAT ERROR] {str(e)}")
             await self.send_error(websocket, f"Chat error: {str(e)}", request_id)
     
-    async def handle_models(self, websocket: WebSocket, request_id: str):
+    async def handle_models(self, websocket: ClientConnection, request_id: str):
         """Handle models list request"""
         try:
             models = await self.ollama_service.list_models()
@@ -109,7 +225,7 @@ class WebSocketHandler:
         except Exception as e:
             await self.send_error(websocket, f"Models error: {str(e)}", request_id)
     
-    async def handle_action(self, websocket: WebSocket, data: Dict[str, Any], request_id: str):
+    async def handle_action(self, websocket: ClientConnection, data: Dict[str, Any], request_id: str):
         """Handle action execution request"""
         action_type = data.get("type")
         command = data.get("command")
@@ -122,11 +238,23 @@ class WebSocketHandler:
             "description": description,
         })
         
+        async def send_output(stream: str, text: str):
+            await websocket.send_json({
+                "type": "stream",
+                "data": {"chunk": text, "stream": stream, "done": False},
+                "requestId": request_id,
+            })
+        
         try:
+            # Cancelling this request kills the subprocess
             result = await self.action_service.execute_action(
                 action_type=action_type,
                 command=command,
                 description=description,
+                # Output frames are opt-in; older clients resolve on the first frame they get
+                on_output=send_output if data.get("stream") else None,
+                offset=data.get("offset", 0),
+                length=data.get("length"),
             )
             
             await websocket.send_json({
@@ -138,7 +266,7 @@ class WebSocketHandler:
         except Exception as e:
             await self.send_error(websocket, f"Action error: {str(e)}", request_id)
     
-    async def handle_settings(self, websocket: WebSocket, data: Dict[str, Any], request_id: str):
+    async def handle_settings(self, websocket: ClientConnection, data: Dict[str, Any], request_id: str):
         """Handle settings update"""
         # Log settings change
         self.audit_logger.log_action("settings_update", data)
@@ -149,7 +277,7 @@ class WebSocketHandler:
             "requestId": request_id,
         })
     
-    async def handle_save_conversation(self, websocket: WebSocket, data: Dict[str, Any], request_id: str):
+    async def handle_save_conversation(self, websocket: ClientConnection, data: Dict[str, Any], request_id: str):
         """Save conversation to database"""
         if not self.db_service:
             await self.send_error(websocket, "Database not available", request_id)
@@ -159,14 +287,15 @@ class WebSocketHandler:
         title = data.get("title")
         model = data.get("model")
         
-        success = self.db_service.save_conversation(conversation_id, title, model)
+        success = await self.db_service.save_conversation(conversation_id, title, model)
+        await self.search.index_conversation(conversation_id, title)
         await websocket.send_json({
             "type": "save_conversation",
             "data": {"success": success},
             "requestId": request_id,
         })
     
-    async def handle_save_message(self, websocket: WebSocket, data: Dict[str, Any], request_id: str):
+    async def handle_save_message(self, websocket: ClientConnection, data: Dict[str, Any], request_id: str):
         """Save message to database"""
         if not self.db_service:
             await self.send_error(websocket, "Database not available", request_id)
@@ -177,55 +306,81 @@ class WebSocketHandler:
         role = data.get("role")
         content = data.get("content")
         
-        success = self.db_service.save_message(message_id, conversation_id, role, content)
+        success = await self.db_service.save_message(message_id, conversation_id, role, content)
+        if success:
+            self.memory.remember(message_id, conversation_id, role, content)
+        # Kept even when MySQL is down, so the local index can still find it
+        await self.search.index_message(message_id, conversation_id, role, content)
         await websocket.send_json({
             "type": "save_message",
             "data": {"success": success},
             "requestId": request_id,
         })
     
-    async def handle_load_conversations(self, websocket: WebSocket, request_id: str):
-        """Load all conversations from database"""
+    async def handle_load_conversations(self, websocket: ClientConnection, data: Dict[str, Any], request_id: str):
+        """Load conversations from database, optionally one page at a time"""
         if not self.db_service:
             await self.send_error(websocket, "Database not available", request_id)
             return
             
-        conversations = self.db_service.get_all_conversations()
+        page = await self.db_service.get_conversations_page(data.get("limit"), data.get("cursor"))
         await websocket.send_json({
             "type": "load_conversations",
-            "data": {"conversations": conversations},
+            "data": {"conversations": page["conversations"], "nextCursor": page["next_cursor"]},
             "requestId": request_id,
         })
     
-    async def handle_load_messages(self, websocket: WebSocket, data: Dict[str, Any], request_id: str):
-        """Load messages for a conversation from database"""
+    async def handle_load_messages(self, websocket: ClientConnection, data: Dict[str, Any], request_id: str):
+        """Load messages for a conversation from database, optionally one page at a time"""
         if not self.db_service:
             await self.send_error(websocket, "Database not available", request_id)
             return
             
         conversation_id = data.get("conversationId")
-        messages = self.db_service.get_conversation_messages(conversation_id)
+        page = await self.db_service.get_messages_page(conversation_id, data.get("limit"), data.get("cursor"))
         await websocket.send_json({
             "type": "load_messages",
-            "data": {"messages": messages},
+            "data": {"messages": page["messages"], "nextCursor": page["next_cursor"]},
             "requestId": request_id,
         })
     
-    async def handle_delete_conversation(self, websocket: WebSocket, data: Dict[str, Any], request_id: str):
+    async def handle_delete_conversation(self, websocket: ClientConnection, data: Dict[str, Any], request_id: str):
         """Delete conversation from database"""
         if not self.db_service:
             await self.send_error(websocket, "Database not available", request_id)
             return
             
         conversation_id = data.get("conversationId")
-        success = self.db_service.delete_conversation(conversation_id)
+        success = await self.db_service.delete_conversation(conversation_id)
+        if success:
+            await self.memory.forget_conversation(conversation_id)
+        await self.search.forget_conversation(conversation_id)
         await websocket.send_json({
             "type": "delete_conversation",
             "data": {"success": success},
             "requestId": request_id,
         })
     
-    async def send_error(self, websocket: WebSocket, error: str, request_id: str = None):
+    async def handle_search_messages(self, websocket: ClientConnection, data: Dict[str, Any], request_id: str):
+        """Full-text search over saved messages, best matches first, one page at a time"""
+        page = await self.search.search(data.get("query", ""), data.get("limit"), data.get("cursor"))
+        await websocket.send_json({
+            "type": "search_messages",
+            "data": {"results": page["results"], "nextCursor": page["next_cursor"]},
+            "requestId": request_id,
+        })
+    
+    async def handle_cancel(self, websocket: ClientConnection, data: Dict[str, Any], request_id: str):
+        """Cancel an in-flight request on this connection"""
+        target_id = data.get("requestId")
+        success = bool(target_id) and websocket.cancel(target_id)
+        await websocket.send_json({
+            "type": "cancel",
+            "data": {"success": success, "requestId": target_id},
+            "requestId": request_id,
+        })
+    
+    async def send_error(self, websocket: ClientConnection, error: str, request_id: str = None):
         """Send error message"""
         await websocket.send_json({
             "type": "error",
@@ -0,0 +1,105 @@
+"""permessage-deflate for /ws with a minimum message size
+
+Small frames (stream chunks, queue updates) are sent uncompressed, which
+RFC 7692 allows per message, so they don't pay the zlib cost. Large ones
+(load_messages, load_conversations) are compressed with the level and
+window size from Settings.
+"""
+import time
+from typing import Any, List, Optional, Sequence, Tuple
+
+from websockets.extensions.base import Extension
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from websockets.frames import CTRL_OPCODES, Opcode
+
+from config import settings
+from services.metrics import registry
+
+try:
+    from uvicorn.protocols.websockets.websockets_sansio_impl import WebSocketsSansIOProtocol as _UvicornProtocol
+except ImportError:
+    from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol as _UvicornProtocol
+
+
+DEFLATE_TIME_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+DEFLATE_RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+WS_DEFLATE_MESSAGES = registry.counter(
+    "zeno_ws_deflate_messages_total", "Outgoing WebSocket messages by compression result", ["result"])
+WS_DEFLATE_INPUT_BYTES = registry.counter(
+    "zeno_ws_deflate_input_bytes_total", "Bytes of outgoing messages before compression")
+WS_DEFLATE_OUTPUT_BYTES = registry.counter(
+    "zeno_ws_deflate_output_bytes_total", "Bytes of outgoing messages after compression")
+WS_DEFLATE_RATIO = registry.histogram(
+    "zeno_ws_deflate_ratio", "Compressed size / original size per message", buckets=DEFLATE_RATIO_BUCKETS)
+WS_DEFLATE_SECONDS = registry.histogram(
+    "zeno_ws_deflate_seconds", "CPU time spent compressing one message", buckets=DEFLATE_TIME_BUCKETS)
+
+
+class ThresholdDeflate(Extension):
+    """Wraps the negotiated permessage-deflate extension to skip small messages"""
+    
+    def __init__(self, inner: Extension, min_size: int):
+        self.inner = inner
+        self.name = inner.name
+        self.min_size = min_size
+    
+    def __repr__(self) -> str:
+        return f"ThresholdDeflate({self.inner!r}, min_size={self.min_size})"
+    
+    def decode(self, frame, *, max_size: Optional[int] = None):
+        return self.inner.decode(frame, max_size=max_size)
+    
+    def encode(self, frame):
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+        if frame.opcode is not Opcode.CONT and frame.fin and len(frame.data) < self.min_size:
+            WS_DEFLATE_MESSAGES.inc(result="skipped")
+            return frame
+        
+        started = time.process_time()
+        encoded = self.inner.encode(frame)
+        WS_DEFLATE_SECONDS.observe(time.process_time() - started)
+        if frame.data:
+            WS_DEFLATE_MESSAGES.inc(result="compressed")
+            WS_DEFLATE_INPUT_BYTES.inc(len(frame.data))
+            WS_DEFLATE_OUTPUT_BYTES.inc(len(encoded.data))
+            WS_DEFLATE_RATIO.observe(len(encoded.data) / len(frame.data))
+        return encoded
+
+
+class ThresholdDeflateFactory(ServerPerMessageDeflateFactory):
+    """Negotiates permessage-deflate as usual and applies the size threshold"""
+    
+    def __init__(self, min_size: int, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.min_size = min_size
+    
+    def process_request_params(self, params: Sequence[Tuple[str, Optional[str]]], accepted_extensions: Sequence[Extension]):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, ThresholdDeflate(extension, self.min_size)
+
+
+def deflate_factory() -> ThresholdDeflateFactory:
+    return ThresholdDeflateFactory(
+        min_size=settings.WS_COMPRESSION_MIN_SIZE,
+        server_max_window_bits=settings.WS_COMPRESSION_WINDOW_BITS,
+        compress_settings={
+            "level": settings.WS_COMPRESSION_LEVEL,
+            "memLevel": settings.WS_COMPRESSION_MEM_LEVEL,
+        },
+    )
+
+
+class CompressedWebSocketProtocol(_UvicornProtocol):
+    """Uvicorn WebSocket protocol offering the thresholded permessage-deflate"""
+    
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        extensions: List[ServerPerMessageDeflateFactory] = []
+        if self.config.ws_per_message_deflate:
+            extensions.append(deflate_factory())
+        if hasattr(self, "conn"):
+            self.conn.available_extensions = extensions
+        else:
+            self.available_extensions = extensions
@@ -0,0 +1,59 @@
+"""CPU cost of the JSON codec on the chat streaming hot path
+
+Simulates 1k streamed tokens: parsing Ollama NDJSON lines and encoding the
+outgoing WebSocket stream frames. Run from the backend directory:
+    
+    python benchmarks/bench_json_codec.py
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.json_codec import CODECS, load_codec
+
+
+TOKENS = 1000
+ROUNDS = 50
+
+
+def ndjson_lines():
+    """Lines shaped like Ollama /api/chat stream output"""
+    for i in range(TOKENS):
+        yield (
+            '{"model":"llama2","created_at":"2024-01-01T00:00:00.000000Z",'
+            f'"message":{{"role":"assistant","content":" token{i}"}},"done":false}}'
+        )
+
+
+def run(dumps, loads, lines):
+    started = time.process_time()
+    for _ in range(ROUNDS):
+        for line in lines:
+            data = loads(line)
+            dumps({
+                "type": "stream",
+                "data": {"chunk": data["message"]["content"], "done": False},
+                "requestId": "4f3c2a1e-9b7d-4e6f-8a5b-3c2d1e0f9a8b",
+            })
+    return (time.process_time() - started) / ROUNDS
+
+
+def main():
+    lines = list(ndjson_lines())
+    results = {}
+    for name in CODECS:
+        loaded, dumps, loads = load_codec(name)
+        if loaded != name:
+            print(f"{name:>8}: not installed")
+            continue
+        results[name] = run(dumps, loads, lines)
+    
+    baseline = results["stdlib"]
+    for name, seconds in results.items():
+        print(f"{name:>8}: {seconds * 1000:7.2f} ms CPU per 1k tokens ({baseline / seconds:4.1f}x stdlib)")
+
+
+if __name__ == "__main__":
+    main()
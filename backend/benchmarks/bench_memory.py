@@ -0,0 +1,75 @@
+"""Memory index search latency, brute force against the inverted file
+
+Fills a throwaway index with clustered random vectors (like embeddings of
+messages on recurring topics), then times top-k searches over every
+vector and with the trained IVF lists, and reports how many of the exact
+top-k the IVF search found. Needs numpy. Run from the backend directory:
+
+    python benchmarks/bench_memory.py [rows] [dimensions]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from services.memory_index import MemoryIndex
+
+
+ROWS = 200_000
+DIMENSIONS = 384
+TOPICS = 2000
+QUERIES = 50
+K = 5
+
+
+def fill(index, rows, dim, rng):
+    """Write the vector and row files directly; add() per row is dominated by Python overhead"""
+    centers = rng.normal(size=(TOPICS, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, TOPICS, rows)] + rng.normal(scale=0.3, size=(rows, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index.add("m0", "c0", "user", "seed", vectors[0].tolist())
+    index.close()
+    with open(index.path / "vectors.f32", "ab") as handle:
+        handle.write(vectors[1:].tobytes())
+    with open(index.path / "rows.jsonl", "ab") as handle:
+        for row in range(1, rows):
+            handle.write(f'{{"id": "m{row}", "conversationId": "c{row % 1000}", "role": "user", "content": "message {row}"}}\n'.encode())
+    return centers
+
+
+def timed(index, queries):
+    started = time.perf_counter()
+    results = [[hit["id"] for hit in index.search(q, K)] for q in queries]
+    return (time.perf_counter() - started) / len(queries), results
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else DIMENSIONS
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        index = MemoryIndex(Path(directory), ivf_min_vectors=1)
+        index.open("bench")
+        centers = fill(index, rows, dim, rng)
+        index.open("bench")
+        queries = [(centers[i] + rng.normal(scale=0.3, size=dim)).tolist() for i in rng.integers(0, TOPICS, QUERIES)]
+
+        brute, exact = timed(index, queries)
+        started = time.perf_counter()
+        index.train()
+        trained = time.perf_counter() - started
+        ivf, approximate = timed(index, queries)
+        recall = np.mean([len(set(a) & set(e)) / K for a, e in zip(approximate, exact)])
+        index.close()
+
+    print(f"{rows} vectors x {dim} dimensions, {QUERIES} queries, top {K}")
+    print(f"brute force  {brute * 1000:8.2f} ms/query")
+    print(f"ivf          {ivf * 1000:8.2f} ms/query ({brute / ivf:5.1f}x, recall {recall:.2f}, trained in {trained:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
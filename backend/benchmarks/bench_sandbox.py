@@ -0,0 +1,102 @@
+"""Cost of Sandbox.is_command_safe as the command policy grows
+
+Checks a corpus of generated commands against the built-in rules plus N
+synthetic policy rules, comparing the old per-rule re.search loop with
+the compiled single-pass matcher. Run from the backend directory:
+    
+    python benchmarks/bench_sandbox.py
+"""
+import random
+import re
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from security.sandbox import CommandMatcher, CommandRule, Sandbox
+
+
+COMMANDS = 5000
+RULE_COUNTS = (11, 100, 500, 1000)
+ROUNDS = 3
+
+PROGRAMS = ["ls", "cat", "grep", "find", "echo", "python", "git", "docker", "npm", "tar", "curl", "ssh"]
+ARGS = ["-la", "--help", "-r", "status", "file.txt", "~/Documents/report.md", "'hello world'", "-v", "|", "wc -l"]
+
+
+def corpus(count):
+    """Mostly harmless commands with a few dangerous ones mixed in"""
+    rng = random.Random(42)
+    commands = []
+    for _ in range(count):
+        words = [rng.choice(PROGRAMS)] + rng.sample(ARGS, rng.randint(1, 5))
+        if rng.random() < 0.05:
+            words += ["&&", "sudo", "rm", "-rf", "/"]
+        commands.append(" ".join(words))
+    return commands
+
+
+def synthetic_rules(count):
+    """Policy-style rules: random tool names with dangerous flags"""
+    rng = random.Random(7)
+    rules = [CommandRule(rule_id, pattern) for rule_id, pattern in Sandbox.BLOCKED_COMMANDS]
+    for index in range(count - len(rules)):
+        name = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 8)))
+        flag = rng.choice(["--force", "--purge", "-rf", "--no-verify"])
+        rules.append(CommandRule(f"policy-{index}", rf"{name}\s+.*{flag}"))
+    return rules
+
+
+def legacy(rules, commands):
+    """The previous implementation: one search per rule
+    
+    Patterns are precompiled here; the old code relied on re's cache,
+    which holds 512 patterns and thrashes beyond that.
+    """
+    patterns = [re.compile(rule.pattern) for rule in rules]
+    blocked = 0
+    for command in commands:
+        command_lower = command.lower()
+        for pattern in patterns:
+            if pattern.search(command_lower):
+                blocked += 1
+                break
+    return blocked
+
+
+def compiled(rules, commands):
+    matcher = CommandMatcher(rules)
+    blocked = 0
+    for command in commands:
+        if matcher.search(command.lower()) is not None:
+            blocked += 1
+    return blocked
+
+
+def timed(fn, rules, commands):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.process_time()
+        result = fn(rules, commands)
+        best = min(best, time.process_time() - started)
+    return best, result
+
+
+def main():
+    commands = corpus(COMMANDS)
+    print(f"{COMMANDS} commands, best of {ROUNDS} rounds")
+    for count in RULE_COUNTS:
+        rules = synthetic_rules(count)
+        old_seconds, old_blocked = timed(legacy, rules, commands)
+        new_seconds, new_blocked = timed(compiled, rules, commands)
+        assert old_blocked == new_blocked, "matchers disagree"
+        print(
+            f"{count:>5} rules: per-rule loop {old_seconds / COMMANDS * 1e6:8.1f} us/cmd, "
+            f"compiled {new_seconds / COMMANDS * 1e6:6.1f} us/cmd ({old_seconds / new_seconds:5.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Sandbox.sanitize_input on large pasted documents
+
+Compares the previous per-character generator with the regex version on
+multi-MB inputs and checks both give identical output. Run from the
+backend directory:
+    
+    python benchmarks/bench_sanitize.py
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from security.sandbox import Sandbox
+
+
+SIZES_MB = (1, 4, 16)
+ROUNDS = 3
+
+
+def legacy(user_input):
+    """The previous implementation"""
+    sanitized = user_input.replace("\x00", "")
+    return "".join(
+        char for char in sanitized
+        if char.isprintable() or char in ["\n", "\t"]
+    )
+
+
+def document(size, separators, junk=()):
+    """Prose with accents, CJK and emoji, optionally with stray control characters"""
+    rng = random.Random(1)
+    words = ["lorem", "ipsum", "dolor", "café", "naïve", "日本語", "\U0001F600"] + list(junk)
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(words)
+        separator = rng.choice(separators)
+        parts.append(word + separator)
+        length += len(word) + len(separator)
+    return "".join(parts)
+
+
+DOCUMENTS = {
+    "clean (LF)": {"separators": [" ", " ", " ", "\n", "\t"]},
+    "Windows (CRLF)": {"separators": [" ", " ", " ", "\r\n", "\t"]},
+    "control chars": {"separators": [" ", " ", " ", "\r\n", "\t"], "junk": ["x\x00y", "a\x1bb", "\u200b"]},
+    "astral format": {"separators": [" ", " ", " ", "\n", "\t"], "junk": ["\U000e0001"]},
+}
+
+
+def timed(fn, text):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    sandbox = Sandbox()
+    for size_mb in SIZES_MB:
+        for name, shape in DOCUMENTS.items():
+            text = document(size_mb * 1024 * 1024, **shape)
+            old_seconds, old_result = timed(legacy, text)
+            new_seconds, new_result = timed(sandbox.sanitize_input, text)
+            assert old_result == new_result, "outputs differ"
+            print(
+                f"{size_mb:>3} MB {name:<15}: generator {old_seconds * 1000:8.1f} ms, "
+                f"new {new_seconds * 1000:6.1f} ms ({old_seconds / new_seconds:5.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
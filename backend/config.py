@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 
 
@@ -8,19 +9,116 @@ class Settings(BaseSettings):
     
     # Ollama
     OLLAMA_BASE_URL: str = "http://localhost:11434"
+    # Several hosts to balance across; when empty only OLLAMA_BASE_URL is used
+    OLLAMA_UPSTREAMS: List[str] = []
+    OLLAMA_UPSTREAM_RETRY_SECONDS: float = 10.0
     DEFAULT_MODEL: str = "llama2"
     MAX_CONTEXT_TOKENS: int = 4096
+    CONTEXT_RESPONSE_TOKENS: int = 512
+    CONTEXT_HISTORY_MESSAGES: int = 200
+    SYSTEM_PROMPT: str = ""
+    
+    # Admission control in front of Ollama
+    SCHEDULER_MAX_CONCURRENT_PER_MODEL: int = 4
+    SCHEDULER_MODEL_CONCURRENCY: Dict[str, int] = {}
+    SCHEDULER_MAX_QUEUE: int = 64
+    
+    # Model residency
+    OLLAMA_KEEP_ALIVE: str = "30m"
+    OLLAMA_MODEL_KEEP_ALIVE: Dict[str, str] = {}
+    OLLAMA_WARMUP_ON_STARTUP: bool = True
+    OLLAMA_PS_REFRESH_SECONDS: int = 60
+    OLLAMA_MODELS_TTL_SECONDS: float = 30.0
+    OLLAMA_MODELS_STALE_SECONDS: float = 300.0
+    
+    # Ollama HTTP client
+    OLLAMA_MAX_CONNECTIONS: int = 20
+    OLLAMA_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    OLLAMA_KEEPALIVE_EXPIRY: float = 30.0
+    OLLAMA_CONNECT_TIMEOUT: float = 5.0
+    OLLAMA_PROBE_TIMEOUT: float = 10.0
+    OLLAMA_CHAT_TIMEOUT: float = 120.0
+    OLLAMA_HTTP2: bool = False
+    
+    # Stream output coalescing (first chunk is always sent immediately)
+    STREAM_COALESCE_ENABLED: bool = True
+    STREAM_COALESCE_WINDOW_MS: float = 16.0
+    STREAM_COALESCE_MAX_BYTES: int = 1024
+    
+    # Response cache (opt-in; cached answers are replayed as a stream)
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_TTL_SECONDS: float = 86400.0
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000
+    RESPONSE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    RESPONSE_CACHE_SEMANTIC: bool = False
+    RESPONSE_CACHE_SIMILARITY: float = 0.95
+    RESPONSE_CACHE_EMBEDDING_MODEL: str = "nomic-embed-text"
+    
+    # Long-term memory: saved messages are embedded and similar ones from other conversations added to chats
+    MEMORY_ENABLED: bool = False
+    MEMORY_EMBEDDING_MODEL: str = "nomic-embed-text"
+    MEMORY_TOP_K: int = 3
+    MEMORY_MIN_SCORE: float = 0.5
+    # Context tokens the recalled excerpts may use
+    MEMORY_MAX_TOKENS: int = 512
+    MEMORY_QUEUE_SIZE: int = 1000
+    MEMORY_MIN_CHARS: int = 20
+    # Search an inverted file (k-means lists) instead of every vector from this many messages; needs numpy
+    MEMORY_IVF_MIN_VECTORS: int = 50000
+    MEMORY_IVF_PROBES: int = 8
+    
+    # Message search: MySQL FULLTEXT when connected, else a local SQLite FTS5 index in DATA_DIR
+    SEARCH_LOCAL_INDEX: bool = True
+    SEARCH_MAX_PAGE_SIZE: int = 50
+    SEARCH_SNIPPET_CHARS: int = 160
+    
+    # JSON codec for WebSocket frames and Ollama NDJSON: auto, orjson, msgspec or stdlib
+    JSON_CODEC: str = "auto"
     
     # Server
     BACKEND_HOST: str = "127.0.0.1"
     BACKEND_PORT: int = 8765
     WS_SECRET_TOKEN: str = ""
+    WS_MAX_CONCURRENT_REQUESTS: int = 4
+    WS_MAX_PENDING_REQUESTS: int = 32
+    
+    # permessage-deflate for /ws; messages under the minimum size are sent uncompressed
+    WS_COMPRESSION_ENABLED: bool = True
+    WS_COMPRESSION_MIN_SIZE: int = 1024
+    WS_COMPRESSION_LEVEL: int = 6
+    WS_COMPRESSION_WINDOW_BITS: int = 15
+    WS_COMPRESSION_MEM_LEVEL: int = 8
     
     # Security
     ENABLE_ENCRYPTION: bool = True
     ENCRYPTION_PASSWORD: str = ""
     AUDIT_LOG_ENABLED: bool = True
+    # Audit records are written by a background thread from a bounded queue
+    AUDIT_QUEUE_SIZE: int = 10000
+    AUDIT_BACKPRESSURE: str = "block"  # block, drop or sample
+    AUDIT_SAMPLE_RATE: int = 10
+    # How long "block" waits for queue room before dropping a record
+    AUDIT_BLOCK_TIMEOUT_MS: int = 50
+    AUDIT_BATCH_SIZE: int = 256
+    AUDIT_FSYNC_INTERVAL_MS: int = 1000
+    # Audit files roll daily or at this size, then are gzipped and indexed
+    AUDIT_MAX_BYTES: int = 20 * 1024 * 1024
+    AUDIT_COMPRESS: bool = True
+    AUDIT_RETENTION_DAYS: int = 30
     REQUIRE_ACTION_CONFIRMATION: bool = True
+    # Shell and notification actions run as subprocesses under these limits
+    ACTION_TIMEOUT_SECONDS: float = 30.0
+    ACTION_MAX_CONCURRENT: int = 4
+    # Output kept for the final action result; streamed output is not capped
+    ACTION_MAX_OUTPUT_BYTES: int = 1024 * 1024
+    # File actions: largest read/write per request, I/O chunk size, and the size from which reads use mmap
+    ACTION_FILE_MAX_BYTES: int = 64 * 1024 * 1024
+    ACTION_FILE_CHUNK_SIZE: int = 64 * 1024
+    ACTION_FILE_MMAP_THRESHOLD: int = 4 * 1024 * 1024
+    # Command policy files in DATA_DIR/policies are checked for changes this often
+    SANDBOX_POLICY_RELOAD_SECONDS: float = 2.0
+    # Recent path-safety verdicts kept by the sandbox
+    SANDBOX_PATH_CACHE_SIZE: int = 1024
     
     # STT/TTS
     STT_ENGINE: str = "web"
@@ -2,18 +2,23 @@ import asyncio
 import os
 import sys
 from pathlib import Path
+from typing import List, Optional
 
 # Add backend to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import uvicorn
 from dotenv import load_dotenv
 
+from api import protocols
+from api.ws_compression import CompressedWebSocketProtocol
 from api.websocket_handler import WebSocketHandler
 from services.ollama_service import OllamaService
 from services.database_service import DatabaseService
+from services.metrics import registry as metrics_registry
 from security.audit_logger import AuditLogger
 from config import settings
 
@@ -37,19 +42,25 @@ ollama_service = OllamaService()
 audit_logger = AuditLogger()
 db_service = DatabaseService()
 ws_handler = WebSocketHandler(ollama_service, audit_logger, db_service)
+background_tasks = set()
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
     print(f"Zeno Backend starting on {settings.BACKEND_HOST}:{settings.BACKEND_PORT}")
-    print(f"Ollama URL: {settings.OLLAMA_BASE_URL}")
+    print(f"Ollama URL(s): {', '.join(upstream.url for upstream in ollama_service.upstreams)}")
     print("Server started")  # Signal to Electron that we're ready
     
+    # Open the pooled Ollama HTTP client
+    await ollama_service.start()
+    await ws_handler.response_cache.start()
+    await ws_handler.memory.start()
+    
     # Initialize database
     try:
-        if db_service.connect():
-            db_service.initialize_tables()
+        if await db_service.connect():
+            await db_service.initialize_tables()
             print("[Database] Ready")
         else:
             print("[Database] Warning: Could not connect to MySQL")
@@ -57,12 +68,20 @@ async def startup_event():
     except Exception as e:
         print(f"[Database] Warning: {e}")
     
+    # Picks MySQL full-text search or the local index, so it runs after the database connects
+    await ws_handler.search.start()
+    
     # Test Ollama connection (non-blocking)
     try:
         is_connected = await ollama_service.is_connected()
         if is_connected:
             models = await ollama_service.list_models()
             print(f"Connected to Ollama ({len(models)} models available)")
+            if settings.OLLAMA_WARMUP_ON_STARTUP:
+                # Load the default model in the background so startup isn't delayed
+                task = asyncio.create_task(ollama_service.warm_up(settings.DEFAULT_MODEL))
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
         else:
             print("Warning: Could not connect to Ollama")
             print("   Make sure Ollama is running: ollama serve")
@@ -74,8 +93,14 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     print("Shutting down Zeno Backend")
+    await ws_handler.response_cache.close()
+    await ws_handler.memory.close()
+    await ws_handler.search.close()
+    await ollama_service.close()
     if db_service:
-        db_service.close()
+        await db_service.close()
+    # Write out queued audit records
+    await asyncio.to_thread(audit_logger.close)
 
 
 @app.get("/health")
@@ -84,9 +109,43 @@ async def health_check():
     return {
         "status": "healthy",
         "ollama_connected": await ollama_service.is_connected(),
+        "database_connected": await db_service.ping(),
+        "loaded_models": list(ollama_service.loaded_models),
+        "ollama_upstreams": ollama_service.upstreams.stats(),
+        "scheduler": ws_handler.scheduler.stats(),
+        "memory": ws_handler.memory.stats(),
+        "search": ws_handler.search.stats(),
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics endpoint"""
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+@app.get("/audit")
+async def audit(
+    since: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    before: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    action: Optional[List[str]] = Query(None, description="Only these action types"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    token: str = Query("", description="Authentication token"),
+):
+    """Query the audit log, newest first"""
+    if settings.WS_SECRET_TOKEN and token != settings.WS_SECRET_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid token")
+    # Reads gzipped segments from disk, so keep it off the event loop
+    try:
+        return await asyncio.to_thread(audit_logger.query, since, before, action, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
@@ -100,11 +159,13 @@ async def websocket_endpoint(
     #     await websocket.close(code=1008, reason="Invalid token")
     #     return
     
-    await websocket.accept()
-    print(f"WebSocket client connected")
+    # JSON by default; MessagePack for clients that offer it (needs the msgpack package)
+    protocol, subprotocol = protocols.negotiate(websocket.scope.get("subprotocols", []))
+    await websocket.accept(subprotocol=subprotocol)
+    print(f"WebSocket client connected ({subprotocol or 'json'})")
     
     try:
-        await ws_handler.handle_connection(websocket)
+        await ws_handler.handle_connection(websocket, protocol)
     except WebSocketDisconnect:
         print("WebSocket client disconnected")
     except Exception as e:
@@ -123,6 +184,8 @@ def main():
         port=port,
         log_level="info",
         access_log=False,
+        ws=CompressedWebSocketProtocol,
+        ws_per_message_deflate=settings.WS_COMPRESSION_ENABLED,
     )
 
 
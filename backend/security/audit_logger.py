@@ -1,57 +1,241 @@
+import atexit
 import json
 import logging
+import queue
+import threading
+import time
 from datetime import datetime
-from pathlib import Path
-from typing import Any, Dict
+from logging.handlers import QueueHandler
+from typing import Any, Dict, List, Optional
 
 from config import settings
+from security.audit_store import AuditStore
+from services.metrics import registry
+
+
+AUDIT_WRITTEN = registry.counter(
+    "zeno_audit_records_written_total", "Audit records written to disk")
+AUDIT_DROPPED = registry.counter(
+    "zeno_audit_records_dropped_total", "Audit records discarded under backpressure or on format errors", ["reason"])
+AUDIT_QUEUE_DEPTH = registry.gauge(
+    "zeno_audit_queue_depth", "Audit records waiting for the writer thread")
+
+BACKPRESSURE_POLICIES = ("block", "drop", "sample")
+
+# Queued after the last record to stop the writer
+_STOP = None
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that applies a backpressure policy when the queue is full
+    
+    block: wait up to block_timeout seconds for room, then discard and
+    count (records are logged from the event loop, which must not stall on
+    a slow disk). drop: discard and count. sample: once the queue is past
+    its high-water mark keep one record in AUDIT_SAMPLE_RATE, and discard
+    when full.
+    """
+    
+    HIGH_WATER = 0.8
+    
+    def __init__(
+        self,
+        records: "queue.Queue",
+        policy: str = "block",
+        sample_rate: int = 10,
+        block_timeout: float = 0.05,
+    ):
+        super().__init__(records)
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown audit backpressure policy: {policy}")
+        self.policy = policy
+        self.sample_rate = max(1, sample_rate)
+        self.block_timeout = block_timeout
+        self._seen = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the writer thread
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        if self.policy == "block":
+            try:
+                self.queue.put(record, timeout=self.block_timeout)
+            except queue.Full:
+                AUDIT_DROPPED.inc(reason="timeout")
+            return
+        
+        if self.policy == "sample" and self.queue.qsize() >= self.queue.maxsize * self.HIGH_WATER:
+            self._seen += 1
+            if self._seen % self.sample_rate:
+                AUDIT_DROPPED.inc(reason="sampled")
+                return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            AUDIT_DROPPED.inc(reason="full")
+
+
+class AuditWriter(threading.Thread):
+    """Writes queued audit records in order, batching writes and fsyncs"""
+    
+    def __init__(
+        self,
+        records: "queue.Queue",
+        store: AuditStore,
+        batch_size: int,
+        fsync_interval: float,
+    ):
+        super().__init__(name="audit-writer", daemon=True)
+        self.records = records
+        self.store = store
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        self._synced_at = time.monotonic()
+    
+    def run(self):
+        while True:
+            # Wait for the first record, but wake up to honour the fsync interval
+            try:
+                first = self.records.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                self._sync()
+                continue
+            
+            batch: List[Optional[logging.LogRecord]] = [first]
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            
+            stop = batch[-1] is _STOP
+            records = batch[:-1] if stop else batch
+            try:
+                self._write(records)
+            except Exception as e:
+                print(f"Warning: Failed to write audit log: {e}")
+            finally:
+                for _ in batch:
+                    self.records.task_done()
+            
+            AUDIT_QUEUE_DEPTH.set(self.records.qsize())
+            if stop:
+                self.store.close()
+                return
+            if time.monotonic() - self._synced_at >= self.fsync_interval:
+                self._sync()
+    
+    def _write(self, records: List[logging.LogRecord]):
+        if not records:
+            return
+        rows = []
+        for record in records:
+            # One bad record must not cost the rest of the batch
+            try:
+                timestamp = getattr(record, "audit_timestamp", None) or datetime.fromtimestamp(record.created).isoformat()
+                rows.append((timestamp, getattr(record, "audit_action", "log"), self.formatter.format(record) + "\n"))
+            except Exception as e:
+                print(f"Warning: Failed to format audit record: {e}")
+                AUDIT_DROPPED.inc(reason="error")
+        if not rows:
+            return
+        self.store.append(rows)
+        AUDIT_WRITTEN.inc(len(rows))
+    
+    def _sync(self):
+        """fsync at most once per interval rather than per record"""
+        self.store.sync()
+        self._synced_at = time.monotonic()
 
 
 class AuditLogger:
-    """Audit logger for tracking all actions and requests"""
+    """Audit logger for tracking all actions and requests
+    
+    log_action serializes the entry and enqueues it; a writer thread
+    writes it, so the event loop does not wait on disk. Records are written
+    in the order they were logged and the queue is drained by close().
+    """
     
     def __init__(self):
         self.enabled = settings.AUDIT_LOG_ENABLED
         self.log_dir = settings.LOG_DIR
+        self.writer: Optional[AuditWriter] = None
+        self.handler: Optional[BoundedQueueHandler] = None
+        self.store = AuditStore(
+            self.log_dir,
+            max_bytes=settings.AUDIT_MAX_BYTES,
+            retention_days=settings.AUDIT_RETENTION_DAYS,
+            compress=settings.AUDIT_COMPRESS,
+        )
         
         if self.enabled:
-            # Setup file logger
-            log_file = self.log_dir / f"audit_{datetime.now().strftime('%Y%m%d')}.log"
+            # Roll files from earlier days, load the index and drop expired segments
+            self.store.open()
+            
+            records: "queue.Queue" = queue.Queue(maxsize=settings.AUDIT_QUEUE_SIZE)
+            self.writer = AuditWriter(
+                records,
+                self.store,
+                batch_size=settings.AUDIT_BATCH_SIZE,
+                fsync_interval=settings.AUDIT_FSYNC_INTERVAL_MS / 1000,
+            )
+            self.writer.start()
             
             self.logger = logging.getLogger("audit")
             self.logger.setLevel(logging.INFO)
             
-            # File handler
-            handler = logging.FileHandler(log_file)
-            handler.setFormatter(logging.Formatter(
-                '%(asctime)s - %(levelname)s - %(message)s'
-            ))
-            self.logger.addHandler(handler)
-            
-            # Rotate old logs (keep last 30 days)
-            self._rotate_logs()
+            # Queue handler in front of the writer thread
+            self.handler = BoundedQueueHandler(
+                records,
+                settings.AUDIT_BACKPRESSURE,
+                settings.AUDIT_SAMPLE_RATE,
+                settings.AUDIT_BLOCK_TIMEOUT_MS / 1000,
+            )
+            self.logger.addHandler(self.handler)
+            atexit.register(self.close)
     
     def log_action(self, action: str, data: Dict[str, Any]):
         """Log an action with associated data"""
-        if not self.enabled:
+        if not self.enabled or self.handler is None:
             return
         
+        timestamp = datetime.now().isoformat()
         log_entry = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": timestamp,
             "action": action,
             "data": data,
         }
         
-        self.logger.info(json.dumps(log_entry))
+        # Serialized here so the writer never reads caller-owned objects
+        self.logger.info(
+            "%s",
+            json.dumps(log_entry, default=str),
+            extra={"audit_timestamp": timestamp, "audit_action": action},
+        )
     
-    def _rotate_logs(self):
-        """Remove logs older than 30 days"""
-        try:
-            cutoff = datetime.now().timestamp() - (30 * 24 * 60 * 60)
-            
-            for log_file in self.log_dir.glob("audit_*.log"):
-                if log_file.stat().st_mtime < cutoff:
-                    log_file.unlink()
-        
-        except Exception as e:
-            print(f"Warning: Failed to rotate logs: {e}")
+    def flush(self):
+        """Block until every record logged so far has been written"""
+        if self.writer is not None and self.writer.is_alive():
+            self.writer.records.join()
+    
+    def close(self):
+        """Drain the queue and stop the writer thread"""
+        if self.handler is not None:
+            self.logger.removeHandler(self.handler)
+            self.handler = None
+        if self.writer is not None and self.writer.is_alive():
+            self.writer.records.put(_STOP)
+            self.writer.join()
+    
+    def query(
+        self,
+        since: Optional[str] = None,
+        before: Optional[str] = None,
+        actions: Optional[List[str]] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Search audit history newest first (see AuditStore.query)"""
+        return self.store.query(since, before, actions, limit, cursor)
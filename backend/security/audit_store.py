@@ -0,0 +1,322 @@
+"""Audit log files: rotation, compression, a sidecar index and queries
+
+The active file is audit_YYYYMMDD.log. It is rolled when the day changes
+or it reaches AUDIT_MAX_BYTES, becoming audit_YYYYMMDD_NNN.log.gz. Each
+rolled segment gets one line in audit_index.jsonl with its first and last
+timestamp and a count per action, so queries only open the segments that
+can match.
+"""
+import base64
+import gzip
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+INDEX_FILE = "audit_index.jsonl"
+ACTIVE_PATTERN = re.compile(r"^audit_(\d{8})\.log$")
+SEGMENT_PATTERN = re.compile(r"^audit_(\d{8})_(\d{3,})\.log(\.gz)?$")
+MAX_QUERY_LIMIT = 1000
+
+
+def encode_cursor(timestamp: str, skip: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"before": timestamp, "skip": skip}).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """(timestamp, entries at that timestamp already returned) from a next_cursor"""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp, skip = value["before"], value["skip"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(timestamp, str) or not isinstance(skip, int) or skip < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return timestamp, skip
+
+
+def parse_line(line: str) -> Optional[Dict[str, Any]]:
+    """Extract the JSON entry from a formatted audit line"""
+    start = line.find("{")
+    if start < 0:
+        return None
+    try:
+        return json.loads(line[start:])
+    except ValueError:
+        return None
+
+
+class SegmentStats:
+    """Time range and action counts of one log segment"""
+    
+    def __init__(self, start: Optional[str] = None, end: Optional[str] = None, actions: Optional[Dict[str, int]] = None):
+        self.start = start
+        self.end = end
+        self.actions: Dict[str, int] = dict(actions or {})
+    
+    @property
+    def count(self) -> int:
+        return sum(self.actions.values())
+    
+    def add(self, timestamp: str, action: str):
+        if self.start is None or timestamp < self.start:
+            self.start = timestamp
+        if self.end is None or timestamp > self.end:
+            self.end = timestamp
+        self.actions[action] = self.actions.get(action, 0) + 1
+    
+    def matches(
+        self,
+        since: Optional[str],
+        before: Optional[str],
+        actions: Optional[Iterable[str]],
+        inclusive: bool = False,
+    ) -> bool:
+        if self.start is None:
+            return False
+        if since and self.end < since:
+            return False
+        if before and (self.start > before if inclusive else self.start >= before):
+            return False
+        if actions and not any(action in self.actions for action in actions):
+            return False
+        return True
+
+
+class AuditStore:
+    """Owns the audit files; writes come from the writer thread, queries from any thread"""
+    
+    def __init__(self, log_dir: Path, max_bytes: int, retention_days: int, compress: bool = True):
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.compress = compress
+        self.index_path = log_dir / INDEX_FILE
+        # Guards files and index against concurrent queries
+        self.lock = threading.RLock()
+        self.segments: Dict[str, SegmentStats] = {}
+        self.day: Optional[str] = None
+        self.active: Optional[SegmentStats] = None
+        self._file = None
+        self._dirty = False
+    
+    @property
+    def active_path(self) -> Path:
+        return self.log_dir / f"audit_{self.day}.log"
+    
+    def open(self):
+        """Load the index, roll files left from earlier days and apply retention"""
+        with self.lock:
+            self._load_index()
+            today = datetime.now().strftime("%Y%m%d")
+            for path in sorted(self.log_dir.glob("audit_*.log")):
+                match = ACTIVE_PATTERN.match(path.name)
+                if not match:
+                    continue
+                if match.group(1) != today:
+                    self.day = match.group(1)
+                    self.active = self._scan(path)
+                    self._roll()
+            self._start_day(today)
+            self._apply_retention()
+    
+    def append(self, records: List[Tuple[str, str, str]]):
+        """Write (timestamp, action, line) records, rolling by day and size"""
+        with self.lock:
+            pending: List[str] = []
+            for timestamp, action, line in records:
+                day = timestamp[:10].replace("-", "")
+                if day != self.day:
+                    self._write(pending)
+                    pending = []
+                    self._roll()
+                    self._apply_retention()
+                    self._start_day(day)
+                pending.append(line)
+                self.active.add(timestamp, action)
+            self._write(pending)
+            if self._file is not None and self._file.tell() >= self.max_bytes:
+                self._roll()
+                self._start_day(self.day)
+    
+    def sync(self, force: bool = False):
+        with self.lock:
+            if self._file is not None and (self._dirty or force):
+                os.fsync(self._file.fileno())
+                self._dirty = False
+    
+    def close(self):
+        with self.lock:
+            self.sync(force=True)
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+    
+    def query(
+        self,
+        since: Optional[str] = None,
+        before: Optional[str] = None,
+        actions: Optional[List[str]] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Newest-first entries with since <= timestamp < before
+        
+        Pass the returned next_cursor as ``cursor`` to fetch the next page.
+        The cursor is the last timestamp returned plus how many entries at
+        that timestamp were returned, since several can share one.
+        """
+        limit = max(1, min(limit, MAX_QUERY_LIMIT))
+        skip = 0
+        if cursor:
+            before, skip = decode_cursor(cursor)
+        inclusive = bool(cursor)
+        
+        def in_range(timestamp: str) -> bool:
+            if since and timestamp < since:
+                return False
+            return not before or (timestamp <= before if inclusive else timestamp < before)
+        
+        # Only the snapshot is taken under the lock, so reading and unzipping
+        # segments doesn't hold up the writer thread. A segment removed by
+        # retention in the meantime reads as empty.
+        with self.lock:
+            if self._file is not None:
+                self._file.flush()
+            candidates = [
+                (stats.end, self.log_dir / name)
+                for name, stats in self.segments.items()
+                if stats.matches(since, before, actions, inclusive)
+            ]
+            if self.active is not None and self.active.matches(since, before, actions, inclusive):
+                candidates.append((self.active.end, self.active_path))
+        candidates.sort(reverse=True)
+        
+        # Segments don't overlap in time, so newest-first reading can stop early
+        entries: List[Dict[str, Any]] = []
+        for _, path in candidates:
+            matched = [
+                entry for entry in self._read(path)
+                if in_range(entry.get("timestamp", ""))
+                and (not actions or entry.get("action") in actions)
+            ]
+            entries.extend(reversed(matched))
+            if len(entries) > limit + skip:
+                break
+        
+        # Stable, so entries sharing a timestamp keep the same order on every page
+        entries.sort(key=lambda entry: entry.get("timestamp", ""), reverse=True)
+        # Entries at the cursor's timestamp sort first; drop the ones already returned
+        entries = entries[sum(1 for entry in entries[:skip] if entry.get("timestamp") == before):]
+        page = entries[:limit]
+        next_cursor = None
+        if len(entries) > limit:
+            last = page[-1].get("timestamp", "")
+            tied = sum(1 for entry in page if entry.get("timestamp") == last)
+            next_cursor = encode_cursor(last, tied + (skip if last == before else 0))
+        return {"entries": page, "next_cursor": next_cursor}
+    
+    def _read(self, path: Path) -> Iterator[Dict[str, Any]]:
+        opener = gzip.open if path.suffix == ".gz" else open
+        try:
+            with opener(path, "rt", encoding="utf-8") as handle:
+                for line in handle:
+                    entry = parse_line(line)
+                    if entry is not None:
+                        yield entry
+        except FileNotFoundError:
+            return
+    
+    def _start_day(self, day: str):
+        self.day = day
+        path = self.active_path
+        # Restarting on the same day: pick up the existing file's stats
+        self.active = self._scan(path) if path.exists() else SegmentStats()
+        self._file = open(path, "a", encoding="utf-8")
+    
+    def _scan(self, path: Path) -> SegmentStats:
+        stats = SegmentStats()
+        for entry in self._read(path):
+            stats.add(entry.get("timestamp", ""), entry.get("action", ""))
+        return stats
+    
+    def _write(self, lines: List[str]):
+        if not lines:
+            return
+        self._file.write("".join(lines))
+        self._file.flush()
+        self._dirty = True
+    
+    def _roll(self):
+        """Close the active file and turn it into a numbered (compressed) segment"""
+        if self._file is not None:
+            self.sync(force=True)
+            self._file.close()
+            self._file = None
+        source = self.active_path
+        if not source.exists():
+            return
+        if not self.active.count:
+            if source.stat().st_size == 0:
+                source.unlink()
+            return
+        
+        sequence = 1 + max(
+            (int(m.group(2)) for m in (SEGMENT_PATTERN.match(p.name) for p in self.log_dir.glob(f"audit_{self.day}_*"))
+             if m),
+            default=0,
+        )
+        target = self.log_dir / f"audit_{self.day}_{sequence:03d}.log"
+        if self.compress:
+            target = target.with_name(target.name + ".gz")
+            with open(source, "rb") as src, gzip.open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            source.unlink()
+        else:
+            source.rename(target)
+        
+        self.segments[target.name] = self.active
+        with open(self.index_path, "a", encoding="utf-8") as index:
+            index.write(json.dumps(self._index_entry(target.name, self.active)) + "\n")
+        self.active = SegmentStats()
+    
+    @staticmethod
+    def _index_entry(name: str, stats: SegmentStats) -> Dict[str, Any]:
+        return {"file": name, "start": stats.start, "end": stats.end, "count": stats.count, "actions": stats.actions}
+    
+    def _load_index(self):
+        self.segments = {}
+        if self.index_path.exists():
+            for line in self.index_path.read_text(encoding="utf-8").splitlines():
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                if (self.log_dir / item["file"]).exists():
+                    self.segments[item["file"]] = SegmentStats(item.get("start"), item.get("end"), item.get("actions"))
+        
+        # Segments missing from the index (e.g. a crash between roll and index write)
+        for path in self.log_dir.glob("audit_*_*.log*"):
+            if SEGMENT_PATTERN.match(path.name) and path.name not in self.segments:
+                self.segments[path.name] = self._scan(path)
+    
+    def _apply_retention(self):
+        """Delete segments older than the retention window and rewrite the index"""
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+        expired = [name for name, stats in self.segments.items() if stats.end is None or stats.end < cutoff]
+        for name in expired:
+            try:
+                (self.log_dir / name).unlink()
+            except FileNotFoundError:
+                pass
+            del self.segments[name]
+        
+        tmp = self.index_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as index:
+            for name, stats in sorted(self.segments.items(), key=lambda item: item[1].start or ""):
+                index.write(json.dumps(self._index_entry(name, stats)) + "\n")
+        tmp.replace(self.index_path)
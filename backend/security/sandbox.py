@@ -1,24 +1,186 @@
+r"""Command and path checks for actions
+
+Blocked command patterns (built in, plus any *.json policy files in
+DATA_DIR/policies) are compiled into one alternation, so a command is
+checked in a single regex pass however many rules there are. Policy files
+are re-read when they change, checked at most every
+SANDBOX_POLICY_RELOAD_SECONDS:
+    
+    {"blocked_commands": [{"id": "no-shutdown", "pattern": "shutdown\\s+"}]}
+
+Patterns are matched against the lowercased command and may not use
+numbered backreferences, since they share one compiled expression.
+"""
+import json
+import os
 import re
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import settings
+
+
+def _unprintable_ranges(first: int, last: int) -> str:
+    """Regex class body of the code points str.isprintable() rejects, bar newline and tab"""
+    ranges = []
+    start = None
+    for code in range(first, last + 2):
+        removed = code <= last and not chr(code).isprintable() and chr(code) not in "\n\t"
+        if removed and start is None:
+            start = code
+        elif not removed and start is not None:
+            ranges.append(f"\\U{start:08x}-\\U{code - 1:08x}" if code - 1 > start else f"\\U{start:08x}")
+            start = None
+    return "".join(ranges)
+
+
+# Only the BMP goes in the big class: sre turns that into a bitmap, while a
+# class reaching past U+FFFF is checked range by range for every character
+_UNPRINTABLE_BMP = re.compile(f"[{_unprintable_ranges(0, 0xFFFF)}]+")
+_ASTRAL = re.compile("[\\U00010000-\\U0010ffff]+")
+# More distinct unprintable astral characters than this are filtered per run
+MAX_REPLACED_CHARS = 16
+
+
+def _printable_only(match: "re.Match") -> str:
+    text = match.group()
+    return text if text.isprintable() else "".join(char for char in text if char.isprintable())
+
+
+class CommandRule:
+    """A blocked-command pattern and where it came from"""
+    
+    __slots__ = ("id", "pattern", "source", "regex")
+    
+    def __init__(self, rule_id: str, pattern: str, source: str = "builtin"):
+        self.id = rule_id
+        self.pattern = pattern
+        self.source = source
+        self.regex = re.compile(pattern)
+    
+    def __repr__(self) -> str:
+        return f"CommandRule({self.id!r}, {self.pattern!r}, source={self.source!r})"
+
+
+def literal_prefix(pattern: str) -> str:
+    """The plain characters a pattern always starts with ("" if unsure)"""
+    if "|" in pattern:
+        return ""
+    end = 0
+    while end < len(pattern) and pattern[end].isascii() and (pattern[end].isalnum() or pattern[end] in "_-"):
+        end += 1
+    # The last character is optional or repeated
+    if end < len(pattern) and pattern[end] in "?*+{":
+        end -= 1
+    return pattern[:end]
+
+
+def _factor(entries: List[Tuple[str, str]], depth: int = 0) -> str:
+    """Alternation of (prefix, rest) entries with shared prefixes factored out"""
+    branches = []
+    groups: Dict[str, List[Tuple[str, str]]] = {}
+    for prefix, rest in entries:
+        if len(prefix) == depth:
+            branches.append(f"(?:{rest})")
+        else:
+            groups.setdefault(prefix[depth], []).append((prefix, rest))
+    for char, group in groups.items():
+        branches.append(re.escape(char) + _factor(group, depth + 1))
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+
+class CommandMatcher:
+    """All rules compiled into one alternation
+    
+    Literal prefixes are merged into a trie, so at each position the regex
+    engine tests one branch per distinct first character rather than one
+    per rule. The alternation has no capture groups of its own (sre saves
+    group state on every branch it tries), so the matched rule is recovered
+    afterwards by trying the rules at the match position, which only
+    happens for blocked commands.
+    """
+    
+    def __init__(self, rules: List[CommandRule]):
+        self.rules = rules
+        self.regex = None
+        if rules:
+            entries = []
+            for rule in rules:
+                prefix = literal_prefix(rule.pattern)
+                entries.append((prefix, rule.pattern[len(prefix):]))
+            self.regex = re.compile(_factor(entries))
+    
+    def search(self, text: str) -> Optional[CommandRule]:
+        """Return the first rule (in policy order) matching at the leftmost match position"""
+        if self.regex is None:
+            return None
+        match = self.regex.search(text)
+        if match is None:
+            return None
+        for rule in self.rules:
+            if rule.regex.match(text, match.start()):
+                return rule
+        return None
+
+
+class PathTrie:
+    """Directory roots keyed by path component; a path is inside if it walks onto a root"""
+    
+    def __init__(self, roots: Iterable[Path]):
+        self.root: Dict[str, Any] = {}
+        for path in roots:
+            node = self.root
+            for part in self._parts(path):
+                node = node.setdefault(part, {})
+            node[None] = True
+    
+    @staticmethod
+    def _parts(path: Path) -> Tuple[str, ...]:
+        # Windows paths compare case-insensitively, as PurePath.relative_to does
+        return tuple(os.path.normcase(part) for part in path.parts)
+    
+    def contains(self, path: Path) -> bool:
+        node = self.root
+        if None in node:
+            return True
+        for part in self._parts(path):
+            node = node.get(part)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+
+def load_policy_file(path: Path) -> List[CommandRule]:
+    """Parse one policy file; raises ValueError (or re.error) if it is invalid"""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    rules = []
+    for index, item in enumerate(data.get("blocked_commands", [])):
+        if isinstance(item, str):
+            item = {"pattern": item}
+        rules.append(CommandRule(item.get("id") or f"{path.stem}:{index}", item["pattern"], source=path.name))
+    return rules
 
 
 class Sandbox:
     """Security sandbox for validating commands and paths"""
     
-    # Dangerous command patterns
+    # Dangerous command patterns as (rule id, pattern)
     BLOCKED_COMMANDS = [
-        r"rm\s+-rf\s+/",  # Recursive delete root
-        r":\(\)\{.*\};:",  # Fork bomb
-        r"mkfs\.",  # Format filesystem
-        r"dd\s+if=.*of=/dev/",  # Disk operations
-        r">\s*/dev/sd",  # Write to disk
-        r"curl.*\|\s*bash",  # Pipe to shell
-        r"wget.*\|\s*sh",  # Pipe to shell
-        r"chmod\s+777",  # Dangerous permissions
-        r"chown\s+root",  # Change ownership to root
-        r"sudo\s+",  # Sudo commands
-        r"su\s+",  # Switch user
+        ("rm-rf-root", r"rm\s+-rf\s+/"),  # Recursive delete root
+        ("fork-bomb", r":\(\)\{.*\};:"),  # Fork bomb
+        ("mkfs", r"mkfs\."),  # Format filesystem
+        ("dd-device", r"dd\s+if=.*of=/dev/"),  # Disk operations
+        ("write-disk", r">\s*/dev/sd"),  # Write to disk
+        ("curl-pipe-shell", r"curl.*\|\s*bash"),  # Pipe to shell
+        ("wget-pipe-shell", r"wget.*\|\s*sh"),  # Pipe to shell
+        ("chmod-777", r"chmod\s+777"),  # Dangerous permissions
+        ("chown-root", r"chown\s+root"),  # Change ownership to root
+        ("sudo", r"sudo\s+"),  # Sudo commands
+        ("su", r"su\s+"),  # Switch user
     ]
     
     # Allowed safe directories
@@ -29,56 +191,185 @@ class Sandbox:
         Path.home() / ".jarvis",
     ]
     
-    def is_command_safe(self, command: str) -> bool:
-        """Check if a command is safe to execute"""
-        command_lower = command.lower()
+    MAX_PIPES = 2
+    
+    def __init__(self, policy_dir: Optional[Path] = None, reload_interval: Optional[float] = None):
+        self.policy_dir = policy_dir or settings.DATA_DIR / "policies"
+        self.reload_interval = settings.SANDBOX_POLICY_RELOAD_SECONDS if reload_interval is None else reload_interval
+        self.builtin_rules = [CommandRule(rule_id, pattern) for rule_id, pattern in self.BLOCKED_COMMANDS]
+        self.matcher = CommandMatcher(self.builtin_rules)
+        # Last good rules per policy file, and the mtimes they were read at
+        self._policy_rules: Dict[Path, List[CommandRule]] = {}
+        self._policy_mtimes: Dict[Path, int] = {}
+        self._checked_at = float("-inf")
+        self._safe_dirs: Optional[Tuple[Tuple[Path, ...], re.Pattern]] = None
+        self._safe_roots: Optional[Tuple[Tuple[Path, ...], PathTrie]] = None
+        # (absolute path, ancestor stats) -> verdict, most recently used last
+        self._path_verdicts: "OrderedDict[Tuple[str, Tuple], bool]" = OrderedDict()
+        self.path_cache_size = settings.SANDBOX_PATH_CACHE_SIZE
+    
+    @property
+    def rules(self) -> List[CommandRule]:
+        self.reload_policies()
+        return self.matcher.rules
+    
+    def reload_policies(self, force: bool = False):
+        """Recompile the matcher if a policy file was added, changed or removed"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        
+        try:
+            mtimes = {path: path.stat().st_mtime_ns for path in sorted(self.policy_dir.glob("*.json"))}
+        except OSError:
+            mtimes = {}
+        if mtimes == self._policy_mtimes and not force:
+            return
+        
+        policy_rules = {}
+        for path, mtime in mtimes.items():
+            if path in self._policy_rules and self._policy_mtimes.get(path) == mtime and not force:
+                policy_rules[path] = self._policy_rules[path]
+                continue
+            try:
+                policy_rules[path] = load_policy_file(path)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError, re.error) as e:
+                # Keep enforcing the last good version of a file that fails to parse
+                print(f"[Sandbox] Invalid policy file {path.name}: {e}")
+                if path in self._policy_rules:
+                    policy_rules[path] = self._policy_rules[path]
+        
+        rules = list(self.builtin_rules)
+        for path in sorted(policy_rules):
+            rules.extend(policy_rules[path])
+        try:
+            matcher = CommandMatcher(rules)
+        except re.error as e:
+            print(f"[Sandbox] Policy rules do not combine, keeping previous rules: {e}")
+            return
+        
+        self.matcher = matcher
+        self._policy_rules = policy_rules
+        self._policy_mtimes = mtimes
+        print(f"[Sandbox] Loaded {len(rules)} command rules ({len(rules) - len(self.builtin_rules)} from policy files)")
+    
+    def check_command(self, command: str) -> Optional[str]:
+        """Return the id of the rule that blocks command, or None if it is allowed"""
+        self.reload_policies()
         
         # Check against blocked patterns
-        for pattern in self.BLOCKED_COMMANDS:
-            if re.search(pattern, command_lower):
-                return False
+        rule = self.matcher.search(command.lower())
+        if rule is not None:
+            return rule.id
         
         # Block commands with multiple pipes (potential chaining)
-        if command.count("|") > 2:
-            return False
+        if command.count("|") > self.MAX_PIPES:
+            return "multiple-pipes"
         
         # Block commands with suspicious redirects
         if ">>" in command or "2>&1" in command:
             # Allow only if writing to safe locations
-            if not any(str(safe_dir) in command for safe_dir in self.SAFE_DIRECTORIES):
-                return False
+            if not self._safe_dir_pattern().search(command):
+                return "unsafe-redirect"
         
-        return True
+        return None
+    
+    def is_command_safe(self, command: str) -> bool:
+        """Check if a command is safe to execute"""
+        return self.check_command(command) is None
+    
+    def _safe_dir_pattern(self) -> re.Pattern:
+        """SAFE_DIRECTORIES as one literal alternation, rebuilt if the list changes"""
+        key = tuple(self.SAFE_DIRECTORIES)
+        if self._safe_dirs is None or self._safe_dirs[0] != key:
+            self._safe_dirs = (key, re.compile("|".join(re.escape(str(safe_dir)) for safe_dir in key)))
+        return self._safe_dirs[1]
     
     def is_path_safe(self, path: Path) -> bool:
         """Check if a file path is safe to access"""
-        try:
-            # Resolve to absolute path
-            abs_path = path.resolve()
-            
-            # Check if path is within safe directories
-            for safe_dir in self.SAFE_DIRECTORIES:
-                try:
-                    abs_path.relative_to(safe_dir.resolve())
-                    return True
-                except ValueError:
-                    continue
-            
-            # Not in any safe directory
-            return False
+        return self.are_paths_safe([path])[0]
+    
+    def are_paths_safe(self, paths: Iterable[Path]) -> List[bool]:
+        """Check several paths, stat-ing directories they share only once
+        
+        Verdicts are cached per absolute path together with the inode and
+        mtime of each ancestor directory. Swapping a symlink anywhere on the
+        way changes one of those (its directory gets a new entry), so a
+        stale verdict is never reused.
+        """
+        trie = self._safe_root_trie()
+        stats: Dict[str, Optional[Tuple[int, int]]] = {}
+        verdicts = []
+        for path in paths:
+            try:
+                verdicts.append(self._path_verdict(path, trie, stats))
+            except Exception:
+                verdicts.append(False)
+        return verdicts
+    
+    def _path_verdict(self, path: "os.PathLike[str]", trie: PathTrie, stats: Dict[str, Optional[Tuple[int, int]]]) -> bool:
+        # String operations: building Path objects for every ancestor costs more than the stats
+        absolute = os.path.join(os.getcwd(), os.fspath(path))
+        ancestors = []
+        current, parent = absolute, os.path.dirname(absolute)
+        while parent != current:
+            ancestors.append(self._stat(parent, stats))
+            current, parent = parent, os.path.dirname(parent)
+        key = (absolute, tuple(ancestors))
+        
+        verdict = self._path_verdicts.get(key)
+        if verdict is not None:
+            self._path_verdicts.move_to_end(key)
+            return verdict
         
-        except Exception:
-            return False
+        # Resolve to absolute path and check it is within a safe directory
+        verdict = trie.contains(Path(absolute).resolve())
+        self._path_verdicts[key] = verdict
+        if len(self._path_verdicts) > self.path_cache_size:
+            self._path_verdicts.popitem(last=False)
+        return verdict
+    
+    @staticmethod
+    def _stat(path: str, stats: Dict[str, Optional[Tuple[int, int]]]) -> Optional[Tuple[int, int]]:
+        if path not in stats:
+            try:
+                # Follows symlinks, so a changed link target is seen too
+                result = os.stat(path)
+                stats[path] = (result.st_ino, result.st_mtime_ns)
+            except OSError:
+                stats[path] = None
+        return stats[path]
+    
+    def _safe_root_trie(self) -> PathTrie:
+        """SAFE_DIRECTORIES resolved once, rebuilt (and verdicts dropped) if the list changes"""
+        key = tuple(self.SAFE_DIRECTORIES)
+        if self._safe_roots is None or self._safe_roots[0] != key:
+            self._safe_roots = (key, PathTrie(safe_dir.resolve() for safe_dir in key))
+            self._path_verdicts.clear()
+        return self._safe_roots[1]
     
     def sanitize_input(self, user_input: str) -> str:
-        """Sanitize user input to prevent injection"""
-        # Remove null bytes
-        sanitized = user_input.replace("\x00", "")
+        """Sanitize user input to prevent injection
+        
+        Removes null bytes and every non-printable character except newline
+        and tab. Clean text (carriage returns aside) is detected with one C
+        pass; anything else goes through a precompiled character class.
+        """
+        probe = user_input.replace("\n", " ").replace("\t", " ").replace("\r", " ")
+        if probe.isprintable():
+            return user_input.replace("\r", "")
         
-        # Remove control characters except newline and tab
-        sanitized = "".join(
-            char for char in sanitized
-            if char.isprintable() or char in ["\n", "\t"]
-        )
+        # Carriage returns are by far the most common, and replace() is cheaper than a regex match each
+        sanitized = _UNPRINTABLE_BMP.sub("", user_input.replace("\r", ""))
+        if sanitized.replace("\n", " ").replace("\t", " ").isprintable():
+            return sanitized
         
+        # Unprintable astral characters are left. Usually a few distinct ones
+        # among many emoji, so delete each with replace() rather than a callback per run
+        unprintable = {char for run in set(_ASTRAL.findall(sanitized)) for char in run if not char.isprintable()}
+        if len(unprintable) > MAX_REPLACED_CHARS:
+            return _ASTRAL.sub(_printable_only, sanitized)
+        for char in unprintable:
+            sanitized = sanitized.replace(char, "")
         return sanitized
@@ -1,7 +1,13 @@
-import subprocess
-import platform
+import asyncio
+import codecs
+import io
+import locale
+import mmap
 import os
-from typing import Dict, Any
+import platform
+import signal
+import subprocess
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 from pathlib import Path
 
 from security.audit_logger import AuditLogger
@@ -9,20 +15,118 @@ from security.sandbox import Sandbox
 from config import settings
 
 
+# Called with ("stdout" | "stderr", text) as subprocess output arrives
+OutputCallback = Callable[[str, str], Awaitable[None]]
+
+READ_CHUNK_SIZE = 4096
+_POSIX = os.name == "posix"
+# Encoding of Path.read_text()/write_text(), used for file actions
+FILE_ENCODING = locale.getpreferredencoding(False)
+
+
+def _byte_count(value: Any, name: str) -> Optional[int]:
+    """A non-negative integer from a request field (None if absent)"""
+    if value is None:
+        return None
+    try:
+        number = int(value)
+        exact = not isinstance(value, bool) and number == float(value)
+    except (TypeError, ValueError):
+        exact = False
+    if not exact or number < 0:
+        raise ValueError(f"{name} must be a non-negative integer")
+    return number
+
+
+class _Output:
+    """Decodes one pipe incrementally and keeps up to max_bytes of it"""
+    
+    def __init__(self, max_bytes: int):
+        # Same encoding and universal newlines as subprocess.run(text=True) and read_text()
+        self.decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(FILE_ENCODING)(errors="replace"), translate=True)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.truncated = False
+        self.parts: List[str] = []
+    
+    def feed(self, data: bytes) -> str:
+        text = self.decoder.decode(data, final=not data)
+        if self.size + len(data) <= self.max_bytes:
+            self.parts.append(text)
+        elif not self.truncated:
+            self.parts.append(text[:self.max_bytes - self.size])
+            self.truncated = True
+        self.size += len(data)
+        return text
+    
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+class _FileReader:
+    """Reads a byte range in chunks, through mmap for large files
+    
+    Every call blocks and is meant to run in a worker thread.
+    """
+    
+    def __init__(self, path: Path, offset: int, length: int, use_mmap: bool):
+        self.position = offset
+        self.end = offset + length
+        self._file = open(path, "rb")
+        self._map = None
+        if use_mmap and length:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._file.seek(offset)
+    
+    def read(self, size: int) -> bytes:
+        size = min(size, self.end - self.position)
+        if size <= 0:
+            return b""
+        if self._map is not None:
+            data = self._map[self.position:self.position + size]
+        else:
+            data = self._file.read(size)
+        self.position += len(data)
+        return data
+    
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
 class ActionService:
     """Service for executing system actions with security controls"""
     
     def __init__(self, audit_logger: AuditLogger):
         self.audit_logger = audit_logger
         self.sandbox = Sandbox()
+        self.timeout = settings.ACTION_TIMEOUT_SECONDS
+        self.max_output = settings.ACTION_MAX_OUTPUT_BYTES
+        self.max_file_bytes = settings.ACTION_FILE_MAX_BYTES
+        self.file_chunk_size = settings.ACTION_FILE_CHUNK_SIZE
+        self.mmap_threshold = settings.ACTION_FILE_MMAP_THRESHOLD
+        # Caps subprocesses across all connections
+        self._slots = asyncio.Semaphore(settings.ACTION_MAX_CONCURRENT)
     
     async def execute_action(
         self,
         action_type: str,
         command: str,
         description: str = "",
+        on_output: Optional[OutputCallback] = None,
+        offset: int = 0,
+        length: Optional[int] = None,
     ) -> Dict[str, Any]:
-        """Execute an action with appropriate security checks"""
+        """Execute an action with appropriate security checks
+        
+        Shell output and file contents are passed to on_output as they are
+        read; the returned result still carries them (up to
+        ACTION_MAX_OUTPUT_BYTES). offset/length select a byte range for
+        file operations.
+        """
         
         # Log the action
         self.audit_logger.log_action("execute_action", {
@@ -33,9 +137,9 @@ class ActionService:
         
         # Route to appropriate handler
         if action_type == "shell":
-            return await self.execute_shell_command(command)
+            return await self.execute_shell_command(command, on_output)
         elif action_type == "file":
-            return await self.execute_file_operation(command)
+            return await self.execute_file_operation(command, on_output, offset, length)
         elif action_type == "app":
             return await self.launch_application(command)
         elif action_type == "notification":
@@ -46,35 +150,35 @@ class ActionService:
                 "error": f"Unknown action type: {action_type}",
             }
     
-    async def execute_shell_command(self, command: str) -> Dict[str, Any]:
+    async def execute_shell_command(self, command: str, on_output: Optional[OutputCallback] = None) -> Dict[str, Any]:
         """Execute a shell command in sandboxed environment"""
         try:
             # Security check
-            if not self.sandbox.is_command_safe(command):
+            rule = self.sandbox.check_command(command)
+            if rule is not None:
+                self.audit_logger.log_action("command_blocked", {"command": command, "rule": rule})
                 return {
                     "success": False,
                     "error": "Command blocked by security policy",
+                    "rule": rule,
                 }
             
             # Execute command
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=30,
-            )
+            returncode, stdout, stderr, truncated = await self._run_process(command, shell=True, on_output=on_output)
             
-            return {
-                "success": result.returncode == 0,
-                "output": result.stdout,
-                "error": result.stderr if result.returncode != 0 else None,
+            result = {
+                "success": returncode == 0,
+                "output": stdout,
+                "error": stderr if returncode != 0 else None,
             }
+            if truncated:
+                result["truncated"] = True
+            return result
         
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             return {
                 "success": False,
-                "error": "Command timeout (30s limit)",
+                "error": f"Command timeout ({self.timeout:g}s limit)",
             }
         except Exception as e:
             return {
@@ -82,8 +186,20 @@ class ActionService:
                 "error": str(e),
             }
     
-    async def execute_file_operation(self, command: str) -> Dict[str, Any]:
-        """Execute file operations (read, write, etc.)"""
+    async def execute_file_operation(
+        self,
+        command: str,
+        on_output: Optional[OutputCallback] = None,
+        offset: int = 0,
+        length: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Execute file operations (read, write, etc.)
+        
+        File I/O runs in worker threads, one chunk at a time. Reads cover
+        [offset, offset + length) and are refused above ACTION_FILE_MAX_BYTES;
+        a write with a non-zero offset patches the file in place instead of
+        replacing it.
+        """
         try:
             # Parse command (format: "read:/path/to/file" or "write:/path/to/file:content")
             parts = command.split(":", 2)
@@ -97,19 +213,20 @@ class ActionService:
                     "error": "Path blocked by security policy",
                 }
             
-            if operation == "read":
-                content = file_path.read_text()
+            try:
+                offset = _byte_count(offset, "offset") or 0
+                length = _byte_count(length, "length")
+            except ValueError as e:
                 return {
-                    "success": True,
-                    "output": content,
+                    "success": False,
+                    "error": str(e),
                 }
+            
+            if operation == "read":
+                return await self._read_file(file_path, offset, length, on_output)
             elif operation == "write":
                 content = parts[2] if len(parts) > 2 else ""
-                file_path.write_text(content)
-                return {
-                    "success": True,
-                    "output": f"Written to {file_path}",
-                }
+                return await self._write_file(file_path, content, offset)
             else:
                 return {
                     "success": False,
@@ -122,6 +239,82 @@ class ActionService:
                 "error": str(e),
             }
     
+    async def _read_file(
+        self,
+        file_path: Path,
+        offset: int,
+        length: Optional[int],
+        on_output: Optional[OutputCallback],
+    ) -> Dict[str, Any]:
+        size = (await asyncio.to_thread(file_path.stat)).st_size
+        offset = min(offset, size)
+        length = size - offset if length is None else min(length, size - offset)
+        if length > self.max_file_bytes:
+            return {
+                "success": False,
+                "error": f"Read of {length} bytes exceeds the {self.max_file_bytes} byte limit; request a byte range",
+            }
+        
+        reader = await asyncio.to_thread(_FileReader, file_path, offset, length, length >= self.mmap_threshold)
+        output = _Output(self.max_output)
+        try:
+            while True:
+                data = await asyncio.to_thread(reader.read, self.file_chunk_size)
+                text = output.feed(data)
+                if text and on_output is not None:
+                    await on_output("file", text)
+                if not data:
+                    break
+        finally:
+            await asyncio.to_thread(reader.close)
+        
+        result = {
+            "success": True,
+            "output": output.text(),
+            "offset": offset,
+            "bytes": output.size,
+            "size": size,
+        }
+        if output.truncated:
+            result["truncated"] = True
+        return result
+    
+    async def _write_file(self, file_path: Path, content: str, offset: int) -> Dict[str, Any]:
+        # write_text() wrote "\n" as the platform line ending
+        data = content.replace("\n", os.linesep).encode(FILE_ENCODING)
+        if len(data) > self.max_file_bytes:
+            return {
+                "success": False,
+                "error": f"Write of {len(data)} bytes exceeds the {self.max_file_bytes} byte limit",
+            }
+        
+        if offset:
+            # Seeking past the end would pad the file with zero bytes
+            size = await asyncio.to_thread(lambda: file_path.stat().st_size if file_path.exists() else None)
+            if size is None:
+                return {"success": False, "error": f"Cannot write at offset {offset}: {file_path} does not exist"}
+            if offset > size:
+                return {
+                    "success": False,
+                    "error": f"Offset {offset} is past the end of the file ({size} bytes)",
+                }
+        
+        mode = "r+b" if offset else "wb"
+        handle = await asyncio.to_thread(open, file_path, mode)
+        try:
+            if offset:
+                await asyncio.to_thread(handle.seek, offset)
+            for start in range(0, len(data), self.file_chunk_size):
+                await asyncio.to_thread(handle.write, data[start:start + self.file_chunk_size])
+        finally:
+            await asyncio.to_thread(handle.close)
+        
+        return {
+            "success": True,
+            "output": f"Written to {file_path}",
+            "bytes": len(data),
+        }
+    
     async def launch_application(self, app_name: str) -> Dict[str, Any]:
         """Launch an application"""
         try:
@@ -170,16 +363,23 @@ class ActionService:
                 $toast = [Windows.UI.Notifications.ToastNotification]::new($xml)
                 [Windows.UI.Notifications.ToastNotificationManager]::CreateToastNotifier("JARVIS").Show($toast)
                 '''
-                subprocess.run(["powershell", "-Command", ps_script], check=True)
+                args = ["powershell", "-Command", ps_script]
             
             elif system == "Darwin":  # macOS
-                subprocess.run([
+                args = [
                     "osascript", "-e",
                     f'display notification "{message}" with title "{title}"'
-                ], check=True)
+                ]
             
             else:  # Linux
-                subprocess.run(["notify-send", title, message], check=True)
+                args = ["notify-send", title, message]
+            
+            returncode, _, stderr, _ = await self._run_process(args)
+            if returncode != 0:
+                return {
+                    "success": False,
+                    "error": stderr.strip() or f"{args[0]} exited with status {returncode}",
+                }
             
             return {
                 "success": True,
@@ -191,3 +391,70 @@ class ActionService:
                 "success": False,
                 "error": str(e),
             }
+    
+    async def _run_process(
+        self,
+        command: Union[str, List[str]],
+        shell: bool = False,
+        on_output: Optional[OutputCallback] = None,
+    ) -> Tuple[int, str, str, bool]:
+        """Run a subprocess under the concurrency cap and timeout
+        
+        Returns (returncode, stdout, stderr, truncated). Raises
+        asyncio.TimeoutError after ACTION_TIMEOUT_SECONDS. On timeout,
+        cancellation or a failing on_output the process is killed, on POSIX
+        together with anything it spawned.
+        """
+        async with self._slots:
+            kwargs = {
+                "stdin": subprocess.DEVNULL,
+                "stdout": subprocess.PIPE,
+                "stderr": subprocess.PIPE,
+                # Own process group, so the shell's children can be killed too
+                "start_new_session": _POSIX,
+            }
+            if shell:
+                process = await asyncio.create_subprocess_shell(command, **kwargs)
+            else:
+                process = await asyncio.create_subprocess_exec(*command, **kwargs)
+            
+            stdout = _Output(self.max_output)
+            stderr = _Output(self.max_output)
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(
+                        self._pump(process.stdout, "stdout", stdout, on_output),
+                        self._pump(process.stderr, "stderr", stderr, on_output),
+                        process.wait(),
+                    ),
+                    timeout=self.timeout,
+                )
+            except BaseException:
+                await self._kill(process)
+                raise
+        
+        return process.returncode, stdout.text(), stderr.text(), stdout.truncated or stderr.truncated
+    
+    @staticmethod
+    async def _pump(reader: asyncio.StreamReader, name: str, output: _Output, on_output: Optional[OutputCallback]):
+        while True:
+            data = await reader.read(READ_CHUNK_SIZE)
+            text = output.feed(data)
+            if text and on_output is not None:
+                await on_output(name, text)
+            if not data:
+                return
+    
+    @staticmethod
+    async def _kill(process: asyncio.subprocess.Process):
+        try:
+            if _POSIX:
+                os.killpg(process.pid, signal.SIGKILL)
+            elif process.returncode is None:
+                process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass  # Already gone
+        try:
+            await asyncio.wait_for(process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            print(f"[Action] Process {process.pid} did not exit after kill")
@@ -1,14 +1,68 @@
 """Database service for persisting conversations and messages"""
+import asyncio
 import mysql.connector
-from mysql.connector import Error
-from typing import List, Dict, Any, Optional
+from mysql.connector import Error, errors
+from mysql.connector.pooling import MySQLConnectionPool, CNX_POOL_MAXSIZE
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional, Set, Tuple, TypeVar
 from datetime import datetime
+import base64
+import functools
 import json
 import os
 
+from services.metrics import registry
+
+
+T = TypeVar("T")
+
+WRITE_BATCH_ROWS = registry.histogram(
+    "zeno_db_write_batch_rows", "Rows committed per write-behind batch",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500))
+
 
 class DatabaseService:
-    """Service for MySQL database operations"""
+    """Service for MySQL database operations
+    
+    Queries run on a dedicated thread pool against a MySQL connection pool,
+    so the event loop never blocks on a database round trip. The worker
+    count matches the pool size, which means a checkout never finds the
+    pool exhausted.
+    
+    Saves are write-behind: rows are buffered and committed as multi-row
+    upserts once MYSQL_WRITE_BATCH_SIZE rows are pending or
+    MYSQL_WRITE_FLUSH_MS has passed. save_* calls return after their batch
+    commits, and reads flush pending writes first.
+    """
+    
+    CONVERSATION_UPSERT = """
+        INSERT INTO conversations (id, title, model)
+        VALUES {rows}
+        ON DUPLICATE KEY UPDATE
+            title = VALUES(title),
+            model = VALUES(model),
+            updated_at = CURRENT_TIMESTAMP
+    """
+    
+    MESSAGE_UPSERT = """
+        INSERT INTO messages (id, conversation_id, role, content)
+        VALUES {rows}
+        ON DUPLICATE KEY UPDATE
+            content = VALUES(content)
+    """
+    
+    # (table, index, columns, index it supersedes) matching the keyset sort orders
+    PAGINATION_INDEXES = [
+        ("conversations", "idx_updated_at_id", "updated_at, id", None),
+        ("messages", "idx_conversation_created_id", "conversation_id, created_at, id", "idx_conversation_id"),
+    ]
+    
+    # (table, index, columns) searched with MATCH ... AGAINST
+    FULLTEXT_INDEXES = [
+        ("messages", "ft_content", "content"),
+    ]
+    
+    MAX_PAGE_SIZE = 500
     
     def __init__(self):
         self.host = os.getenv("MYSQL_HOST", "localhost")
@@ -16,25 +70,72 @@ class DatabaseService:
         self.user = os.getenv("MYSQL_USER", "jarvis")
         self.password = os.getenv("MYSQL_PASSWORD", "jarvis123")
         self.database = os.getenv("MYSQL_DATABASE", "jarvis_db")
-        self.connection = None
+        self.pool_size = min(int(os.getenv("MYSQL_POOL_SIZE", "5")), CNX_POOL_MAXSIZE)
+        self.connect_timeout = int(os.getenv("MYSQL_CONNECT_TIMEOUT", "5"))
+        self.pool: Optional[MySQLConnectionPool] = None
+        # Set once the FULLTEXT index on messages.content exists
+        self.fulltext = False
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="mysql")
         
-    def connect(self):
-        """Connect to MySQL database"""
+        # Write-behind buffer, keyed by row id so repeated saves collapse
+        self.write_batch_size = max(1, int(os.getenv("MYSQL_WRITE_BATCH_SIZE", "100")))
+        self.write_flush_interval = float(os.getenv("MYSQL_WRITE_FLUSH_MS", "50")) / 1000
+        self._pending_conversations: Dict[str, tuple] = {}
+        self._pending_messages: Dict[str, tuple] = {}
+        self._waiters: List[Tuple[str, str, asyncio.Future]] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_timer: Optional[asyncio.Task] = None
+        self._flush_tasks: Set[asyncio.Task] = set()
+    
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        """Run a blocking function on the database thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
+    def _execute(self, operation: Callable[[Any], T]) -> T:
+        """Run operation(connection) with a pooled connection, retrying once if it dropped"""
+        for attempt in range(2):
+            # get_connection() pings the server and reconnects stale connections
+            conn = self.pool.get_connection()
+            try:
+                return operation(conn)
+            except (errors.OperationalError, errors.InterfaceError) as e:
+                if attempt:
+                    raise
+                print(f"[Database] Connection lost, retrying: {e}")
+            finally:
+                try:
+                    conn.close()  # Returns the connection to the pool
+                except Error:
+                    pass
+    
+    def _create_pool(self):
+        self.pool = MySQLConnectionPool(
+            pool_name="zeno",
+            pool_size=self.pool_size,
+            pool_reset_session=False,
+            host=self.host,
+            port=self.port,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            connection_timeout=self.connect_timeout,
+        )
+    
+    def _connect(self) -> bool:
         try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                database=self.database
-            )
-            print(f"[Database] Connected to MySQL database: {self.database}")
+            self._create_pool()
+            print(f"[Database] Connected to MySQL database: {self.database} (pool size {self.pool_size})")
             return True
         except Error as e:
             print(f"[Database] Connection failed: {e}")
             print(f"[Database] Will attempt to create database...")
             return self._create_database()
     
+    async def connect(self):
+        """Connect to MySQL database"""
+        return await self._run(self._connect)
+    
     def _create_database(self):
         """Create database if it doesn't exist"""
         try:
@@ -43,7 +144,8 @@ class DatabaseService:
                 host=self.host,
                 port=self.port,
                 user=self.user,
-                password=self.password
+                password=self.password,
+                connection_timeout=self.connect_timeout,
             )
             cursor = conn.cursor()
             cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.database}")
@@ -51,142 +153,370 @@ class DatabaseService:
             conn.close()
             
             # Now connect to the database
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                database=self.database
-            )
+            self._create_pool()
             print(f"[Database] Created and connected to database: {self.database}")
             return True
         except Error as e:
             print(f"[Database] Failed to create database: {e}")
             return False
     
-    def initialize_tables(self):
+    def _initialize_tables(self, conn):
+        cursor = conn.cursor()
+        
+        # Conversations table
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id VARCHAR(36) PRIMARY KEY,
+                title VARCHAR(255) NOT NULL,
+                model VARCHAR(100) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_updated_at_id (updated_at, id)
+            )
+        """)
+        
+        # Messages table
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id VARCHAR(36) PRIMARY KEY,
+                conversation_id VARCHAR(36) NOT NULL,
+                role ENUM('user', 'assistant', 'system') NOT NULL,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE,
+                INDEX idx_conversation_created_id (conversation_id, created_at, id),
+                INDEX idx_created_at (created_at)
+            )
+        """)
+        
+        self._ensure_indexes(cursor)
+        
+        conn.commit()
+        cursor.close()
+    
+    def _ensure_indexes(self, cursor):
+        """Add keyset pagination and full-text indexes to tables created by older versions"""
+        cursor.execute("""
+            SELECT table_name, index_name
+            FROM information_schema.statistics
+            WHERE table_schema = %s
+        """, (self.database,))
+        existing = {(table.lower(), index) for table, index in cursor.fetchall()}
+        
+        for table, name, columns, replaces in self.PAGINATION_INDEXES:
+            if (table, name) not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD INDEX {name} ({columns})")
+                print(f"[Database] Added index {name} on {table}")
+            # The composite index covers the old one's prefix (including for the foreign key)
+            if replaces and (table, replaces) in existing:
+                cursor.execute(f"ALTER TABLE {table} DROP INDEX {replaces}")
+                print(f"[Database] Dropped redundant index {replaces} on {table}")
+        
+        # Added here rather than in CREATE TABLE so a server without InnoDB
+        # full-text support still gets its tables; search then uses the local index
+        self.fulltext = True
+        for table, name, columns in self.FULLTEXT_INDEXES:
+            if (table, name) in existing:
+                continue
+            # Building the index rewrites the table, which can take minutes on
+            # a large one, so only empty tables get it at startup
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+            if cursor.fetchone()[0]:
+                print(f"[Database] Full-text index {name} on {table} is missing; "
+                      "search uses the local index until it is added (see MYSQL_SETUP.md)")
+                self.fulltext = False
+                continue
+            try:
+                cursor.execute(f"ALTER TABLE {table} ADD FULLTEXT INDEX {name} ({columns})")
+                print(f"[Database] Added full-text index {name} on {table}")
+            except Error as e:
+                print(f"[Database] Could not add full-text index {name} on {table}: {e}")
+                self.fulltext = False
+    
+    async def initialize_tables(self):
         """Create tables if they don't exist"""
-        if not self.connection:
+        if not self.pool:
             return False
-            
+        
         try:
-            cursor = self.connection.cursor()
-            
-            # Conversations table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id VARCHAR(36) PRIMARY KEY,
-                    title VARCHAR(255) NOT NULL,
-                    model VARCHAR(100) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Messages table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id VARCHAR(36) PRIMARY KEY,
-                    conversation_id VARCHAR(36) NOT NULL,
-                    role ENUM('user', 'assistant', 'system') NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE,
-                    INDEX idx_conversation_id (conversation_id),
-                    INDEX idx_created_at (created_at)
-                )
-            """)
-            
-            self.connection.commit()
-            cursor.close()
+            await self._run(self._execute, self._initialize_tables)
             print("[Database] Tables initialized successfully")
             return True
         except Error as e:
             print(f"[Database] Failed to initialize tables: {e}")
             return False
     
-    def save_conversation(self, conversation_id: str, title: str, model: str) -> bool:
-        """Save or update a conversation"""
-        if not self.connection:
+    async def ping(self) -> bool:
+        """Health check: True if a pooled connection can reach the server"""
+        if not self.pool:
             return False
-            
+        
+        def check(conn):
+            return conn.is_connected()
+        
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("""
-                INSERT INTO conversations (id, title, model)
-                VALUES (%s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    title = VALUES(title),
-                    model = VALUES(model),
-                    updated_at = CURRENT_TIMESTAMP
-            """, (conversation_id, title, model))
-            self.connection.commit()
-            cursor.close()
-            return True
-        except Error as e:
-            print(f"[Database] Failed to save conversation: {e}")
+            return await self._run(self._execute, check)
+        except Error:
             return False
     
-    def save_message(self, message_id: str, conversation_id: str, role: str, content: str) -> bool:
-        """Save a message"""
-        if not self.connection:
-            return False
-            
+    def _write_rows(self, conversations: List[tuple], messages: List[tuple], conn):
+        """Upsert rows as multi-row statements in one transaction"""
+        cursor = conn.cursor()
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("""
-                INSERT INTO messages (id, conversation_id, role, content)
-                VALUES (%s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    content = VALUES(content)
-            """, (message_id, conversation_id, role, content))
-            self.connection.commit()
+            # Conversations first so messages in the same batch satisfy the foreign key
+            if conversations:
+                cursor.execute(
+                    self.CONVERSATION_UPSERT.format(rows=", ".join(["(%s, %s, %s)"] * len(conversations))),
+                    [value for row in conversations for value in row],
+                )
+            if messages:
+                cursor.execute(
+                    self.MESSAGE_UPSERT.format(rows=", ".join(["(%s, %s, %s, %s)"] * len(messages))),
+                    [value for row in messages for value in row],
+                )
+            conn.commit()
+        except Error:
+            conn.rollback()
+            raise
+        finally:
             cursor.close()
-            return True
+    
+    def _write_batch(self, conversations: Dict[str, tuple], messages: Dict[str, tuple]) -> Set[Tuple[str, str]]:
+        """Write a batch, falling back to row-by-row writes so one bad row can't fail the rest"""
+        try:
+            self._execute(functools.partial(
+                self._write_rows, list(conversations.values()), list(messages.values())))
+            return set()
         except Error as e:
-            print(f"[Database] Failed to save message: {e}")
-            return False
+            if len(conversations) + len(messages) == 1:
+                print(f"[Database] Failed to save {'conversation' if conversations else 'message'}: {e}")
+                return {("conversation", key) for key in conversations} | {("message", key) for key in messages}
+            print(f"[Database] Batch write failed, retrying rows individually: {e}")
+        
+        failed = set()
+        for key, row in conversations.items():
+            try:
+                self._execute(functools.partial(self._write_rows, [row], []))
+            except Error as e:
+                print(f"[Database] Failed to save conversation: {e}")
+                failed.add(("conversation", key))
+        for key, row in messages.items():
+            try:
+                self._execute(functools.partial(self._write_rows, [], [row]))
+            except Error as e:
+                print(f"[Database] Failed to save message: {e}")
+                failed.add(("message", key))
+        return failed
     
-    def get_all_conversations(self) -> List[Dict[str, Any]]:
-        """Get all conversations"""
-        if not self.connection:
-            return []
+    async def _enqueue(self, kind: str, key: str, row: tuple) -> bool:
+        """Buffer a row and wait until the batch containing it is committed"""
+        pending = self._pending_conversations if kind == "conversation" else self._pending_messages
+        pending[key] = row
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((kind, key, future))
+        
+        if len(self._pending_conversations) + len(self._pending_messages) >= self.write_batch_size:
+            self._start_flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.create_task(self._flush_later())
+        
+        return await future
+    
+    def _start_flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        task = asyncio.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.write_flush_interval)
+        self._flush_timer = None
+        await self.flush()
+    
+    async def flush(self):
+        """Commit all buffered conversations and messages"""
+        async with self._flush_lock:
+            if not self._waiters:
+                return
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            messages, self._pending_messages = self._pending_messages, {}
+            waiters, self._waiters = self._waiters, []
+            WRITE_BATCH_ROWS.observe(len(conversations) + len(messages))
+            
+            try:
+                failed = await self._run(self._write_batch, conversations, messages)
+            except Exception as e:
+                print(f"[Database] Batch write failed: {e}")
+                failed = {(kind, key) for kind, key, _ in waiters}
             
+            for kind, key, future in waiters:
+                if not future.done():
+                    future.set_result((kind, key) not in failed)
+    
+    async def save_conversation(self, conversation_id: str, title: str, model: str) -> bool:
+        """Save or update a conversation once its write batch commits"""
+        if not self.pool:
+            return False
+        
+        return await self._enqueue("conversation", conversation_id, (conversation_id, title, model))
+    
+    async def save_message(self, message_id: str, conversation_id: str, role: str, content: str) -> bool:
+        """Save a message once its write batch commits"""
+        if not self.pool:
+            return False
+        
+        return await self._enqueue("message", message_id, (message_id, conversation_id, role, content))
+    
+    @staticmethod
+    def _encode_cursor(timestamp: datetime, row_id: str) -> str:
+        """Opaque keyset cursor for the row a page ended on"""
+        raw = json.dumps([timestamp.isoformat(), row_id])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT id, title, model, created_at, updated_at
-                FROM conversations
-                ORDER BY updated_at DESC
-            """)
-            conversations = cursor.fetchall()
-            cursor.close()
+            timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(timestamp), str(row_id)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+    
+    def _page_size(self, limit: Optional[int]) -> Optional[int]:
+        if not limit:
+            return None
+        return max(1, min(int(limit), self.MAX_PAGE_SIZE))
+    
+    async def get_conversations_page(self, limit: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Get conversations newest first, paginated on (updated_at, id)
+        
+        Without a limit every remaining conversation is returned. The result
+        carries ``next_cursor`` when more rows follow.
+        """
+        if not self.pool:
+            return {"conversations": [], "next_cursor": None}
+        
+        after = self._decode_cursor(cursor) if cursor else None
+        page_size = self._page_size(limit)
+        
+        # Make buffered writes visible to this query
+        await self.flush()
+        
+        def fetch(conn):
+            sql = "SELECT id, title, model, created_at, updated_at FROM conversations"
+            params: List[Any] = []
+            if after:
+                sql += " WHERE updated_at < %s OR (updated_at = %s AND id < %s)"
+                params += [after[0], after[0], after[1]]
+            sql += " ORDER BY updated_at DESC, id DESC"
+            if page_size:
+                sql += " LIMIT %s"
+                params.append(page_size + 1)
+            db_cursor = conn.cursor(dictionary=True)
+            db_cursor.execute(sql, params)
+            conversations = db_cursor.fetchall()
+            db_cursor.close()
+            return conversations
+        
+        try:
+            conversations = await self._run(self._execute, fetch)
+            
+            next_cursor = None
+            if page_size and len(conversations) > page_size:
+                conversations = conversations[:page_size]
+                last = conversations[-1]
+                next_cursor = self._encode_cursor(last['updated_at'], last['id'])
             
             # Convert datetime to string
             for conv in conversations:
                 conv['created_at'] = conv['created_at'].isoformat() if conv['created_at'] else None
                 conv['updated_at'] = conv['updated_at'].isoformat() if conv['updated_at'] else None
             
-            return conversations
+            return {"conversations": conversations, "next_cursor": next_cursor}
         except Error as e:
             print(f"[Database] Failed to get conversations: {e}")
-            return []
+            return {"conversations": [], "next_cursor": None}
     
-    def get_conversation_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
-        """Get all messages for a conversation"""
-        if not self.connection:
-            return []
-            
+    async def get_all_conversations(self) -> List[Dict[str, Any]]:
+        """Get all conversations"""
+        page = await self.get_conversations_page()
+        return page["conversations"]
+    
+    async def get_messages_page(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Get a conversation's messages oldest first, paginated on (created_at, id)"""
+        if not self.pool:
+            return {"messages": [], "next_cursor": None}
+        
+        after = self._decode_cursor(cursor) if cursor else None
+        page_size = self._page_size(limit)
+        
+        # Make buffered writes visible to this query
+        await self.flush()
+        
+        def fetch(conn):
+            sql = "SELECT id, role, content, created_at FROM messages WHERE conversation_id = %s"
+            params: List[Any] = [conversation_id]
+            if after:
+                sql += " AND (created_at > %s OR (created_at = %s AND id > %s))"
+                params += [after[0], after[0], after[1]]
+            sql += " ORDER BY created_at ASC, id ASC"
+            if page_size:
+                sql += " LIMIT %s"
+                params.append(page_size + 1)
+            db_cursor = conn.cursor(dictionary=True)
+            db_cursor.execute(sql, params)
+            messages = db_cursor.fetchall()
+            db_cursor.close()
+            return messages
+        
         try:
-            cursor = self.connection.cursor(dictionary=True)
+            messages = await self._run(self._execute, fetch)
+            
+            next_cursor = None
+            if page_size and len(messages) > page_size:
+                messages = messages[:page_size]
+                last = messages[-1]
+                next_cursor = self._encode_cursor(last['created_at'], last['id'])
+            
+            # Convert datetime to string
+            for msg in messages:
+                msg['created_at'] = msg['created_at'].isoformat() if msg['created_at'] else None
+            
+            return {"messages": messages, "next_cursor": next_cursor}
+        except Error as e:
+            print(f"[Database] Failed to get messages: {e}")
+            return {"messages": [], "next_cursor": None}
+    
+    async def get_recent_messages(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Get the newest ``limit`` messages of a conversation, oldest first"""
+        if not self.pool:
+            return []
+        
+        # Make buffered writes visible to this query
+        await self.flush()
+        
+        def fetch(conn):
+            cursor = conn.cursor(dictionary=True)
             cursor.execute("""
                 SELECT id, role, content, created_at
                 FROM messages
                 WHERE conversation_id = %s
-                ORDER BY created_at ASC
-            """, (conversation_id,))
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
+            """, (conversation_id, limit))
             messages = cursor.fetchall()
             cursor.close()
+            return messages
+        
+        try:
+            messages = await self._run(self._execute, fetch)
+            messages.reverse()
             
             # Convert datetime to string
             for msg in messages:
@@ -197,23 +527,91 @@ class DatabaseService:
             print(f"[Database] Failed to get messages: {e}")
             return []
     
-    def delete_conversation(self, conversation_id: str) -> bool:
+    async def get_conversation_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Get all messages for a conversation"""
+        page = await self.get_messages_page(conversation_id)
+        return page["messages"]
+    
+    async def search_messages(self, expression: str, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        """Messages matching a boolean-mode full-text expression, most relevant first"""
+        if not self.pool or not self.fulltext:
+            return []
+        
+        # Make buffered writes visible to this query
+        await self.flush()
+        
+        def fetch(conn):
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT m.id, m.conversation_id, c.title, m.role, m.content, m.created_at,
+                       MATCH(m.content) AGAINST (%s IN BOOLEAN MODE) AS score
+                FROM messages m
+                LEFT JOIN conversations c ON c.id = m.conversation_id
+                WHERE MATCH(m.content) AGAINST (%s IN BOOLEAN MODE)
+                ORDER BY score DESC, m.created_at DESC, m.id DESC
+                LIMIT %s OFFSET %s
+            """, (expression, expression, limit, offset))
+            messages = cursor.fetchall()
+            cursor.close()
+            return messages
+        
+        try:
+            messages = await self._run(self._execute, fetch)
+            
+            # Convert datetime to string
+            for msg in messages:
+                msg['created_at'] = msg['created_at'].isoformat() if msg['created_at'] else None
+                msg['score'] = float(msg['score'])
+            
+            return messages
+        except Error as e:
+            print(f"[Database] Failed to search messages: {e}")
+            return []
+    
+    async def delete_conversation(self, conversation_id: str) -> bool:
         """Delete a conversation and all its messages"""
-        if not self.connection:
+        if not self.pool:
             return False
-            
-        try:
-            cursor = self.connection.cursor()
+        
+        # Commit buffered writes first so none land after the delete
+        await self.flush()
+        
+        def delete(conn):
+            cursor = conn.cursor()
             cursor.execute("DELETE FROM conversations WHERE id = %s", (conversation_id,))
-            self.connection.commit()
+            conn.commit()
             cursor.close()
+        
+        try:
+            await self._run(self._execute, delete)
             return True
         except Error as e:
             print(f"[Database] Failed to delete conversation: {e}")
             return False
     
-    def close(self):
-        """Close database connection"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("[Database] Connection closed")
+    def _disconnect_pool(self):
+        """Check out each idle pooled connection and disconnect it
+        
+        MySQLConnectionPool has no public close(), and closing a pooled
+        connection only returns it to the pool.
+        """
+        for _ in range(self.pool_size):
+            try:
+                conn = self.pool.get_connection()
+            except Error:
+                # Pool exhausted (connections still checked out) or a reconnect failed
+                return
+            conn.disconnect()
+    
+    async def close(self):
+        """Close pooled connections and stop the database threads"""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        await self.flush()
+        
+        if self.pool:
+            await self._run(self._disconnect_pool)
+            self.pool = None
+            print("[Database] Connection pool closed")
+        self._executor.shutdown(wait=False)
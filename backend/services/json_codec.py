@@ -0,0 +1,67 @@
+"""JSON encoding for the per-token hot paths
+
+orjson or msgspec is used when installed, with the standard library as the
+fallback. JSON_CODEC picks one explicitly ("orjson", "msgspec", "stdlib");
+the default "auto" takes the fastest available. Output is compact and
+UTF-8 (no ASCII escaping), matching what Starlette's send_json produces.
+dumps returns str, since WebSocket text frames take str: the stdlib codec
+produces it directly, and only the bytes-native codecs decode.
+"""
+import json
+from typing import Any, Callable, Dict, Tuple, Union
+
+from config import settings
+
+
+Codec = Tuple[Callable[[Any], str], Callable[[Union[str, bytes]], Any]]
+
+
+def _stdlib() -> Codec:
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+    return dumps, json.loads
+
+
+def _orjson() -> Codec:
+    import orjson
+    
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return dumps, orjson.loads
+
+
+def _msgspec() -> Codec:
+    import msgspec
+    
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    
+    def dumps(obj: Any) -> str:
+        return encoder.encode(obj).decode("utf-8")
+    return dumps, decoder.decode
+
+
+CODECS: Dict[str, Callable[[], Codec]] = {
+    "orjson": _orjson,
+    "msgspec": _msgspec,
+    "stdlib": _stdlib,
+}
+
+
+def load_codec(name: str = "auto"):
+    """Return (name, dumps, loads) for the requested codec, falling back to stdlib"""
+    candidates = list(CODECS) if name == "auto" else [name, "stdlib"]
+    for candidate in candidates:
+        try:
+            dumps, loads = CODECS[candidate]()
+            return candidate, dumps, loads
+        except ImportError:
+            continue
+        except KeyError:
+            print(f"[JSON] Unknown codec {candidate!r}, using stdlib")
+    dumps, loads = _stdlib()
+    return "stdlib", dumps, loads
+
+
+# dumps(obj) serializes to a compact JSON string
+CODEC_NAME, dumps, loads = load_codec(settings.JSON_CODEC)
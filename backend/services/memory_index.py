@@ -0,0 +1,428 @@
+"""On-disk vector index behind conversation memory
+
+Files under DATA_DIR/memory:
+    meta.json     embedding model and dimension
+    vectors.f32   one unit-length float32 row per indexed message, appended
+    rows.jsonl    the matching message id, conversation id, role and content
+    deleted.u32   row numbers that no longer count (deleted conversations, edits)
+    ivf.npz       k-means centroids of the optional inverted file
+    ivf.i32       the centroid (list) of each row
+
+With numpy the vectors are memory-mapped and scored with one matrix-vector
+product. From MEMORY_IVF_MIN_VECTORS live rows an inverted file is trained
+in the background, after which a search only scores the rows in the
+MEMORY_IVF_PROBES lists nearest to the query. Without numpy the vectors are
+held in an array and scored in Python, which is fine for a small history.
+
+All methods block and are called from worker threads.
+"""
+import json
+import math
+import os
+import threading
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Rows scored per matrix product when assigning rows to IVF lists
+ASSIGN_CHUNK = 65536
+KMEANS_ITERATIONS = 10
+# Training sample size per list (and the minimum to train on at all)
+KMEANS_POINTS_PER_LIST = 40
+MAX_TRAINING_SAMPLE = 100_000
+
+
+def normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else list(vector)
+
+
+class MemoryIndex:
+    """Append-only store of message embeddings with top-k cosine search"""
+    
+    def __init__(self, path: Path, ivf_min_vectors: int = 50_000, ivf_probes: int = 8):
+        self.path = path
+        self.ivf_min_vectors = ivf_min_vectors
+        self.ivf_probes = ivf_probes
+        self.lock = threading.RLock()
+        self.model: Optional[str] = None
+        self.dim: Optional[int] = None
+        self.count = 0
+        self._reset_state()
+        self._closed = False
+    
+    def _reset_state(self):
+        self.count = 0
+        self._offsets = array("Q")  # byte offset of each row in rows.jsonl
+        self._deleted = bytearray()  # 1 for rows that no longer count
+        self._deleted_count = 0
+        self._by_message: Dict[str, int] = {}
+        self._by_conversation: Dict[str, List[int]] = {}
+        self._vectors = array("f")  # only used without numpy
+        self._vector_file = None
+        self._row_file = None
+        self._deleted_file = None
+        self._assign_file = None
+        self._matrix = None
+        self._centroids = None
+        self._assign = array("i")
+        self._trained_on = 0
+        # Rows grouped by list (argsort of _assign) for the first _listed rows
+        self._lists = None
+        self._list_starts = None
+        self._listed = 0
+    
+    @property
+    def live_count(self) -> int:
+        return self.count - self._deleted_count
+    
+    @property
+    def ivf_lists(self) -> int:
+        return 0 if self._centroids is None else len(self._centroids)
+    
+    def _file(self, name: str) -> Path:
+        return self.path / name
+    
+    def open(self, model: str):
+        """Load the index, starting over if it was built with another model"""
+        with self.lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            meta_path = self._file("meta.json")
+            meta = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else {}
+            if meta.get("model") not in (None, model):
+                print(f"[Memory] Embedding model changed from {meta['model']} to {model}, rebuilding the index")
+                self._clear_files()
+                meta = {}
+            self.model = model
+            self.dim = meta.get("dim")
+            self._reset_state()
+            self._closed = False
+            if self.dim:
+                self._load()
+            self._open_files()
+    
+    def _clear_files(self):
+        for name in ("meta.json", "vectors.f32", "rows.jsonl", "deleted.u32", "ivf.npz", "ivf.i32"):
+            try:
+                self._file(name).unlink()
+            except FileNotFoundError:
+                pass
+    
+    def _load(self):
+        rows_path = self._file("rows.jsonl")
+        vectors_path = self._file("vectors.f32")
+        row_size = 4 * self.dim
+        vector_rows = vectors_path.stat().st_size // row_size if vectors_path.exists() else 0
+        
+        # A crash can leave one file a row ahead of the other: keep the common prefix
+        offset = 0
+        if rows_path.exists():
+            with open(rows_path, "rb") as rows:
+                for line in rows:
+                    if len(self._offsets) >= vector_rows or not line.endswith(b"\n"):
+                        break
+                    row = json.loads(line)
+                    self._register(len(self._offsets), row["id"], row["conversationId"])
+                    self._offsets.append(offset)
+                    offset += len(line)
+        self.count = len(self._offsets)
+        self._deleted = bytearray(self.count)
+        if rows_path.exists():
+            os.truncate(rows_path, offset)
+        if vectors_path.exists():
+            os.truncate(vectors_path, self.count * row_size)
+        
+        deleted_path = self._file("deleted.u32")
+        if deleted_path.exists():
+            removed = array("I", deleted_path.read_bytes()[: deleted_path.stat().st_size // 4 * 4])
+            for row in removed:
+                self._mark_deleted(row)
+        
+        if np is None:
+            if not self.count:
+                return
+            with open(vectors_path, "rb") as vectors:
+                self._vectors.fromfile(vectors, self.count * self.dim)
+        else:
+            self._load_ivf()
+    
+    def _load_ivf(self):
+        ivf_path = self._file("ivf.npz")
+        if not ivf_path.exists():
+            return
+        try:
+            with np.load(ivf_path) as data:
+                centroids = data["centroids"]
+                trained_on = int(data["trained_on"])
+        except Exception as e:
+            print(f"[Memory] Ignoring unreadable IVF index: {e}")
+            return
+        if centroids.shape[1] != self.dim:
+            return
+        self._centroids = centroids.astype(np.float32)
+        self._trained_on = trained_on
+        assign_path = self._file("ivf.i32")
+        if assign_path.exists():
+            self._assign = array("i", assign_path.read_bytes()[: min(assign_path.stat().st_size // 4, self.count) * 4])
+            os.truncate(assign_path, len(self._assign) * 4)
+        # Rows added after the last assignment write
+        if len(self._assign) < self.count:
+            missing = self._assign_rows(self._rows_matrix()[len(self._assign):self.count], self._centroids)
+            self._assign.extend(missing)
+            with open(assign_path, "ab") as handle:
+                handle.write(array("i", missing).tobytes())
+    
+    def _open_files(self):
+        self._vector_file = open(self._file("vectors.f32"), "ab")
+        self._row_file = open(self._file("rows.jsonl"), "ab")
+        self._deleted_file = open(self._file("deleted.u32"), "ab")
+        if self._centroids is not None:
+            self._assign_file = open(self._file("ivf.i32"), "ab")
+    
+    def close(self):
+        with self.lock:
+            self._closed = True
+            for handle in (self._vector_file, self._row_file, self._deleted_file, self._assign_file):
+                if handle is not None:
+                    handle.close()
+            self._vector_file = self._row_file = self._deleted_file = self._assign_file = None
+            self._matrix = None
+    
+    def _register(self, row: int, message_id: str, conversation_id: str):
+        previous = self._by_message.get(message_id)
+        if previous is not None:
+            self._mark_deleted(previous)
+        self._by_message[message_id] = row
+        self._by_conversation.setdefault(conversation_id, []).append(row)
+    
+    def _mark_deleted(self, row: int):
+        if row < len(self._deleted) and not self._deleted[row]:
+            self._deleted[row] = 1
+            self._deleted_count += 1
+    
+    def contains(self, message_id: str, content: str) -> bool:
+        """True if this message is already indexed with this content"""
+        with self.lock:
+            row = self._by_message.get(message_id)
+            return row is not None and not self._deleted[row] and self._read_row(row).get("content") == content
+    
+    def add(self, message_id: str, conversation_id: str, role: str, content: str, vector: List[float]):
+        """Append a message; an earlier row for the same message id stops counting"""
+        with self.lock:
+            if self._closed:
+                return
+            if self.dim is None:
+                self.dim = len(vector)
+                self._file("meta.json").write_text(json.dumps({"model": self.model, "dim": self.dim}), encoding="utf-8")
+            if len(vector) != self.dim:
+                raise ValueError(f"Embedding has {len(vector)} dimensions, index has {self.dim}")
+            
+            unit = normalize(vector)
+            row = self.count
+            previous = self._by_message.get(message_id)
+            line = json.dumps({
+                "id": message_id,
+                "conversationId": conversation_id,
+                "role": role,
+                "content": content,
+            }).encode("utf-8") + b"\n"
+            
+            self._vector_file.write(array("f", unit).tobytes())
+            self._vector_file.flush()
+            self._offsets.append(self._row_file.tell())
+            self._row_file.write(line)
+            self._row_file.flush()
+            self._deleted.append(0)
+            self.count += 1
+            self._register(row, message_id, conversation_id)
+            if previous is not None:
+                self._deleted_file.write(array("I", [previous]).tobytes())
+                self._deleted_file.flush()
+            
+            if np is None:
+                self._vectors.extend(unit)
+            elif self._centroids is not None:
+                assigned = int(np.argmax(self._centroids @ np.asarray(unit, dtype=np.float32)))
+                self._assign.append(assigned)
+                self._assign_file.write(array("i", [assigned]).tobytes())
+                self._assign_file.flush()
+    
+    def remove_conversation(self, conversation_id: str) -> int:
+        """Drop every row of a conversation; returns how many were live"""
+        with self.lock:
+            rows = [row for row in self._by_conversation.pop(conversation_id, []) if not self._deleted[row]]
+            for row in rows:
+                self._mark_deleted(row)
+            removed = set(rows)
+            for message_id in [m for m, row in self._by_message.items() if row in removed]:
+                del self._by_message[message_id]
+            if rows and self._deleted_file is not None:
+                self._deleted_file.write(array("I", rows).tobytes())
+                self._deleted_file.flush()
+            return len(rows)
+    
+    def search(self, vector: List[float], k: int, exclude_conversation: Optional[str] = None) -> List[Dict[str, Any]]:
+        """The k most similar live rows, best first, each with its cosine score"""
+        with self.lock:
+            if not self.count or self.dim is None or len(vector) != self.dim or k <= 0:
+                return []
+            excluded = set(self._by_conversation.get(exclude_conversation, ())) if exclude_conversation else set()
+            if np is None:
+                hits = self._search_python(normalize(vector), k, excluded)
+            else:
+                hits = self._search_numpy(np.asarray(normalize(vector), dtype=np.float32), k, excluded)
+            return [{**self._read_row(row), "score": score} for row, score in hits]
+    
+    def _search_python(self, query: List[float], k: int, excluded: set) -> List[Tuple[int, float]]:
+        scored = []
+        dim = self.dim
+        vectors = self._vectors
+        for row in range(self.count):
+            if self._deleted[row] or row in excluded:
+                continue
+            start = row * dim
+            scored.append((sum(a * b for a, b in zip(query, vectors[start:start + dim])), row))
+        scored.sort(reverse=True)
+        return [(row, score) for score, row in scored[:k]]
+    
+    def _search_numpy(self, query: "np.ndarray", k: int, excluded: set) -> List[Tuple[int, float]]:
+        matrix = self._rows_matrix()
+        count = self.count
+        deleted = np.frombuffer(self._deleted, dtype=np.uint8, count=count)
+        if self._centroids is not None and len(self._assign) == count:
+            probes = np.argsort(self._centroids @ query)[-self.ivf_probes:]
+            rows = self._probe_rows(probes)
+            scores = matrix[rows] @ query
+            dead = deleted[rows] != 0
+            if excluded:
+                dead |= np.isin(rows, np.fromiter(excluded, dtype=np.int64))
+        else:
+            rows = None
+            scores = matrix @ query
+            dead = deleted != 0
+            if excluded:
+                dead[np.fromiter(excluded, dtype=np.int64)] = True
+        del deleted
+        scores[dead] = -np.inf
+        
+        k = min(k, len(scores))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = []
+        for index in top:
+            if scores[index] == -np.inf:
+                break
+            hits.append((int(index if rows is None else rows[index]), float(scores[index])))
+        return hits
+    
+    def _probe_rows(self, probes: "np.ndarray") -> "np.ndarray":
+        """Rows of the probed lists, in file order"""
+        count = self.count
+        if self._lists is None or count - self._listed > max(ASSIGN_CHUNK, self._listed // 10):
+            assign = np.frombuffer(self._assign, dtype=np.int32, count=count)
+            self._lists = np.argsort(assign, kind="stable")
+            self._list_starts = np.searchsorted(assign[self._lists], np.arange(len(self._centroids) + 1))
+            self._listed = count
+            del assign
+        parts = [self._lists[self._list_starts[p]:self._list_starts[p + 1]] for p in probes]
+        if self._listed < count:
+            # Rows added since the lists were grouped
+            tail = np.frombuffer(self._assign, dtype=np.int32, count=count)[self._listed:]
+            parts.append(self._listed + np.flatnonzero(np.isin(tail, probes)))
+            del tail
+        return np.sort(np.concatenate(parts))
+    
+    def _rows_matrix(self) -> "np.ndarray":
+        """Memory map of the vector file, remapped when rows were added"""
+        if self._matrix is None or len(self._matrix) != self.count:
+            if self._vector_file is not None:
+                self._vector_file.flush()
+            self._matrix = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        return self._matrix
+    
+    def _read_row(self, row: int) -> Dict[str, Any]:
+        with open(self._file("rows.jsonl"), "rb") as rows:
+            rows.seek(self._offsets[row])
+            return json.loads(rows.readline())
+    
+    def needs_training(self) -> bool:
+        """True when the IVF should be (re)built: first past the threshold, then each doubling"""
+        if np is None or not self.ivf_min_vectors or self._closed:
+            return False
+        live = self.live_count
+        return live >= self.ivf_min_vectors and live >= 2 * self._trained_on
+    
+    def train(self):
+        """Build the inverted file with spherical k-means
+        
+        The heavy part runs without the lock, on the rows present when it
+        started; rows added meanwhile are assigned before the swap.
+        """
+        with self.lock:
+            if not self.needs_training():
+                return
+            count = self.count
+            matrix = self._rows_matrix()
+            live = np.flatnonzero(np.frombuffer(self._deleted, dtype=np.uint8, count=count) == 0)
+        
+        lists = max(1, min(int(math.sqrt(len(live))), len(live) // KMEANS_POINTS_PER_LIST))
+        rng = np.random.default_rng(0)
+        sample_size = min(len(live), max(lists * KMEANS_POINTS_PER_LIST, MAX_TRAINING_SAMPLE))
+        sample = np.asarray(matrix[np.sort(rng.choice(live, sample_size, replace=False))])
+        centroids = self._kmeans(sample, lists, rng)
+        assign = self._assign_rows(matrix[:count], centroids)
+        
+        with self.lock:
+            if self._closed:
+                return
+            assign.extend(self._assign_rows(self._rows_matrix()[count:self.count], centroids))
+            tmp = self._file("ivf.tmp.npz")
+            np.savez(tmp, centroids=centroids, trained_on=len(live))
+            tmp.replace(self._file("ivf.npz"))
+            assign_tmp = self._file("ivf.i32.tmp")
+            assign_tmp.write_bytes(assign.tobytes())
+            if self._assign_file is not None:
+                self._assign_file.close()
+            assign_tmp.replace(self._file("ivf.i32"))
+            self._assign_file = open(self._file("ivf.i32"), "ab")
+            self._centroids = centroids
+            self._assign = assign
+            self._lists = None
+            self._trained_on = len(live)
+        print(f"[Memory] Built IVF index: {lists} lists over {len(live)} messages")
+    
+    @staticmethod
+    def _kmeans(sample: "np.ndarray", lists: int, rng) -> "np.ndarray":
+        centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty lists keep their previous centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+        return centroids
+    
+    @staticmethod
+    def _assign_rows(rows: "np.ndarray", centroids: "np.ndarray") -> array:
+        assign = array("i")
+        for start in range(0, len(rows), ASSIGN_CHUNK):
+            chunk = np.asarray(rows[start:start + ASSIGN_CHUNK])
+            assign.extend(np.argmax(chunk @ centroids.T, axis=1).astype(np.int32).tolist())
+        return assign
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "vectors": self.live_count,
+            "dimension": self.dim,
+            "ivf_lists": self.ivf_lists,
+            "numpy": np is not None,
+        }
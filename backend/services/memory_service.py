@@ -0,0 +1,153 @@
+"""Long-term memory: past messages recalled by embedding similarity"""
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from services.memory_index import MemoryIndex
+from services.metrics import GAP_BUCKETS, registry
+
+
+MEMORY_VECTORS = registry.gauge(
+    "zeno_memory_vectors", "Messages held in the memory index")
+MEMORY_PENDING = registry.gauge(
+    "zeno_memory_pending", "Saved messages waiting to be embedded")
+MEMORY_DROPPED = registry.counter(
+    "zeno_memory_dropped_total", "Messages not indexed because the embedding queue was full")
+MEMORY_SEARCH = registry.histogram(
+    "zeno_memory_search_seconds", "Time to search the memory index", buckets=GAP_BUCKETS)
+
+# Characters of a message sent to the embedding model
+EMBED_MAX_CHARS = 4000
+INDEXED_ROLES = ("user", "assistant")
+
+
+class MemoryService:
+    """Embeds saved messages in the background and recalls similar ones
+    
+    remember() only queues the message, so saving never waits on Ollama.
+    A single task embeds queued messages through the embeddings endpoint
+    and appends them to the MemoryIndex; recall() embeds the query and
+    returns the closest messages from other conversations.
+    """
+    
+    def __init__(self, ollama_service=None, path: Optional[Path] = None):
+        self.ollama_service = ollama_service
+        self.enabled = settings.MEMORY_ENABLED
+        self.model = settings.MEMORY_EMBEDDING_MODEL
+        self.top_k = settings.MEMORY_TOP_K
+        self.min_score = settings.MEMORY_MIN_SCORE
+        self.min_chars = settings.MEMORY_MIN_CHARS
+        self.index = MemoryIndex(
+            path or settings.DATA_DIR / "memory",
+            ivf_min_vectors=settings.MEMORY_IVF_MIN_VECTORS,
+            ivf_probes=settings.MEMORY_IVF_PROBES,
+        )
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=settings.MEMORY_QUEUE_SIZE)
+        self._task: Optional[asyncio.Task] = None
+        self._training: Optional[asyncio.Task] = None
+        self._ready = False
+        self.dropped = 0
+    
+    async def start(self):
+        """Open the index and start embedding queued messages"""
+        if not self.enabled:
+            return
+        try:
+            await asyncio.to_thread(self.index.open, self.model)
+        except Exception as e:
+            print(f"[Memory] Could not open memory index: {e}")
+            return
+        self._ready = True
+        MEMORY_VECTORS.set(self.index.live_count)
+        if self._task is None:
+            self._task = asyncio.create_task(self._embed_loop())
+        self._maybe_train()
+    
+    async def close(self):
+        self._ready = False
+        for task in (self._task, self._training):
+            if task is not None:
+                task.cancel()
+        self._task = self._training = None
+        await asyncio.to_thread(self.index.close)
+    
+    def remember(self, message_id: str, conversation_id: str, role: str, content: str):
+        """Queue a saved message for embedding; never blocks"""
+        if not self._ready or role not in INDEXED_ROLES or not message_id or not conversation_id:
+            return
+        if not content or len(content.strip()) < self.min_chars:
+            return
+        try:
+            self._queue.put_nowait((message_id, conversation_id, role, content))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            MEMORY_DROPPED.inc()
+            return
+        MEMORY_PENDING.set(self._queue.qsize())
+    
+    async def _embed_loop(self):
+        while True:
+            message_id, conversation_id, role, content = await self._queue.get()
+            MEMORY_PENDING.set(self._queue.qsize())
+            try:
+                # Clients re-save messages when they edit or resend them
+                if await asyncio.to_thread(self.index.contains, message_id, content):
+                    continue
+                vector = await self.ollama_service.embed(content[:EMBED_MAX_CHARS], self.model)
+                if not vector:
+                    continue
+                await asyncio.to_thread(self.index.add, message_id, conversation_id, role, content, vector)
+                MEMORY_VECTORS.set(self.index.live_count)
+                self._maybe_train()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Memory] Failed to index message {message_id}: {e}")
+            finally:
+                self._queue.task_done()
+    
+    def _maybe_train(self):
+        """Rebuild the IVF lists in a worker thread once the index has grown enough"""
+        if self._training is None and self.index.needs_training():
+            self._training = asyncio.create_task(self._train())
+    
+    async def _train(self):
+        try:
+            await asyncio.to_thread(self.index.train)
+        except Exception as e:
+            print(f"[Memory] Failed to build IVF index: {e}")
+        finally:
+            self._training = None
+    
+    async def forget_conversation(self, conversation_id: str):
+        if not self._ready or not conversation_id:
+            return
+        await asyncio.to_thread(self.index.remove_conversation, conversation_id)
+        MEMORY_VECTORS.set(self.index.live_count)
+    
+    async def recall(self, text: str, exclude_conversation: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Messages from other conversations similar to text, best first"""
+        if not self._ready or not text.strip() or not self.index.live_count:
+            return []
+        try:
+            vector = await self.ollama_service.embed(text[:EMBED_MAX_CHARS], self.model)
+        except Exception as e:
+            print(f"[Memory] Recall skipped: {e}")
+            return []
+        started = time.perf_counter()
+        hits = await asyncio.to_thread(self.index.search, vector, self.top_k, exclude_conversation)
+        MEMORY_SEARCH.observe(time.perf_counter() - started)
+        return [hit for hit in hits if hit["score"] >= self.min_score]
+    
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "ready": self._ready,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+            **self.index.stats(),
+        }
@@ -0,0 +1,331 @@
+"""In-process metrics with Prometheus text exposition"""
+import abc
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+GAP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+RATE_BUCKETS = (1, 2.5, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    """Base class for a labelled metric family"""
+    
+    kind = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def _labels(self, key: Tuple[str, ...], extra: Sequence[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+    
+    def _header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+    
+    @abc.abstractmethod
+    def render(self) -> List[str]:
+        """Exposition lines for this family, header first"""
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+    
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{self._labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    
+    kind = "gauge"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+    
+    def reset(self):
+        """Drop every labelled value"""
+        with self._lock:
+            self._values.clear()
+    
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+    
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{self._labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed histogram"""
+    
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * len(self.buckets)
+                self._sums[key] = 0.0
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] += value
+    
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+    
+    def sum(self, **labels) -> float:
+        return self._sums.get(self._key(labels), 0.0)
+    
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            for key in sorted(self._counts):
+                cumulative = 0
+                for bound, count in zip(self.buckets, self._counts[key]):
+                    cumulative += count
+                    labels = self._labels(key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(self._sums[key])}")
+                lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metric families rendered together on /metrics"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+    
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+    
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+    
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+    
+    def render(self) -> str:
+        """Render all metrics in Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# Chat streaming metrics
+CHAT_REQUESTS = registry.counter(
+    "zeno_chat_requests_total", "Chat requests handled", ["model", "status"])
+CHAT_QUEUE_WAIT = registry.histogram(
+    "zeno_chat_queue_wait_seconds", "Time from message receipt to upstream request", ["model"])
+CHAT_FIRST_CHUNK = registry.histogram(
+    "zeno_chat_time_to_first_chunk_seconds", "Time from message receipt to first streamed chunk", ["model"])
+CHAT_CHUNK_GAP = registry.histogram(
+    "zeno_chat_inter_chunk_gap_seconds", "Gap between consecutive streamed chunks", ["model"],
+    buckets=GAP_BUCKETS)
+CHAT_DURATION = registry.histogram(
+    "zeno_chat_duration_seconds", "Total chat request duration", ["model"])
+CHAT_CHUNKS = registry.counter(
+    "zeno_chat_chunks_total", "Chunks streamed to clients", ["model"])
+CHAT_TOKENS = registry.counter(
+    "zeno_chat_tokens_total", "Tokens generated (Ollama eval_count, or chunks when absent)", ["model"])
+CHAT_TOKENS_PER_SECOND = registry.histogram(
+    "zeno_chat_tokens_per_second", "Tokens per second observed by the backend", ["model"],
+    buckets=RATE_BUCKETS)
+
+# Ollama's own timings from the final done frame
+OLLAMA_EVAL_DURATION = registry.histogram(
+    "zeno_ollama_eval_duration_seconds", "Ollama eval_duration", ["model"])
+OLLAMA_PROMPT_EVAL_DURATION = registry.histogram(
+    "zeno_ollama_prompt_eval_duration_seconds", "Ollama prompt_eval_duration", ["model"])
+OLLAMA_LOAD_DURATION = registry.histogram(
+    "zeno_ollama_load_duration_seconds", "Ollama load_duration", ["model"])
+OLLAMA_EVAL_TOKENS = registry.counter(
+    "zeno_ollama_eval_tokens_total", "Ollama eval_count", ["model"])
+OLLAMA_PROMPT_EVAL_TOKENS = registry.counter(
+    "zeno_ollama_prompt_eval_tokens_total", "Ollama prompt_eval_count", ["model"])
+OLLAMA_TOKENS_PER_SECOND = registry.histogram(
+    "zeno_ollama_tokens_per_second", "eval_count / eval_duration reported by Ollama", ["model"],
+    buckets=RATE_BUCKETS)
+
+
+# Label for chats naming a model Ollama doesn't have; the name comes from the
+# client, so using it as a label would let any client mint new series
+OTHER_MODEL = "other"
+
+
+class ChatMetrics:
+    """Timing for a single chat stream, recorded into the registry on finish()
+    
+    ``known`` says whether the model is in Ollama's model list; unknown
+    models are recorded under the "other" label.
+    """
+    
+    def __init__(self, model: str, received_at: Optional[float] = None, known: bool = False):
+        self.model = model if known else OTHER_MODEL
+        self.received_at = received_at if received_at is not None else time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.first_chunk_at: Optional[float] = None
+        self.last_chunk_at: Optional[float] = None
+        self.chunks = 0
+        # Filled by OllamaService.chat_stream from the final done frame
+        self.ollama_stats: Dict[str, Any] = {}
+        self.summary: Optional[Dict[str, Any]] = None
+    
+    def start(self):
+        """Mark the moment the upstream request is issued"""
+        self.started_at = time.perf_counter()
+        CHAT_QUEUE_WAIT.observe(self.started_at - self.received_at, model=self.model)
+    
+    def chunk(self):
+        """Record one chunk forwarded to the client"""
+        now = time.perf_counter()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+            CHAT_FIRST_CHUNK.observe(now - self.received_at, model=self.model)
+        else:
+            CHAT_CHUNK_GAP.observe(now - self.last_chunk_at, model=self.model)
+        self.last_chunk_at = now
+        self.chunks += 1
+    
+    def finish(self, status: str = "ok") -> Dict[str, Any]:
+        """Record totals and return a summary of this request"""
+        if self.summary is not None:
+            return self.summary
+        now = time.perf_counter()
+        model = self.model
+        CHAT_REQUESTS.inc(model=model, status=status)
+        CHAT_DURATION.observe(now - self.received_at, model=model)
+        CHAT_CHUNKS.inc(self.chunks, model=model)
+        
+        tokens = self.ollama_stats.get("eval_count", self.chunks)
+        CHAT_TOKENS.inc(tokens, model=model)
+        
+        tokens_per_second = None
+        # The first token arrives at the start of the interval, so it isn't counted
+        if self.first_chunk_at is not None and self.last_chunk_at > self.first_chunk_at and tokens > 1:
+            tokens_per_second = (tokens - 1) / (self.last_chunk_at - self.first_chunk_at)
+            CHAT_TOKENS_PER_SECOND.observe(tokens_per_second, model=model)
+        
+        stats = self.ollama_stats
+        if "eval_count" in stats:
+            OLLAMA_EVAL_TOKENS.inc(stats["eval_count"], model=model)
+        if "prompt_eval_count" in stats:
+            OLLAMA_PROMPT_EVAL_TOKENS.inc(stats["prompt_eval_count"], model=model)
+        if "eval_duration" in stats:
+            OLLAMA_EVAL_DURATION.observe(stats["eval_duration"] / 1e9, model=model)
+            if stats["eval_duration"] and "eval_count" in stats:
+                OLLAMA_TOKENS_PER_SECOND.observe(
+                    stats["eval_count"] / (stats["eval_duration"] / 1e9), model=model)
+        if "prompt_eval_duration" in stats:
+            OLLAMA_PROMPT_EVAL_DURATION.observe(stats["prompt_eval_duration"] / 1e9, model=model)
+        if "load_duration" in stats:
+            OLLAMA_LOAD_DURATION.observe(stats["load_duration"] / 1e9, model=model)
+        
+        self.summary = {
+            "status": status,
+            "chunks": self.chunks,
+            "tokens": tokens,
+            "queue_wait": (self.started_at - self.received_at) if self.started_at else None,
+            "time_to_first_chunk": (self.first_chunk_at - self.received_at) if self.first_chunk_at else None,
+            "tokens_per_second": tokens_per_second,
+            "duration": now - self.received_at,
+        }
+        return self.summary
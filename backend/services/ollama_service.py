@@ -1,84 +1,389 @@
+import asyncio
 import httpx
-import json
-from typing import List, Dict, Any, AsyncGenerator
+import time
+from typing import List, Dict, Any, AsyncGenerator, Optional
 from config import settings
+from services import json_codec
+from services.metrics import registry
+from services.ollama_upstreams import Upstream, UpstreamPool
+
+
+# Timing fields Ollama reports on the final "done" frame
+OLLAMA_STATS_FIELDS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+)
+
+
+MODEL_LOADED = registry.gauge(
+    "zeno_ollama_model_loaded", "1 if Ollama reports the model as resident (/api/ps)", ["model"])
+
+MODELS_CACHE = registry.counter(
+    "zeno_ollama_models_cache_total", "Model list lookups by cache result", ["result"])
+MODELS_FETCHES = registry.counter(
+    "zeno_ollama_models_fetches_total", "Requests made to /api/tags")
+
+
+def _http2_available() -> bool:
+    """HTTP/2 support in httpx needs the optional h2 package"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
 
 
 class OllamaService:
-    """Service for interacting with Ollama API"""
+    """Service for interacting with Ollama API
+    
+    Requests are spread over OLLAMA_UPSTREAMS (or just OLLAMA_BASE_URL).
+    A chat that fails before its first token is retried on the next host.
+    """
+    
+    # How long a failed connectivity check is trusted before probing again
+    FAILURE_TTL = 5.0
     
     def __init__(self):
-        self.base_url = settings.OLLAMA_BASE_URL
-        self.timeout = httpx.Timeout(120.0, connect=10.0)
+        urls = settings.OLLAMA_UPSTREAMS or [settings.OLLAMA_BASE_URL]
+        self.base_url = urls[0]
+        self.timeout = httpx.Timeout(
+            settings.OLLAMA_CHAT_TIMEOUT,
+            connect=settings.OLLAMA_CONNECT_TIMEOUT,
+        )
+        self.probe_timeout = httpx.Timeout(
+            settings.OLLAMA_PROBE_TIMEOUT,
+            connect=settings.OLLAMA_CONNECT_TIMEOUT,
+        )
+        self.limits = httpx.Limits(
+            max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OLLAMA_KEEPALIVE_EXPIRY,
+        )
+        self.http2 = settings.OLLAMA_HTTP2 and _http2_available()
+        self.upstreams = UpstreamPool(urls, self._make_client, settings.OLLAMA_UPSTREAM_RETRY_SECONDS)
+        
+        # Options must stay identical between calls: a changed num_ctx makes Ollama reload the model
+        self.base_options = {"num_ctx": settings.MAX_CONTEXT_TOKENS}
+        self.system_prompt = settings.SYSTEM_PROMPT
+        # Models Ollama reports as resident, from /api/ps
+        self.loaded_models: Dict[str, Dict[str, Any]] = {}
+        self._residency_task: Optional[asyncio.Task] = None
+        
+        # Cached /api/tags result, which also serves as the connectivity state
+        self.models_ttl = settings.OLLAMA_MODELS_TTL_SECONDS
+        self.models_stale = settings.OLLAMA_MODELS_STALE_SECONDS
+        self._models: Optional[List[Dict[str, Any]]] = None
+        self._models_at = 0.0
+        self._models_fetch: Optional[asyncio.Task] = None
+        self.connected: Optional[bool] = None
+        self.connected_at = 0.0
+    
+    def _make_client(self, base_url: str) -> httpx.AsyncClient:
+        """Pooled client for one upstream, created lazily if start() was not called"""
+        return httpx.AsyncClient(
+            base_url=base_url,
+            timeout=self.timeout,
+            limits=self.limits,
+            http2=self.http2,
+        )
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Client of the first upstream"""
+        return self.upstreams.upstreams[0].client
+    
+    async def start(self):
+        """Open the shared HTTP clients and start tracking resident models"""
+        for upstream in self.upstreams:
+            _ = upstream.client
+        print(
+            f"[Ollama] HTTP client ready for {len(self.upstreams)} upstream(s) "
+            f"(max {self.limits.max_connections} connections each, http2={self.http2})"
+        )
+        if settings.OLLAMA_PS_REFRESH_SECONDS > 0 and self._residency_task is None:
+            self._residency_task = asyncio.create_task(self._track_loaded_models())
+    
+    async def _track_loaded_models(self):
+        while True:
+            await self.refresh_loaded_models()
+            # Keep the model list and connectivity state warm for /health
+            try:
+                await self.list_models()
+            except Exception:
+                pass
+            await asyncio.sleep(settings.OLLAMA_PS_REFRESH_SECONDS)
+    
+    async def close(self):
+        """Close the shared HTTP clients and their pooled connections"""
+        if self._residency_task is not None:
+            self._residency_task.cancel()
+            self._residency_task = None
+        for upstream in self.upstreams:
+            await upstream.close()
+        print("[Ollama] HTTP client closed")
+    
+    def keep_alive_for(self, model: str) -> str:
+        """How long Ollama should keep this model loaded after a request"""
+        return settings.OLLAMA_MODEL_KEEP_ALIVE.get(model, settings.OLLAMA_KEEP_ALIVE)
+    
+    def options_for(self, temperature: float) -> Dict[str, Any]:
+        return {**self.base_options, "temperature": temperature}
+    
+    def with_system_prompt(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Prepend the configured system prompt so every request shares the same prefix"""
+        if not self.system_prompt:
+            return messages
+        if messages and messages[0].get("role") == "system" and messages[0].get("content") == self.system_prompt:
+            return messages
+        return [{"role": "system", "content": self.system_prompt}] + list(messages)
+    
+    async def warm_up(self, model: str) -> bool:
+        """Load a model (and the system prompt prefix) on every upstream before the first user request"""
+        messages = self.with_system_prompt([])
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": False,
+            "keep_alive": self.keep_alive_for(model),
+            "options": {**self.options_for(0.0), "num_predict": 1} if messages else self.options_for(0.0),
+        }
+        
+        async def warm(upstream: Upstream) -> bool:
+            try:
+                response = await upstream.client.post("/api/chat", json=payload)
+                response.raise_for_status()
+                print(f"[Ollama] Warmed up {model} on {upstream.url} (keep_alive={payload['keep_alive']})")
+                return True
+            except Exception as e:
+                print(f"[Ollama] Warm-up of {model} on {upstream.url} failed: {e}")
+                return False
+        
+        results = await asyncio.gather(*(warm(upstream) for upstream in self.upstreams))
+        await self.refresh_loaded_models()
+        return any(results)
+    
+    async def refresh_loaded_models(self) -> Dict[str, Dict[str, Any]]:
+        """Update loaded_models from /api/ps on every upstream"""
+        async def refresh(upstream: Upstream) -> Optional[List[Dict[str, Any]]]:
+            try:
+                response = await upstream.client.get("/api/ps", timeout=self.probe_timeout)
+                response.raise_for_status()
+                models = response.json().get("models", [])
+            except Exception as e:
+                print(f"[Ollama] Failed to list loaded models on {upstream.url}: {e}")
+                return None
+            upstream.loaded = {model["name"] for model in models if "name" in model}
+            return models
+        
+        results = await asyncio.gather(*(refresh(upstream) for upstream in self.upstreams))
+        if all(models is None for models in results):
+            return self.loaded_models
+        
+        self.loaded_models = {
+            model["name"]: model
+            for models in results if models
+            for model in models if "name" in model
+        }
+        MODEL_LOADED.reset()
+        for name in self.loaded_models:
+            MODEL_LOADED.set(1, model=name)
+        return self.loaded_models
+    
+    def is_model_loaded(self, model: str) -> bool:
+        # /api/ps reports names with a tag ("llama2:latest")
+        return model in self.loaded_models or f"{model}:latest" in self.loaded_models
     
     async def is_connected(self) -> bool:
-        """Check if Ollama is accessible"""
+        """Check if Ollama is accessible, answering from the cached state when it is fresh"""
+        if self.connected is not None:
+            ttl = self.models_ttl if self.connected else self.FAILURE_TTL
+            if time.monotonic() - self.connected_at < ttl:
+                return self.connected
+        
         try:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, connect=5.0)) as client:
-                response = await client.get(f"{self.base_url}/api/tags")
-                return response.status_code == 200
+            await self._fetch_models_shared()
+            return True
         except Exception as e:
             print(f"[Ollama] Connection check failed: {e}")
             return False
     
-    async def list_models(self) -> List[Dict[str, Any]]:
-        """List available Ollama models"""
+    async def list_models(self, force_refresh: bool = False) -> List[Dict[str, Any]]:
+        """List available Ollama models
+        
+        Results are cached for OLLAMA_MODELS_TTL_SECONDS. After that the
+        stale list is still returned for up to OLLAMA_MODELS_STALE_SECONDS
+        while a background refresh runs. Concurrent callers share a single
+        in-flight /api/tags request.
+        """
         try:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, connect=5.0)) as client:
-                response = await client.get(f"{self.base_url}/api/tags")
-                response.raise_for_status()
-                data = response.json()
-                return data.get("models", [])
+            if not force_refresh and self._models is not None:
+                age = time.monotonic() - self._models_at
+                if age < self.models_ttl:
+                    MODELS_CACHE.inc(result="fresh")
+                    return list(self._models)
+                if age < self.models_ttl + self.models_stale:
+                    MODELS_CACHE.inc(result="stale")
+                    self._start_models_fetch()
+                    return list(self._models)
+            
+            MODELS_CACHE.inc(result="miss")
+            return list(await self._fetch_models_shared())
         except Exception as e:
             raise Exception(f"Failed to list models: {str(e)}")
     
+    async def has_model(self, model: str) -> bool:
+        """Whether the (cached) model list has this model, with or without the :latest tag"""
+        names = {item.get("name") for item in await self.list_models()}
+        return model in names or f"{model}:latest" in names
+    
+    def invalidate_models(self):
+        """Forget the cached model list, e.g. after a model was pulled or deleted"""
+        self._models = None
+        self._models_at = 0.0
+    
+    async def _fetch_models_shared(self) -> List[Dict[str, Any]]:
+        # Shield so a cancelled caller doesn't abort the fetch other callers are waiting on
+        return await asyncio.shield(self._start_models_fetch())
+    
+    def _start_models_fetch(self) -> asyncio.Task:
+        """Return the in-flight /api/tags fetch, starting one if none is running"""
+        if self._models_fetch is None or self._models_fetch.done():
+            self._models_fetch = asyncio.create_task(self._fetch_models())
+            # Background revalidations may have no awaiter; don't leave exceptions unretrieved
+            self._models_fetch.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return self._models_fetch
+    
+    async def _fetch_models(self) -> List[Dict[str, Any]]:
+        """Fetch /api/tags from every upstream and merge the lists by name"""
+        MODELS_FETCHES.inc()
+        
+        async def fetch(upstream: Upstream) -> List[Dict[str, Any]]:
+            try:
+                response = await upstream.client.get("/api/tags", timeout=self.probe_timeout)
+                response.raise_for_status()
+                models = response.json().get("models", [])
+            except Exception:
+                upstream.mark_failure()
+                raise
+            upstream.models = {model["name"] for model in models if "name" in model}
+            if upstream.failed_at is not None:
+                upstream.mark_success()
+            return models
+        
+        results = await asyncio.gather(*(fetch(upstream) for upstream in self.upstreams), return_exceptions=True)
+        if all(isinstance(result, BaseException) for result in results):
+            self.connected, self.connected_at = False, time.monotonic()
+            raise results[0]
+        
+        models, seen = [], set()
+        for result in results:
+            if isinstance(result, BaseException):
+                continue
+            for model in result:
+                name = model.get("name")
+                if name not in seen:
+                    seen.add(name)
+                    models.append(model)
+        
+        now = time.monotonic()
+        self._models, self._models_at = models, now
+        self.connected, self.connected_at = True, now
+        return models
+    
     async def chat_stream(
         self,
         messages: List[Dict[str, str]],
         model: str,
         temperature: float = 0.7,
+        stats: Optional[Dict[str, Any]] = None,
     ) -> AsyncGenerator[str, None]:
-        """Stream chat responses from Ollama"""
+        """Stream chat responses from Ollama
+        
+        If ``stats`` is given it is filled with Ollama's timing fields from
+        the final frame (durations are in nanoseconds). Connection errors,
+        5xx responses and a missing model move on to the next upstream as
+        long as nothing has been yielded yet.
+        """
         try:
+            messages = self.with_system_prompt(messages)
             payload = {
                 "model": model,
                 "messages": messages,
                 "stream": True,
-                "options": {
-                    "temperature": temperature,
-                    "num_ctx": settings.MAX_CONTEXT_TOKENS,
-                },
+                "keep_alive": self.keep_alive_for(model),
+                "options": self.options_for(temperature),
             }
-            print(f"[Ollama] Sending request to {self.base_url}/api/chat")
-            print(f"[Ollama] Model: {model}, Messages: {len(messages)}")
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/api/chat",
-                    json=payload,
-                ) as response:
-                    if response.status_code != 200:
-                        error_text = await response.aread()
-                        print(f"[Ollama Error] Status: {response.status_code}, Body: {error_text.decode()}")
-                        raise Exception(f"Ollama API error {response.status_code}: {error_text.decode()}")
-                    
-                    async for line in response.aiter_lines():
-                        if line.strip():
-                            try:
-                                data = json.loads(line)
-                                if "message" in data:
-                                    content = data["message"].get("content", "")
-                                    if content:
-                                        yield content
+            candidates = self.upstreams.route(model)
+            for attempt, upstream in enumerate(candidates, 1):
+                last = attempt == len(candidates)
+                print(f"[Ollama] Sending request to {upstream.url}/api/chat")
+                print(f"[Ollama] Model: {model}, Messages: {len(messages)}")
+                
+                started = time.perf_counter()
+                first_token = True
+                upstream.begin()
+                try:
+                    async with upstream.client.stream(
+                        "POST",
+                        "/api/chat",
+                        json=payload,
+                    ) as response:
+                        if response.status_code != 200:
+                            error_text = (await response.aread()).decode()
+                            print(f"[Ollama Error] {upstream.url} Status: {response.status_code}, Body: {error_text}")
+                            retryable = response.status_code == 404 or response.status_code >= 500
+                            if response.status_code == 404:
+                                # Model missing upstream: the cached model list is out of date
+                                upstream.forget_model(model)
+                                self.invalidate_models()
+                            elif response.status_code >= 500:
+                                upstream.mark_failure()
+                            if last or not retryable:
+                                raise Exception(f"Ollama API error {response.status_code}: {error_text}")
+                            continue
+                        
+                        async for line in response.aiter_lines():
+                            if line.strip():
+                                try:
+                                    data = json_codec.loads(line)
+                                    if "message" in data:
+                                        content = data["message"].get("content", "")
+                                        if content:
+                                            if first_token:
+                                                upstream.observe_first_token(time.perf_counter() - started)
+                                                first_token = False
+                                            yield content
+                                    
+                                    # Check if done
+                                    if data.get("done", False):
+                                        if stats is not None:
+                                            stats.update({
+                                                field: data[field]
+                                                for field in OLLAMA_STATS_FIELDS
+                                                if field in data
+                                            })
+                                        break
                                 
-                                # Check if done
-                                if data.get("done", False):
-                                    break
-                            
-                            except Exception as e:
-                                print(f"[Ollama] Error parsing line: {e}, Line: {line}")
-                                continue
+                                except Exception as e:
+                                    print(f"[Ollama] Error parsing line: {e}, Line: {line}")
+                                    continue
+                    
+                    upstream.mark_success()
+                    return
+                
+                except httpx.RequestError as e:
+                    upstream.mark_failure()
+                    # Once tokens reached the client the request can't be replayed elsewhere
+                    if last or not first_token:
+                        raise
+                    print(f"[Ollama] {upstream.url} failed ({e}), trying next upstream")
+                finally:
+                    upstream.end()
         
         except httpx.HTTPStatusError as e:
             error_msg = f"Ollama API error: {e.response.status_code}"
@@ -93,6 +398,26 @@ class OllamaService:
             print(f"[Ollama Error] {error_msg}")
             raise Exception(error_msg)
     
+    async def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a non-streaming request, failing over between upstreams"""
+        candidates = self.upstreams.route(payload.get("model"))
+        for attempt, upstream in enumerate(candidates, 1):
+            upstream.begin()
+            try:
+                response = await upstream.client.post(path, json=payload)
+                if response.status_code >= 500 and attempt < len(candidates):
+                    upstream.mark_failure()
+                    continue
+                response.raise_for_status()
+                upstream.mark_success()
+                return response.json()
+            except httpx.RequestError:
+                upstream.mark_failure()
+                if attempt == len(candidates):
+                    raise
+            finally:
+                upstream.end()
+    
     async def generate(
         self,
         prompt: str,
@@ -101,22 +426,31 @@ class OllamaService:
     ) -> str:
         """Generate a single response (non-streaming)"""
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": model,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": temperature,
-                            "num_ctx": settings.MAX_CONTEXT_TOKENS,
-                        },
-                    },
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("response", "")
+            payload = {
+                "model": model,
+                "prompt": prompt,
+                "stream": False,
+                "keep_alive": self.keep_alive_for(model),
+                "options": self.options_for(temperature),
+            }
+            if self.system_prompt:
+                payload["system"] = self.system_prompt
+            
+            data = await self._post("/api/generate", payload)
+            return data.get("response", "")
         
         except Exception as e:
             raise Exception(f"Generate error: {str(e)}")
+    
+    async def embed(self, text: str, model: str) -> List[float]:
+        """Return the embedding vector for text"""
+        try:
+            data = await self._post("/api/embeddings", {
+                "model": model,
+                "prompt": text,
+                "keep_alive": self.keep_alive_for(model),
+            })
+            return data.get("embedding", [])
+        
+        except Exception as e:
+            raise Exception(f"Embedding error: {str(e)}")
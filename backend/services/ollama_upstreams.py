@@ -0,0 +1,149 @@
+"""Routing across one or more Ollama hosts"""
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+import httpx
+
+from services.metrics import registry
+
+
+UPSTREAM_REQUESTS = registry.counter(
+    "zeno_ollama_upstream_requests_total", "Requests sent to each Ollama host by outcome", ["upstream", "status"])
+UPSTREAM_FIRST_TOKEN = registry.histogram(
+    "zeno_ollama_upstream_first_token_seconds", "Time to first streamed token per Ollama host", ["upstream"])
+UPSTREAM_OUTSTANDING = registry.gauge(
+    "zeno_ollama_upstream_outstanding", "Requests in flight per Ollama host", ["upstream"])
+UPSTREAM_HEALTHY = registry.gauge(
+    "zeno_ollama_upstream_healthy", "1 if the Ollama host is taking requests", ["upstream"])
+
+
+def model_names(model: str) -> Set[str]:
+    """Names Ollama may report for a model ("llama2" is listed as "llama2:latest")"""
+    return {model} if ":" in model else {model, f"{model}:latest"}
+
+
+class Upstream:
+    """One Ollama host with its own pooled client and routing state"""
+    
+    # Weight of the newest sample in the first-token latency average
+    LATENCY_ALPHA = 0.2
+    
+    def __init__(self, url: str, make_client: Callable[[str], httpx.AsyncClient], retry_after: float):
+        self.url = url
+        self.make_client = make_client
+        self.retry_after = retry_after
+        self._client: Optional[httpx.AsyncClient] = None
+        self.outstanding = 0
+        self.failures = 0
+        self.failed_at: Optional[float] = None
+        # From /api/tags and /api/ps; None until the first successful fetch
+        self.models: Optional[Set[str]] = None
+        self.loaded: Set[str] = set()
+        self.latency: Optional[float] = None
+        UPSTREAM_HEALTHY.set(1, upstream=url)
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self.make_client(self.url)
+        return self._client
+    
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+    
+    @property
+    def healthy(self) -> bool:
+        """False after a failure until retry_after has passed, then one request may probe it"""
+        return self.failed_at is None or time.monotonic() - self.failed_at >= self.retry_after
+    
+    def has_model(self, model: str) -> Optional[bool]:
+        if self.models is None:
+            return None
+        return bool(self.models & model_names(model))
+    
+    def has_loaded(self, model: str) -> bool:
+        return bool(self.loaded & model_names(model))
+    
+    def begin(self):
+        self.outstanding += 1
+        UPSTREAM_OUTSTANDING.set(self.outstanding, upstream=self.url)
+    
+    def end(self):
+        self.outstanding -= 1
+        UPSTREAM_OUTSTANDING.set(self.outstanding, upstream=self.url)
+    
+    def mark_success(self):
+        self.failures = 0
+        self.failed_at = None
+        UPSTREAM_REQUESTS.inc(upstream=self.url, status="ok")
+        UPSTREAM_HEALTHY.set(1, upstream=self.url)
+    
+    def mark_failure(self):
+        self.failures += 1
+        self.failed_at = time.monotonic()
+        UPSTREAM_REQUESTS.inc(upstream=self.url, status="error")
+        UPSTREAM_HEALTHY.set(0, upstream=self.url)
+    
+    def observe_first_token(self, seconds: float):
+        UPSTREAM_FIRST_TOKEN.observe(seconds, upstream=self.url)
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.LATENCY_ALPHA * (seconds - self.latency)
+    
+    def forget_model(self, model: str):
+        """The host answered 404 for this model"""
+        if self.models is not None:
+            self.models -= model_names(model)
+        self.loaded -= model_names(model)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+            "first_token_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "loaded_models": sorted(self.loaded),
+        }
+
+
+class UpstreamPool:
+    """Chooses which Ollama host serves a request
+    
+    Healthy hosts come first. Among them, hosts with the model already
+    loaded are preferred, then hosts that have it installed, then the
+    fewest requests in flight, then the lowest first-token latency.
+    Hosts known not to have the model are skipped unless none has it.
+    Unhealthy hosts are only tried after every healthy one.
+    """
+    
+    def __init__(self, urls: Iterable[str], make_client: Callable[[str], httpx.AsyncClient], retry_after: float):
+        self.upstreams = [Upstream(url.rstrip("/"), make_client, retry_after) for url in urls]
+        if not self.upstreams:
+            raise Exception("At least one Ollama URL is required")
+    
+    def __iter__(self):
+        return iter(self.upstreams)
+    
+    def __len__(self):
+        return len(self.upstreams)
+    
+    def route(self, model: Optional[str] = None) -> List[Upstream]:
+        """Upstreams to try for a request, best first"""
+        candidates = self.upstreams
+        if model:
+            with_model = [u for u in candidates if u.has_model(model) is not False]
+            candidates = with_model or candidates
+        
+        def rank(upstream: Upstream):
+            loaded = upstream.has_loaded(model) if model else False
+            installed = upstream.has_model(model) if model else None
+            latency = upstream.latency if upstream.latency is not None else 0.0
+            return (not upstream.healthy, not loaded, installed is not True, upstream.outstanding, latency)
+        
+        return sorted(candidates, key=rank)
+    
+    def stats(self) -> List[Dict[str, Any]]:
+        return [upstream.stats() for upstream in self.upstreams]
@@ -0,0 +1,287 @@
+"""Opt-in cache of chat responses for repeated prompts"""
+import asyncio
+import hashlib
+import json
+import math
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from config import settings
+from services.metrics import registry
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+CACHE_LOOKUPS = registry.counter(
+    "zeno_response_cache_lookups_total", "Response cache lookups by result", ["result"])
+CACHE_ENTRIES = registry.gauge(
+    "zeno_response_cache_entries", "Entries held in the response cache")
+
+# Seconds between writes of a changed cache to DATA_DIR
+SAVE_INTERVAL = 60
+
+_WHITESPACE = re.compile(r"\s+")
+_REPLAY_PIECE = re.compile(r"\S+\s*|\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    context_key: str
+    response: str
+    created_at: float
+    embedding: Optional[List[float]] = None
+    
+    @property
+    def size(self) -> int:
+        return len(self.response.encode("utf-8")) + 8 * len(self.embedding or ())
+
+
+@dataclass
+class CacheLookup:
+    """Result of a lookup; pass it back to store() on a miss"""
+    key: str
+    context_key: str
+    response: Optional[str] = None
+    embedding: Optional[List[float]] = field(default=None, repr=False)
+    
+    @property
+    def hit(self) -> bool:
+        return self.response is not None
+
+
+class ResponseCache:
+    """LRU cache of chat responses keyed by (model, normalized messages, temperature)
+    
+    Exact matches are checked first. With semantic matching enabled, the
+    last user message is embedded through Ollama and compared against
+    entries with the same model, temperature and earlier messages; a
+    cosine similarity above the threshold counts as a hit. With numpy the
+    candidates are scored with one matrix-vector product, so the scan does
+    not hold up the event loop. Entries expire after
+    RESPONSE_CACHE_TTL_SECONDS and persist to DATA_DIR.
+    """
+    
+    def __init__(self, ollama_service=None, path: Optional[Path] = None):
+        self.ollama_service = ollama_service
+        self.enabled = settings.RESPONSE_CACHE_ENABLED
+        self.semantic = settings.RESPONSE_CACHE_SEMANTIC
+        self.similarity = settings.RESPONSE_CACHE_SIMILARITY
+        self.embedding_model = settings.RESPONSE_CACHE_EMBEDDING_MODEL
+        self.ttl = settings.RESPONSE_CACHE_TTL_SECONDS
+        self.max_entries = settings.RESPONSE_CACHE_MAX_ENTRIES
+        self.max_bytes = settings.RESPONSE_CACHE_MAX_BYTES
+        self.path = path or settings.DATA_DIR / "response_cache.json"
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # (context_key, dimensions) -> (entries, created_at, unit-length embedding matrix);
+        # built on first semantic lookup and dropped when that context changes (numpy only)
+        self._matrices: Dict[Tuple[str, int], Tuple[List[CacheEntry], Any, Any]] = {}
+        self._bytes = 0
+        self._dirty = False
+        self._save_lock = asyncio.Lock()
+        self._save_task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Load persisted entries and save changes periodically"""
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self.load)
+        if self._save_task is None:
+            self._save_task = asyncio.create_task(self._autosave())
+    
+    async def _autosave(self):
+        while True:
+            await asyncio.sleep(SAVE_INTERVAL)
+            try:
+                await self.save()
+            except Exception as e:
+                print(f"[Cache] Failed to save response cache: {e}")
+    
+    async def close(self):
+        """Stop the autosave loop and write any unsaved entries"""
+        if self._save_task is not None:
+            self._save_task.cancel()
+            self._save_task = None
+        if self.enabled:
+            try:
+                await self.save()
+            except Exception as e:
+                print(f"[Cache] Failed to save response cache: {e}")
+    
+    @staticmethod
+    def _keys(model: str, messages: List[Dict[str, str]], temperature: float):
+        normalized = [[m.get("role", "user"), normalize_text(m.get("content", ""))] for m in messages]
+        key = _digest([model, round(temperature, 3), normalized])
+        context_key = _digest([model, round(temperature, 3), normalized[:-1]])
+        return key, context_key
+    
+    async def lookup(self, model: str, messages: List[Dict[str, str]], temperature: float) -> CacheLookup:
+        """Find a cached response for this request"""
+        key, context_key = self._keys(model, messages, temperature)
+        lookup = CacheLookup(key, context_key)
+        
+        entry = self._entries.get(key)
+        if entry and self._fresh(entry):
+            self._entries.move_to_end(key)
+            lookup.response = entry.response
+            CACHE_LOOKUPS.inc(result="exact")
+            return lookup
+        
+        if self.semantic and messages and messages[-1].get("role") == "user":
+            lookup.embedding = await self._embed(messages[-1].get("content", ""))
+            match = self._nearest(context_key, lookup.embedding)
+            if match:
+                self._entries.move_to_end(match.key)
+                lookup.response = match.response
+                CACHE_LOOKUPS.inc(result="semantic")
+                return lookup
+        
+        CACHE_LOOKUPS.inc(result="miss")
+        return lookup
+    
+    def store(self, lookup: CacheLookup, response: str):
+        """Cache the response produced after a miss"""
+        if lookup.hit or not response:
+            return
+        self._remove(lookup.key)
+        entry = CacheEntry(lookup.key, lookup.context_key, response, time.time(), lookup.embedding)
+        self._entries[entry.key] = entry
+        self._forget_matrix(entry.context_key)
+        self._bytes += entry.size
+        self._evict()
+        self._dirty = True
+    
+    async def replay(self, response: str) -> AsyncGenerator[str, None]:
+        """Yield a cached response in word-sized chunks, like a live stream"""
+        for piece in _REPLAY_PIECE.findall(response):
+            yield piece
+            await asyncio.sleep(0)
+    
+    def _fresh(self, entry: CacheEntry) -> bool:
+        if self.ttl and time.time() - entry.created_at > self.ttl:
+            self._remove(entry.key)
+            return False
+        return True
+    
+    def _nearest(self, context_key: str, embedding: Optional[List[float]]) -> Optional[CacheEntry]:
+        if not embedding:
+            return None
+        if np is not None:
+            return self._nearest_numpy(context_key, embedding)
+        
+        best, best_score = None, self.similarity
+        for entry in list(self._entries.values()):
+            if entry.context_key != context_key or not entry.embedding or not self._fresh(entry):
+                continue
+            score = _cosine(embedding, entry.embedding)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+    
+    def _nearest_numpy(self, context_key: str, embedding: List[float]) -> Optional[CacheEntry]:
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if not norm:
+            return None
+        
+        key = (context_key, len(embedding))
+        if key not in self._matrices:
+            entries = [
+                entry for entry in self._entries.values()
+                if entry.context_key == context_key and entry.embedding and len(entry.embedding) == len(embedding)
+            ]
+            if not entries:
+                return None
+            matrix = np.asarray([entry.embedding for entry in entries], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms > 0, norms, 1)
+            created = np.asarray([entry.created_at for entry in entries])
+            self._matrices[key] = (entries, created, matrix)
+        entries, created, matrix = self._matrices[key]
+        
+        scores = matrix @ (query / norm)
+        if self.ttl:
+            # Expired entries can't match; they are removed when evicted or hit exactly
+            scores[created < time.time() - self.ttl] = -np.inf
+        best = int(np.argmax(scores))
+        return entries[best] if scores[best] >= self.similarity else None
+    
+    def _forget_matrix(self, context_key: str):
+        for key in [key for key in self._matrices if key[0] == context_key]:
+            del self._matrices[key]
+    
+    async def _embed(self, text: str) -> Optional[List[float]]:
+        if not self.ollama_service:
+            return None
+        try:
+            return await self.ollama_service.embed(normalize_text(text), self.embedding_model)
+        except Exception as e:
+            print(f"[Cache] Embedding failed, using exact matches only: {e}")
+            return None
+    
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._forget_matrix(entry.context_key)
+            self._bytes -= entry.size
+            self._dirty = True
+    
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._forget_matrix(entry.context_key)
+            self._bytes -= entry.size
+        CACHE_ENTRIES.set(len(self._entries))
+    
+    def load(self):
+        """Load persisted entries from DATA_DIR"""
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            for item in data.get("entries", []):
+                entry = CacheEntry(**item)
+                if self._fresh(entry):
+                    self._entries[entry.key] = entry
+                    self._forget_matrix(entry.context_key)
+                    self._bytes += entry.size
+            self._evict()
+            self._dirty = False
+            print(f"[Cache] Loaded {len(self._entries)} cached responses")
+        except Exception as e:
+            print(f"[Cache] Failed to load response cache: {e}")
+    
+    async def save(self):
+        """Write entries to DATA_DIR if anything changed"""
+        async with self._save_lock:
+            if not self._dirty:
+                return
+            entries = [entry.__dict__.copy() for entry in self._entries.values()]
+            self._dirty = False
+            await asyncio.to_thread(self._write, entries)
+    
+    def _write(self, entries: List[Dict[str, Any]]):
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"version": 1, "entries": entries}), encoding="utf-8")
+        tmp.replace(self.path)
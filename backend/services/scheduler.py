@@ -0,0 +1,211 @@
+"""Admission control for requests to Ollama"""
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from config import settings
+from services.metrics import registry
+
+
+# Lanes in the order they are served
+PRIORITIES = ("interactive", "background")
+
+SCHEDULER_QUEUED = registry.gauge(
+    "zeno_scheduler_queued_requests", "Requests waiting for an Ollama slot", ["model"])
+SCHEDULER_ACTIVE = registry.gauge(
+    "zeno_scheduler_active_requests", "Requests holding an Ollama slot", ["model"])
+SCHEDULER_REJECTED = registry.counter(
+    "zeno_scheduler_rejected_total", "Requests rejected because the queue was full", ["model"])
+SCHEDULER_WAIT = registry.histogram(
+    "zeno_scheduler_wait_seconds", "Time spent queued for an Ollama slot", ["model", "priority"])
+
+
+class SchedulerFull(Exception):
+    """Raised instead of queueing when the wait queue is at capacity"""
+
+
+class _Ticket:
+    def __init__(self, owner: Hashable, priority: str, on_position: Optional[Callable[[int], Awaitable[Any]]]):
+        self.owner = owner
+        self.priority = priority
+        self.on_position = on_position
+        self.position = 0
+        self.reported = 0
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Resolved when position changes, to wake the waiting coroutine
+        self.moved: Optional[asyncio.Future] = None
+    
+    def move(self, position: int):
+        self.position = position
+        if self.moved is not None and not self.moved.done():
+            self.moved.set_result(None)
+
+
+class _ModelQueue:
+    """Waiting tickets for one model: a lane per priority, a FIFO per owner within each lane"""
+    
+    def __init__(self):
+        self.active = 0
+        self.lanes: Dict[str, "OrderedDict[Hashable, Deque[_Ticket]]"] = {p: OrderedDict() for p in PRIORITIES}
+    
+    def __len__(self):
+        return sum(len(queue) for lane in self.lanes.values() for queue in lane.values())
+    
+    def push(self, ticket: _Ticket):
+        self.lanes[ticket.priority].setdefault(ticket.owner, deque()).append(ticket)
+    
+    def remove(self, ticket: _Ticket):
+        lane = self.lanes[ticket.priority]
+        queue = lane.get(ticket.owner)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del lane[ticket.owner]
+    
+    def pop(self) -> Optional[_Ticket]:
+        """Next ticket: highest lane first, round-robin across owners within it"""
+        for lane in self.lanes.values():
+            if lane:
+                owner, queue = next(iter(lane.items()))
+                ticket = queue.popleft()
+                del lane[owner]
+                if queue:
+                    # Owner goes to the back so others get a turn
+                    lane[owner] = queue
+                return ticket
+        return None
+    
+    def order(self) -> List[_Ticket]:
+        """Tickets in the order pop() would return them"""
+        ordered: List[_Ticket] = []
+        for lane in self.lanes.values():
+            queues = [list(queue) for queue in lane.values()]
+            for i in range(max((len(queue) for queue in queues), default=0)):
+                ordered.extend(queue[i] for queue in queues if i < len(queue))
+        return ordered
+
+
+class ChatScheduler:
+    """Limits concurrent Ollama requests per model and queues the rest
+    
+    Each model gets SCHEDULER_MAX_CONCURRENT_PER_MODEL slots (or the value
+    in SCHEDULER_MODEL_CONCURRENCY). Waiting requests are served by
+    priority lane, then round-robin across owners (client connections) so
+    one busy client cannot starve the others. When SCHEDULER_MAX_QUEUE
+    requests are already waiting, new ones fail at once with SchedulerFull.
+    """
+    
+    def __init__(self, max_per_model: Optional[int] = None, max_queue: Optional[int] = None):
+        self.max_per_model = max_per_model or settings.SCHEDULER_MAX_CONCURRENT_PER_MODEL
+        self.model_limits = settings.SCHEDULER_MODEL_CONCURRENCY
+        self.max_queue = settings.SCHEDULER_MAX_QUEUE if max_queue is None else max_queue
+        self._models: Dict[str, _ModelQueue] = {}
+    
+    def limit_for(self, model: str) -> int:
+        return self.model_limits.get(model, self.max_per_model)
+    
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._models.values())
+    
+    @asynccontextmanager
+    async def slot(
+        self,
+        model: str,
+        owner: Hashable,
+        priority: str = "interactive",
+        on_position: Optional[Callable[[int], Awaitable[Any]]] = None,
+    ) -> AsyncIterator[None]:
+        """Hold one of the model's slots for the duration of the block
+        
+        ``on_position`` is awaited with the 1-based queue position whenever
+        it changes while the request waits. It runs in the waiting request's
+        own task, so updates arrive in order and its errors end the wait.
+        """
+        await self.acquire(model, owner, priority, on_position)
+        try:
+            yield
+        finally:
+            self.release(model)
+    
+    async def acquire(
+        self,
+        model: str,
+        owner: Hashable,
+        priority: str = "interactive",
+        on_position: Optional[Callable[[int], Awaitable[Any]]] = None,
+    ):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        queue = self._models.setdefault(model, _ModelQueue())
+        
+        if queue.active < self.limit_for(model) and not len(queue):
+            queue.active += 1
+            SCHEDULER_ACTIVE.set(queue.active, model=model)
+            SCHEDULER_WAIT.observe(0.0, model=model, priority=priority)
+            return
+        
+        if self.queued >= self.max_queue:
+            SCHEDULER_REJECTED.inc(model=model)
+            raise SchedulerFull("Server busy: too many queued requests, try again later")
+        
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        ticket = _Ticket(owner, priority, on_position)
+        queue.push(ticket)
+        self._update(model)
+        try:
+            await self._wait(ticket)
+        except BaseException:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Admitted just as the waiter was cancelled: hand the slot on
+                self.release(model)
+            else:
+                ticket.future.cancel()
+                queue.remove(ticket)
+                self._update(model)
+            raise
+        SCHEDULER_WAIT.observe(loop.time() - queued_at, model=model, priority=priority)
+    
+    @staticmethod
+    async def _wait(ticket: _Ticket):
+        """Wait for admission, reporting each new position on the way"""
+        loop = asyncio.get_running_loop()
+        while not ticket.future.done():
+            if ticket.on_position and ticket.reported != ticket.position:
+                ticket.reported = ticket.position
+                await ticket.on_position(ticket.position)
+                continue
+            ticket.moved = loop.create_future()
+            await asyncio.wait((ticket.future, ticket.moved), return_when=asyncio.FIRST_COMPLETED)
+    
+    def release(self, model: str):
+        queue = self._models[model]
+        queue.active -= 1
+        while queue.active < self.limit_for(model):
+            ticket = queue.pop()
+            if ticket is None:
+                break
+            if ticket.future.done():
+                continue
+            queue.active += 1
+            ticket.future.set_result(None)
+        SCHEDULER_ACTIVE.set(queue.active, model=model)
+        self._update(model)
+        if not queue.active and not len(queue):
+            del self._models[model]
+    
+    def _update(self, model: str):
+        """Refresh the queue gauge and wake waiters whose position changed"""
+        queue = self._models[model]
+        SCHEDULER_QUEUED.set(len(queue), model=model)
+        for position, ticket in enumerate(queue.order(), 1):
+            if ticket.position != position:
+                ticket.move(position)
+    
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            model: {"active": queue.active, "queued": len(queue), "limit": self.limit_for(model)}
+            for model, queue in self._models.items()
+        }
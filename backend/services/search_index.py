@@ -0,0 +1,109 @@
+"""Local full-text index of saved messages (SQLite FTS5)
+
+Used for search when MySQL is not connected or cannot build a FULLTEXT
+index. Messages are indexed one by one as they are saved; a re-saved
+message replaces its text in place. All methods block and are called
+from a single worker thread.
+"""
+import contextlib
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS conversations (
+        id TEXT PRIMARY KEY,
+        title TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        rowid INTEGER PRIMARY KEY,
+        id TEXT NOT NULL UNIQUE,
+        conversation_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id)",
+    # Row ids match messages.rowid
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, tokenize = 'unicode61')",
+]
+
+
+def fts5_available() -> bool:
+    try:
+        with contextlib.closing(sqlite3.connect(":memory:")) as conn:
+            conn.execute("CREATE VIRTUAL TABLE probe USING fts5(x)")
+        return True
+    except sqlite3.Error:
+        return False
+
+
+class SearchIndex:
+    """FTS5 table of message text ranked with bm25"""
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+    
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        # One commit per saved message: WAL keeps that to an append without fsync
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        with self.conn:
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+    
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+    
+    def upsert_conversation(self, conversation_id: str, title: Optional[str]):
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO conversations (id, title) VALUES (?, ?)
+                ON CONFLICT (id) DO UPDATE SET title = excluded.title
+            """, (conversation_id, title))
+    
+    def upsert_message(self, message_id: str, conversation_id: str, role: str, content: str):
+        with self.conn:
+            row = self.conn.execute("SELECT rowid FROM messages WHERE id = ?", (message_id,)).fetchone()
+            if row:
+                self.conn.execute("UPDATE messages_fts SET content = ? WHERE rowid = ?", (content, row[0]))
+                return
+            cursor = self.conn.execute(
+                "INSERT INTO messages (id, conversation_id, role, created_at) VALUES (?, ?, ?, ?)",
+                (message_id, conversation_id, role, datetime.now().isoformat()),
+            )
+            self.conn.execute("INSERT INTO messages_fts (rowid, content) VALUES (?, ?)", (cursor.lastrowid, content))
+    
+    def delete_conversation(self, conversation_id: str):
+        with self.conn:
+            self.conn.execute("""
+                DELETE FROM messages_fts
+                WHERE rowid IN (SELECT rowid FROM messages WHERE conversation_id = ?)
+            """, (conversation_id,))
+            self.conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            self.conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+    
+    def search(self, expression: str, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        """Messages matching an FTS5 query, best bm25 rank first"""
+        rows = self.conn.execute("""
+            SELECT m.id, m.conversation_id, c.title, m.role, f.content, m.created_at, -f.rank AS score
+            FROM messages_fts f
+            JOIN messages m ON m.rowid = f.rowid
+            LEFT JOIN conversations c ON c.id = m.conversation_id
+            WHERE messages_fts MATCH ?
+            ORDER BY f.rank, m.rowid DESC
+            LIMIT ? OFFSET ?
+        """, (expression, limit, offset)).fetchall()
+        columns = ("id", "conversation_id", "title", "role", "content", "created_at", "score")
+        return [dict(zip(columns, row)) for row in rows]
+
@@ -0,0 +1,230 @@
+"""Full-text search over saved messages"""
+import asyncio
+import base64
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from services.metrics import registry
+from services.search_index import SearchIndex, fts5_available
+
+
+SEARCH_QUERIES = registry.counter(
+    "zeno_search_queries_total", "Message searches by backend", ["backend"])
+SEARCH_SECONDS = registry.histogram(
+    "zeno_search_seconds", "Time to run a message search", ["backend"])
+
+_TERM = re.compile(r"\w+")
+MAX_TERMS = 16
+DEFAULT_PAGE_SIZE = 20
+ELLIPSIS = "…"
+# InnoDB ignores shorter words (innodb_ft_min_token_size), so requiring one would match nothing
+MYSQL_MIN_TERM_LENGTH = 3
+
+
+def search_terms(query: str) -> Tuple[List[str], bool]:
+    """Lowercased distinct words of a query, and whether the last one is a prefix
+    
+    The last word counts as a prefix unless the query ends in whitespace,
+    so results follow the user while they type.
+    """
+    terms = list(dict.fromkeys(term.lower() for term in _TERM.findall(query)))[:MAX_TERMS]
+    return terms, bool(terms) and not query[-1:].isspace()
+
+
+def fts5_expression(terms: List[str], prefix: bool) -> str:
+    """All terms required; each is quoted so FTS5 operators in the query are literal"""
+    quoted = [f'"{term}"' for term in terms]
+    if prefix:
+        quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def mysql_expression(terms: List[str], prefix: bool) -> str:
+    """All terms required, in MATCH ... AGAINST boolean mode"""
+    required = []
+    for index, term in enumerate(terms):
+        if prefix and index == len(terms) - 1:
+            required.append(f"+{term}*")
+        elif len(term) >= MYSQL_MIN_TERM_LENGTH:
+            required.append(f"+{term}")
+    return " ".join(required)
+
+
+def _utf16_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def highlight(content: str, terms: List[str], prefix: bool, width: int) -> Tuple[str, List[List[int]]]:
+    """A snippet of about width characters around the first match, and the match ranges in it
+    
+    Ranges are [start, end) in UTF-16 code units, i.e. JavaScript string
+    indices, so the client can wrap them without reparsing the query.
+    """
+    words = sorted(terms, key=len, reverse=True)
+    alternatives = [re.escape(term) + (r"\w*" if prefix and term == terms[-1] else r"\b") for term in words]
+    pattern = re.compile(r"(?<!\w)(?:" + "|".join(alternatives) + ")", re.IGNORECASE)
+    
+    start, end = 0, len(content)
+    if len(content) > width:
+        first = pattern.search(content)
+        start = max(0, (first.start() if first else 0) - width // 4)
+        if start:
+            # Begin on a word boundary
+            space = content.find(" ", start, start + width // 4)
+            start = space + 1 if space != -1 else start
+        end = min(len(content), start + width)
+        if end < len(content):
+            space = content.rfind(" ", start + width // 2, end)
+            end = space if space != -1 else end
+    
+    snippet = content[start:end]
+    lead = ELLIPSIS if start else ""
+    ranges = []
+    for match in pattern.finditer(snippet):
+        begin = _utf16_length(lead + snippet[:match.start()])
+        ranges.append([begin, begin + _utf16_length(match.group())])
+    return lead + snippet + (ELLIPSIS if end < len(content) else ""), ranges
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return offset
+
+
+class SearchService:
+    """Ranked, paginated message search with highlighted snippets
+    
+    Uses the MySQL FULLTEXT index on messages.content when the database is
+    connected. Otherwise saved messages go into a local SQLite FTS5 index
+    in DATA_DIR as save_message runs, and searches are served from it.
+    """
+    
+    def __init__(self, db_service=None, path: Optional[Path] = None):
+        self.db_service = db_service
+        self.path = path or settings.DATA_DIR / "search.db"
+        self.max_page_size = settings.SEARCH_MAX_PAGE_SIZE
+        self.snippet_chars = settings.SEARCH_SNIPPET_CHARS
+        self.local: Optional[SearchIndex] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    @property
+    def uses_mysql(self) -> bool:
+        return bool(self.db_service and self.db_service.pool and self.db_service.fulltext)
+    
+    @property
+    def backend(self) -> Optional[str]:
+        if self.uses_mysql:
+            return "mysql"
+        return "sqlite" if self.local else None
+    
+    async def start(self):
+        """Open the local index when MySQL can't serve searches (call after the database connects)"""
+        if self.uses_mysql or not settings.SEARCH_LOCAL_INDEX:
+            return
+        if not fts5_available():
+            print("[Search] SQLite was built without FTS5; search is unavailable without MySQL")
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")
+        index = SearchIndex(self.path)
+        try:
+            await self._run(index.open)
+        except Exception as e:
+            print(f"[Search] Could not open local search index: {e}")
+            return
+        self.local = index
+        print(f"[Search] Using local index {self.path}")
+    
+    async def close(self):
+        if self.local is not None:
+            await self._run(self.local.close)
+            self.local = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+    
+    async def _run(self, func, *args):
+        """Run a blocking index call on the single search thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
+    async def index_conversation(self, conversation_id: str, title: Optional[str]):
+        if self.local is None or self.uses_mysql or not conversation_id:
+            return
+        try:
+            await self._run(self.local.upsert_conversation, conversation_id, title)
+        except Exception as e:
+            print(f"[Search] Failed to index conversation {conversation_id}: {e}")
+    
+    async def index_message(self, message_id: str, conversation_id: str, role: str, content: str):
+        """Add or replace a message in the local index (MySQL maintains its own)"""
+        if self.local is None or self.uses_mysql or not message_id or content is None:
+            return
+        try:
+            await self._run(self.local.upsert_message, message_id, conversation_id, role, content)
+        except Exception as e:
+            print(f"[Search] Failed to index message {message_id}: {e}")
+    
+    async def forget_conversation(self, conversation_id: str):
+        if self.local is None or not conversation_id:
+            return
+        try:
+            await self._run(self.local.delete_conversation, conversation_id)
+        except Exception as e:
+            print(f"[Search] Failed to remove conversation {conversation_id}: {e}")
+    
+    async def search(self, query: str, limit: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """One page of matches, best first, with ``next_cursor`` when more follow"""
+        backend = self.backend
+        if backend is None:
+            raise RuntimeError("Search not available")
+        offset = decode_cursor(cursor) if cursor else 0
+        page_size = max(1, min(int(limit or DEFAULT_PAGE_SIZE), self.max_page_size))
+        terms, prefix = search_terms(query or "")
+        if not terms:
+            return {"results": [], "next_cursor": None}
+        
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        if backend == "mysql":
+            expression = mysql_expression(terms, prefix)
+            rows = await self.db_service.search_messages(expression, page_size + 1, offset) if expression else []
+        else:
+            rows = await self._run(self.local.search, fts5_expression(terms, prefix), page_size + 1, offset)
+        SEARCH_SECONDS.observe(loop.time() - started, backend=backend)
+        SEARCH_QUERIES.inc(backend=backend)
+        
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor(offset + page_size)
+        
+        results = []
+        for row in rows:
+            snippet, ranges = highlight(row["content"], terms, prefix, self.snippet_chars)
+            results.append({
+                "messageId": row["id"],
+                "conversationId": row["conversation_id"],
+                "conversationTitle": row["title"],
+                "role": row["role"],
+                "snippet": snippet,
+                "highlights": ranges,
+                "score": row["score"],
+                "created_at": row["created_at"],
+            })
+        return {"results": results, "next_cursor": next_cursor}
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend}
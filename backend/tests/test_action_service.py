@@ -0,0 +1,234 @@
+import asyncio
+import os
+import sys
+import pytest
+from unittest.mock import MagicMock
+
+from services.action_service import ActionService
+
+posix_only = pytest.mark.skipif(os.name != "posix", reason="uses a POSIX shell")
+
+PYTHON = f'"{sys.executable}"'
+
+
+def make_service(timeout=5.0, max_concurrent=4, safe_dir=None):
+    service = ActionService(MagicMock())
+    if safe_dir is not None:
+        service.sandbox.SAFE_DIRECTORIES = [safe_dir]
+    service.timeout = timeout
+    service._slots = asyncio.Semaphore(max_concurrent)
+    return service
+
+
+@posix_only
+@pytest.mark.asyncio
+async def test_output_streams_before_exit():
+    """Test that output reaches the callback while the command is still running"""
+    service = make_service()
+    chunks = []
+    first_chunk = asyncio.Event()
+    
+    async def on_output(stream, text):
+        chunks.append((stream, text))
+        first_chunk.set()
+    
+    script = "import sys, time; print('first', flush=True); time.sleep(0.5); print('second')"
+    task = asyncio.create_task(service.execute_shell_command(f"{PYTHON} -c \"{script}\"", on_output))
+    await asyncio.wait_for(first_chunk.wait(), timeout=2.0)
+    assert not task.done()
+    
+    result = await task
+    assert result["success"]
+    assert result["output"] == "first\nsecond\n"
+    assert "".join(text for stream, text in chunks if stream == "stdout") == "first\nsecond\n"
+
+
+@posix_only
+@pytest.mark.asyncio
+async def test_failure_reports_stderr():
+    """Test that a non-zero exit returns stderr as the error"""
+    service = make_service()
+    result = await service.execute_shell_command("echo oops 1>&2; exit 3")
+    assert not result["success"]
+    assert result["error"] == "oops\n"
+
+
+@posix_only
+@pytest.mark.asyncio
+async def test_timeout_kills_process_group():
+    """Test that a timed-out command and its children are killed"""
+    service = make_service(timeout=0.3)
+    result = await asyncio.wait_for(service.execute_shell_command("sleep 30 & sleep 30"), timeout=5.0)
+    assert result == {"success": False, "error": "Command timeout (0.3s limit)"}
+
+
+@posix_only
+@pytest.mark.asyncio
+async def test_cancel_kills_process(tmp_path):
+    """Test that cancelling the action terminates the subprocess"""
+    service = make_service()
+    pid_file = tmp_path / "pid"
+    task = asyncio.create_task(service.execute_shell_command(f"echo $$ > {pid_file}; exec sleep 30"))
+    for _ in range(200):
+        if pid_file.exists() and pid_file.read_text().strip():
+            break
+        await asyncio.sleep(0.01)
+    pid = int(pid_file.read_text())
+    
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+@posix_only
+@pytest.mark.asyncio
+async def test_concurrency_cap():
+    """Test that no more than ACTION_MAX_CONCURRENT commands run at once"""
+    service = make_service(max_concurrent=1)
+    started = asyncio.get_running_loop().time()
+    await asyncio.gather(*(service.execute_shell_command("sleep 0.2") for _ in range(3)))
+    assert asyncio.get_running_loop().time() - started >= 0.6
+
+
+@posix_only
+@pytest.mark.asyncio
+async def test_output_kept_in_result_is_capped():
+    """Test that the result keeps at most ACTION_MAX_OUTPUT_BYTES while streaming all of it"""
+    service = make_service()
+    service.max_output = 100
+    streamed = []
+    
+    async def on_output(stream, text):
+        streamed.append(text)
+    
+    result = await service.execute_shell_command(f"{PYTHON} -c \"print('x' * 10000)\"", on_output)
+    assert result["truncated"]
+    assert len(result["output"]) == 100
+    assert len("".join(streamed)) == 10001
+
+
+@pytest.mark.asyncio
+async def test_file_read_streams_chunks(tmp_path):
+    """Test that reads arrive as several chunks and the result reports the range"""
+    service = make_service(safe_dir=tmp_path)
+    service.file_chunk_size = 1000
+    target = tmp_path / "notes.txt"
+    target.write_text("abcdefghij" * 500)
+    chunks = []
+    
+    async def on_output(stream, text):
+        chunks.append((stream, text))
+    
+    result = await service.execute_file_operation(f"read:{target}", on_output)
+    assert result["success"]
+    assert result["output"] == target.read_text()
+    assert result["bytes"] == result["size"] == 5000
+    assert len(chunks) == 5
+    assert {stream for stream, _ in chunks} == {"file"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_mmap", [False, True])
+async def test_file_read_byte_range(tmp_path, use_mmap):
+    """Test offset/length reads with and without mmap"""
+    service = make_service(safe_dir=tmp_path)
+    service.file_chunk_size = 7
+    service.mmap_threshold = 1 if use_mmap else 10 ** 9
+    target = tmp_path / "data.txt"
+    target.write_text("0123456789" * 10)
+    
+    result = await service.execute_file_operation(f"read:{target}", offset=15, length=20)
+    assert result["output"] == "56789012345678901234"
+    assert result["offset"] == 15
+    
+    # Ranges past the end are clipped
+    result = await service.execute_file_operation(f"read:{target}", offset=95, length=20)
+    assert result["output"] == "56789"
+
+
+@pytest.mark.asyncio
+async def test_file_size_limits(tmp_path):
+    """Test that oversized reads and writes are refused, but a range of a large file is not"""
+    service = make_service(safe_dir=tmp_path)
+    service.max_file_bytes = 100
+    target = tmp_path / "big.txt"
+    target.write_text("x" * 1000)
+    
+    result = await service.execute_file_operation(f"read:{target}")
+    assert not result["success"]
+    assert "byte limit" in result["error"]
+    
+    result = await service.execute_file_operation(f"read:{target}", offset=900, length=100)
+    assert result["success"]
+    assert result["output"] == "x" * 100
+    
+    result = await service.execute_file_operation(f"write:{target}:" + "y" * 101)
+    assert not result["success"]
+    assert target.read_text() == "x" * 1000
+
+
+@pytest.mark.asyncio
+async def test_file_write_and_patch(tmp_path):
+    """Test whole-file writes and in-place writes at an offset"""
+    service = make_service(safe_dir=tmp_path)
+    target = tmp_path / "out.txt"
+    
+    result = await service.execute_file_operation(f"write:{target}:hello world")
+    assert result["success"]
+    assert target.read_text() == "hello world"
+    
+    result = await service.execute_file_operation(f"write:{target}:WORLD", offset=6)
+    assert result["success"]
+    assert target.read_text() == "hello WORLD"
+    
+    # Writing exactly at the end appends; past the end or into a missing file is refused
+    result = await service.execute_file_operation(f"write:{target}:!", offset=11)
+    assert target.read_text() == "hello WORLD!"
+    result = await service.execute_file_operation(f"write:{target}:?", offset=20)
+    assert result == {"success": False, "error": "Offset 20 is past the end of the file (12 bytes)"}
+    missing = tmp_path / "missing.txt"
+    result = await service.execute_file_operation(f"write:{missing}:data", offset=4)
+    assert not result["success"]
+    assert not missing.exists()
+    
+    result = await service.execute_file_operation(f"read:{tmp_path.parent / 'elsewhere.txt'}")
+    assert result == {"success": False, "error": "Path blocked by security policy"}
+
+
+@pytest.mark.asyncio
+async def test_file_read_translates_newlines(tmp_path):
+    """Test that CRLF and CR line endings come back as \\n, as read_text() returned them"""
+    service = make_service(safe_dir=tmp_path)
+    service.file_chunk_size = 3
+    target = tmp_path / "windows.txt"
+    target.write_bytes(b"one\r\ntwo\r\nthree\rfour")
+    
+    result = await service.execute_file_operation(f"read:{target}")
+    assert result["output"] == "one\ntwo\nthree\nfour"
+    assert result["bytes"] == 20
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("offset, length", [(None, "ten"), (-1, None), (1.5, None), (True, None), ([], None)])
+async def test_file_range_must_be_integers(tmp_path, offset, length):
+    """Test that malformed offset/length fields get a clear error"""
+    service = make_service(safe_dir=tmp_path)
+    target = tmp_path / "data.txt"
+    target.write_text("0123456789")
+    
+    result = await service.execute_file_operation(f"read:{target}", offset=offset, length=length)
+    assert not result["success"]
+    assert "must be a non-negative integer" in result["error"]
+
+
+@pytest.mark.asyncio
+async def test_file_range_accepts_null_and_numeric_strings(tmp_path):
+    """Test that a null offset means the start of the file"""
+    service = make_service(safe_dir=tmp_path)
+    target = tmp_path / "data.txt"
+    target.write_text("0123456789")
+    
+    result = await service.execute_file_operation(f"read:{target}", offset=None, length="4")
+    assert result["output"] == "0123"
@@ -0,0 +1,108 @@
+import json
+import logging
+import queue
+
+from security.audit_logger import AUDIT_DROPPED, AuditLogger, BoundedQueueHandler
+
+
+def make_logger(monkeypatch, tmp_path, **overrides):
+    """Build an audit logger writing under tmp_path"""
+    monkeypatch.setattr("config.settings.LOG_DIR", tmp_path)
+    for name, value in overrides.items():
+        monkeypatch.setattr(f"config.settings.{name}", value)
+    return AuditLogger()
+
+
+def read_entries(tmp_path):
+    lines = []
+    for log_file in sorted(tmp_path.glob("audit_*.log")):
+        lines.extend(log_file.read_text().splitlines())
+    return [json.loads(line.split(" - INFO - ", 1)[1]) for line in lines]
+
+
+def make_record(n):
+    return logging.LogRecord("audit", logging.INFO, __file__, 0, "%s", (n,), None)
+
+
+def test_records_written_in_order_and_drained_on_close(monkeypatch, tmp_path):
+    """Test that every queued record reaches disk, in order, when the logger closes"""
+    audit = make_logger(monkeypatch, tmp_path, AUDIT_BATCH_SIZE=7)
+    
+    for i in range(500):
+        audit.log_action("chat_request", {"n": i})
+    audit.close()
+    
+    entries = read_entries(tmp_path)
+    assert [entry["data"]["n"] for entry in entries] == list(range(500))
+    assert entries[0]["action"] == "chat_request"
+    assert not audit.writer.is_alive()
+    
+    # Logging after close is a no-op rather than an error
+    audit.log_action("late", {})
+
+
+def test_flush_waits_for_writer(monkeypatch, tmp_path):
+    """Test that flush() returns once queued records are on disk"""
+    audit = make_logger(monkeypatch, tmp_path)
+    audit.log_action("settings_update", {"theme": "dark"})
+    audit.flush()
+    
+    assert read_entries(tmp_path)[0]["data"] == {"theme": "dark"}
+    audit.close()
+
+
+def test_drop_policy_counts_discarded_records():
+    """Test that a full queue drops records instead of blocking"""
+    records = queue.Queue(maxsize=2)
+    handler = BoundedQueueHandler(records, policy="drop")
+    before = AUDIT_DROPPED.value(reason="full")
+    
+    for i in range(5):
+        handler.emit(make_record(i))
+    
+    assert [records.get_nowait().args[0] for _ in range(2)] == [0, 1]
+    assert AUDIT_DROPPED.value(reason="full") - before == 3
+
+
+def test_sample_policy_keeps_one_in_n_under_pressure():
+    """Test that past the high-water mark only every Nth record is kept"""
+    records = queue.Queue(maxsize=100)
+    handler = BoundedQueueHandler(records, policy="sample", sample_rate=5)
+    for i in range(80):
+        handler.emit(make_record(i))
+    
+    for i in range(80, 90):
+        handler.emit(make_record(i))
+    
+    assert records.qsize() == 82
+
+
+def test_entries_serialized_on_caller_thread(monkeypatch, tmp_path):
+    """Test that odd values are stringified and a record that fails to format costs only itself"""
+    audit = make_logger(monkeypatch, tmp_path)
+    data = {"path": tmp_path}
+    audit.log_action("file_read", data)
+    data["path"] = "changed later"
+    before = AUDIT_DROPPED.value(reason="error")
+    audit.handler.emit(logging.LogRecord("audit", logging.INFO, __file__, 0, "%s %s", ("missing",), None))
+    audit.log_action("settings_update", {"theme": "dark"})
+    audit.flush()
+    
+    entries = read_entries(tmp_path)
+    assert [entry["action"] for entry in entries] == ["file_read", "settings_update"]
+    assert entries[0]["data"]["path"] == str(tmp_path)
+    assert AUDIT_DROPPED.value(reason="error") - before == 1
+    audit.close()
+
+
+def test_block_policy_gives_up_after_timeout():
+    """Test that a full queue under the block policy waits briefly, then drops"""
+    records = queue.Queue(maxsize=1)
+    handler = BoundedQueueHandler(records, policy="block", block_timeout=0.01)
+    before = AUDIT_DROPPED.value(reason="timeout")
+    
+    handler.emit(make_record(0))
+    handler.emit(make_record(1))
+    
+    assert records.get_nowait().args[0] == 0
+    assert AUDIT_DROPPED.value(reason="timeout") - before == 1
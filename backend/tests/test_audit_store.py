@@ -0,0 +1,132 @@
+import gzip
+import json
+import threading
+from datetime import datetime, timedelta
+import pytest
+
+from security.audit_store import AuditStore
+
+
+def line(timestamp, action, n):
+    entry = {"timestamp": timestamp, "action": action, "data": {"n": n}}
+    return (timestamp, action, f"2024-01-01 00:00:00,000 - INFO - {json.dumps(entry)}\n")
+
+
+def make_store(tmp_path, max_bytes=10_000_000, compress=True):
+    store = AuditStore(tmp_path, max_bytes=max_bytes, retention_days=36500, compress=compress)
+    store.open()
+    return store
+
+
+def test_rolls_by_day_and_size_with_index(tmp_path):
+    """Test that day changes and size limits roll gzipped, indexed segments"""
+    store = make_store(tmp_path, max_bytes=300)
+    store.append([line("2024-01-01T10:00:00", "chat_request", 0)])
+    store.append([line("2024-01-01T11:00:00", "chat_request", 1), line("2024-01-01T12:00:00", "execute_action", 2)])
+    store.append([line("2024-01-02T09:00:00", "chat_request", 3)])
+    store.close()
+    
+    assert (tmp_path / "audit_20240101_001.log.gz").exists()
+    with gzip.open(tmp_path / "audit_20240101_001.log.gz", "rt") as handle:
+        assert len(handle.read().splitlines()) == 3
+    index = [json.loads(row) for row in (tmp_path / "audit_index.jsonl").read_text().splitlines()]
+    assert index[0]["file"] == "audit_20240101_001.log.gz"
+    assert index[0]["actions"] == {"chat_request": 2, "execute_action": 1}
+    assert (index[0]["start"], index[0]["end"]) == ("2024-01-01T10:00:00", "2024-01-01T12:00:00")
+
+
+def test_query_filters_and_pages_newest_first(tmp_path):
+    """Test time/action filtering across rolled and active segments, with paging"""
+    store = make_store(tmp_path)
+    for day in (1, 2, 3):
+        store.append([
+            line(f"2024-01-0{day}T0{hour}:00:00", "chat_request" if hour % 2 else "execute_action", day * 10 + hour)
+            for hour in range(1, 5)
+        ])
+    
+    page = store.query(actions=["execute_action"], limit=3)
+    assert [entry["data"]["n"] for entry in page["entries"]] == [34, 32, 24]
+    page = store.query(actions=["execute_action"], cursor=page["next_cursor"], limit=3)
+    assert [entry["data"]["n"] for entry in page["entries"]] == [22, 14, 12]
+    assert page["next_cursor"] is None
+    
+    window = store.query(since="2024-01-02", before="2024-01-02T03")
+    assert [entry["data"]["n"] for entry in window["entries"]] == [22, 21]
+
+
+def test_paging_keeps_entries_sharing_a_timestamp(tmp_path):
+    """Test that a page boundary inside a run of equal timestamps neither skips nor repeats entries"""
+    store = make_store(tmp_path)
+    store.append([line("2024-01-01T01:00:00", "chat_request", 0)])
+    store.append([line("2024-01-01T02:00:00", "chat_request", n) for n in range(1, 6)])
+    store.append([line("2024-01-01T03:00:00", "chat_request", 6)])
+    
+    seen, cursor = [], None
+    while True:
+        page = store.query(limit=2, cursor=cursor)
+        seen.extend(entry["data"]["n"] for entry in page["entries"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [6, 5, 4, 3, 2, 1, 0]
+    
+    with pytest.raises(ValueError):
+        store.query(cursor="not-a-cursor")
+
+
+def test_query_reads_segments_without_holding_the_lock(tmp_path, monkeypatch):
+    """Test that the writer can append while a query is reading segments"""
+    store = make_store(tmp_path)
+    store.append([line("2024-01-01T01:00:00", "chat_request", 1)])
+    store.append([line("2024-01-02T01:00:00", "chat_request", 2)])
+    writer_blocked = []
+    original = store._read
+    
+    def try_lock():
+        acquired = store.lock.acquire(timeout=1)
+        writer_blocked.append(not acquired)
+        if acquired:
+            store.lock.release()
+    
+    def read(path):
+        writer = threading.Thread(target=try_lock)
+        writer.start()
+        writer.join()
+        return original(path)
+    
+    monkeypatch.setattr(store, "_read", read)
+    assert [entry["data"]["n"] for entry in store.query()["entries"]] == [2, 1]
+    assert writer_blocked == [False, False]
+
+
+def test_query_skips_segments_outside_index_range(tmp_path, monkeypatch):
+    """Test that the sidecar index keeps queries from opening unrelated files"""
+    store = make_store(tmp_path)
+    store.append([line("2024-01-01T01:00:00", "chat_request", 1)])
+    store.append([line("2024-01-02T01:00:00", "settings_update", 2)])
+    opened = []
+    original = store._read
+    monkeypatch.setattr(store, "_read", lambda path: opened.append(path.name) or original(path))
+    
+    result = store.query(actions=["settings_update"])
+    
+    assert [entry["data"]["n"] for entry in result["entries"]] == [2]
+    assert opened == ["audit_20240102.log"]
+
+
+def test_restart_rolls_stale_file_and_applies_retention(tmp_path):
+    """Test startup handling of yesterday's active file and expired segments"""
+    old = (datetime.now() - timedelta(days=40)).isoformat()
+    yesterday = datetime.now() - timedelta(days=1)
+    store = make_store(tmp_path, compress=False)
+    store.append([line(old, "chat_request", 1)])
+    store.append([line(yesterday.isoformat(), "chat_request", 2)])
+    store.close()
+    
+    restarted = AuditStore(tmp_path, max_bytes=10_000_000, retention_days=30)
+    restarted.open()
+    
+    assert not (tmp_path / f"audit_{yesterday:%Y%m%d}.log").exists()
+    assert [entry["data"]["n"] for entry in restarted.query()["entries"]] == [2]
+    assert len((tmp_path / "audit_index.jsonl").read_text().splitlines()) == 1
+    restarted.close()
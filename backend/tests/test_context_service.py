@@ -0,0 +1,63 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from services.context_service import ContextBuilder, estimate_tokens, TRUNCATION_MARKER
+
+
+def make_messages(count, size=40):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"{i}:" + "x" * size}
+        for i in range(count)
+    ]
+
+
+def test_fit_keeps_newest_within_budget():
+    """Test that the sliding window drops the oldest messages first"""
+    builder = ContextBuilder(max_tokens=60, response_reserve=0)
+    messages = make_messages(10)
+    
+    fitted = builder.fit(messages)
+    assert fitted[-1]["content"] == messages[-1]["content"]
+    assert [m["content"] for m in fitted] == [m["content"] for m in messages[-len(fitted):]]
+    assert sum(estimate_tokens(m["content"]) + 4 for m in fitted) <= 60
+
+
+def test_fit_keeps_system_prompt():
+    """Test that system messages survive truncation"""
+    builder = ContextBuilder(max_tokens=40, response_reserve=0)
+    messages = [{"role": "system", "content": "You are Zeno."}] + make_messages(10)
+    
+    fitted = builder.fit(messages)
+    assert fitted[0] == {"role": "system", "content": "You are Zeno."}
+    assert fitted[-1]["content"] == messages[-1]["content"]
+
+
+def test_fit_truncates_oversized_turn():
+    """Test that a single huge turn is cut down from the front"""
+    builder = ContextBuilder(max_tokens=100, response_reserve=0)
+    text = "a" * 10_000 + "THE END"
+    
+    fitted = builder.fit([{"role": "user", "content": text}])
+    assert len(fitted) == 1
+    assert fitted[0]["content"].startswith(TRUNCATION_MARKER)
+    assert fitted[0]["content"].endswith("THE END")
+    assert estimate_tokens(fitted[0]["content"]) <= 96
+
+
+@pytest.mark.asyncio
+async def test_build_loads_history_from_database():
+    """Test that history is rebuilt server-side and the saved new turn is not repeated"""
+    db = MagicMock()
+    db.get_recent_messages = AsyncMock(return_value=[
+        {"id": "m1", "role": "user", "content": "Hi"},
+        {"id": "m2", "role": "assistant", "content": "Hello!"},
+        {"id": "m3", "role": "user", "content": "How are you?"},
+    ])
+    builder = ContextBuilder(db, max_tokens=1000, response_reserve=0, history_limit=50)
+    
+    messages = await builder.build([{"role": "user", "content": "How are you?"}], "conv-1")
+    assert messages == [
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello!"},
+        {"role": "user", "content": "How are you?"},
+    ]
+    db.get_recent_messages.assert_awaited_once_with("conv-1", 50)
@@ -0,0 +1,215 @@
+import asyncio
+import threading
+from datetime import datetime
+import pytest
+from unittest.mock import MagicMock
+from mysql.connector import errors
+from services.database_service import DatabaseService
+
+
+def make_service():
+    """Build a service backed by a mock connection pool"""
+    service = DatabaseService()
+    service.pool = MagicMock()
+    connection = MagicMock()
+    service.pool.get_connection.return_value = connection
+    return service, connection
+
+
+@pytest.mark.asyncio
+async def test_queries_run_off_event_loop():
+    """Test that queries execute on the database thread pool"""
+    service, connection = make_service()
+    threads = []
+    
+    def execute(*args):
+        threads.append(threading.current_thread().name)
+    
+    connection.cursor.return_value.execute.side_effect = execute
+    
+    assert await service.save_message("m1", "c1", "user", "Hello") is True
+    assert threads and threads[0].startswith("mysql")
+    assert threads[0] != threading.current_thread().name
+    connection.commit.assert_called_once()
+    connection.close.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_reconnects_after_dropped_connection():
+    """Test that a lost connection is retried with a fresh checkout"""
+    service, connection = make_service()
+    connection.cursor.return_value.execute.side_effect = [
+        errors.OperationalError("MySQL server has gone away"),
+        None,
+    ]
+    
+    assert await service.delete_conversation("c1") is True
+    assert service.pool.get_connection.call_count == 2
+    assert connection.close.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_return_defaults():
+    """Test that persistent failures keep the original return contract"""
+    service, connection = make_service()
+    connection.cursor.return_value.execute.side_effect = errors.OperationalError("down")
+    
+    assert await service.get_all_conversations() == []
+    assert await service.save_conversation("c1", "Title", "llama2") is False
+
+
+@pytest.mark.asyncio
+async def test_not_connected():
+    """Test behaviour when no pool was created"""
+    service = DatabaseService()
+    
+    assert await service.get_conversation_messages("c1") == []
+    assert await service.ping() is False
+
+
+@pytest.mark.asyncio
+async def test_saves_are_batched():
+    """Test that concurrent saves share one multi-row upsert"""
+    service, connection = make_service()
+    cursor = connection.cursor.return_value
+    
+    results = await asyncio.gather(
+        service.save_conversation("c1", "Title", "llama2"),
+        service.save_message("m1", "c1", "user", "Hello"),
+        service.save_message("m2", "c1", "assistant", "Hi"),
+        service.save_message("m2", "c1", "assistant", "Hi there"),
+    )
+    
+    assert results == [True, True, True, True]
+    assert connection.commit.call_count == 1
+    conversation_sql, conversation_params = cursor.execute.call_args_list[0].args
+    message_sql, message_params = cursor.execute.call_args_list[1].args
+    assert "INSERT INTO conversations" in conversation_sql
+    assert conversation_params == ["c1", "Title", "llama2"]
+    assert "INSERT INTO messages" in message_sql
+    assert message_params == ["m1", "c1", "user", "Hello", "m2", "c1", "assistant", "Hi there"]
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_falls_back_to_single_rows():
+    """Test that one bad row does not fail the rest of its batch"""
+    service, connection = make_service()
+    
+    def execute(sql, params):
+        if "bad" in params:
+            raise errors.IntegrityError("foreign key constraint fails")
+    
+    connection.cursor.return_value.execute.side_effect = execute
+    
+    results = await asyncio.gather(
+        service.save_message("m1", "c1", "user", "Hello"),
+        service.save_message("m2", "bad", "user", "Orphan"),
+    )
+    
+    assert results == [True, False]
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_pending_writes():
+    """Test that shutdown commits buffered rows"""
+    service, connection = make_service()
+    service.write_flush_interval = 3600
+    
+    save = asyncio.create_task(service.save_message("m1", "c1", "user", "Hello"))
+    await asyncio.sleep(0)
+    connection.commit.assert_not_called()
+    
+    await service.close()
+    assert await save is True
+    connection.commit.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_close_disconnects_idle_connections():
+    """Test that close checks out and disconnects every idle pooled connection"""
+    service, _ = make_service()
+    idle = [MagicMock(), MagicMock()]
+    pool = service.pool
+    pool.get_connection.side_effect = idle + [errors.PoolError("Failed getting connection; pool exhausted")]
+    
+    await service.close()
+    assert service.pool is None
+    assert pool.get_connection.call_count == 3
+    for conn in idle:
+        conn.disconnect.assert_called_once()
+        conn.close.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_conversations_keyset_pagination():
+    """Test that a full page returns a cursor that resumes after its last row"""
+    service, connection = make_service()
+    cursor = connection.cursor.return_value
+    rows = [
+        {"id": f"c{i}", "title": "t", "model": "llama2",
+         "created_at": datetime(2024, 1, 1), "updated_at": datetime(2024, 1, 3 - i)}
+        for i in range(3)
+    ]
+    cursor.fetchall.return_value = rows
+    
+    page = await service.get_conversations_page(limit=2)
+    assert [conv["id"] for conv in page["conversations"]] == ["c0", "c1"]
+    assert page["next_cursor"]
+    sql, params = cursor.execute.call_args.args
+    assert "ORDER BY updated_at DESC, id DESC" in sql
+    assert params == [3]
+    
+    cursor.fetchall.return_value = rows[2:]
+    page = await service.get_conversations_page(limit=2, cursor=page["next_cursor"])
+    assert [conv["id"] for conv in page["conversations"]] == ["c2"]
+    assert page["next_cursor"] is None
+    sql, params = cursor.execute.call_args.args
+    assert "updated_at < %s OR (updated_at = %s AND id < %s)" in sql
+    assert params == [datetime(2024, 1, 2), datetime(2024, 1, 2), "c1", 3]
+
+
+@pytest.mark.asyncio
+async def test_invalid_cursor_rejected():
+    """Test that a malformed cursor raises instead of returning wrong rows"""
+    service, _ = make_service()
+    
+    with pytest.raises(ValueError):
+        await service.get_messages_page("c1", limit=10, cursor="not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_fulltext_index_added_and_searched():
+    """Test that the FULLTEXT index is created on an empty table and used by search"""
+    service, connection = make_service()
+    cursor = connection.cursor.return_value
+    cursor.fetchall.return_value = [("messages", "idx_conversation_created_id"), ("conversations", "idx_updated_at_id")]
+    cursor.fetchone.return_value = (0,)
+    
+    service._ensure_indexes(cursor)
+    assert service.fulltext
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert "ALTER TABLE messages ADD FULLTEXT INDEX ft_content (content)" in statements
+    
+    cursor.fetchall.return_value = [{
+        "id": "m1", "conversation_id": "c1", "title": "t", "role": "user",
+        "content": "Sourdough", "created_at": datetime(2024, 1, 1), "score": 0.5,
+    }]
+    rows = await service.search_messages("+sourdough", 21, 20)
+    assert rows[0]["created_at"] == "2024-01-01T00:00:00"
+    sql, params = cursor.execute.call_args.args
+    assert "MATCH(m.content) AGAINST (%s IN BOOLEAN MODE)" in sql
+    assert "LEFT JOIN conversations" in sql
+    assert params == ("+sourdough", "+sourdough", 21, 20)
+
+
+def test_fulltext_index_not_built_on_populated_table():
+    """Test that startup leaves the slow FULLTEXT build on existing data to a manual migration"""
+    service, connection = make_service()
+    cursor = connection.cursor.return_value
+    cursor.fetchall.return_value = [("messages", "idx_conversation_created_id"), ("conversations", "idx_updated_at_id")]
+    cursor.fetchone.return_value = (1,)
+    
+    service._ensure_indexes(cursor)
+    assert not service.fulltext
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert not any("FULLTEXT" in statement for statement in statements)
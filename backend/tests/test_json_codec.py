@@ -0,0 +1,37 @@
+import json
+import pytest
+
+from services import json_codec
+from services.json_codec import CODECS, load_codec
+
+
+FRAME = {
+    "type": "stream",
+    "data": {"chunk": "héllo \"wörld\" ✓\n", "done": False, "position": 3, "ratio": 0.5},
+    "requestId": "abc",
+}
+
+
+@pytest.mark.parametrize("name", list(CODECS))
+def test_codecs_match_stdlib_output(name):
+    """Test that every installed codec produces the same compact UTF-8 JSON"""
+    loaded, dumps, loads = load_codec(name)
+    if loaded != name:
+        pytest.skip(f"{name} not installed")
+    
+    expected = json.dumps(FRAME, separators=(",", ":"), ensure_ascii=False)
+    assert dumps(FRAME) == expected
+    assert loads(expected) == FRAME
+    assert loads(expected.encode("utf-8")) == FRAME
+
+
+def test_unknown_codec_falls_back_to_stdlib():
+    """Test that a misconfigured JSON_CODEC still yields a working codec"""
+    name, dumps, loads = load_codec("simdjson")
+    assert name == "stdlib"
+    assert loads(dumps([1, "a"])) == [1, "a"]
+
+
+def test_module_dumps_returns_text():
+    """Test the str helper used for WebSocket text frames"""
+    assert json_codec.loads(json_codec.dumps(FRAME)) == FRAME
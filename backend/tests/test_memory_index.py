@@ -0,0 +1,128 @@
+import random
+import pytest
+
+from services import memory_index
+from services.memory_index import MemoryIndex
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    """Run each test with numpy and with the pure-Python fallback"""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(memory_index, "np", None)
+    return request.param
+
+
+def open_index(path, **kwargs):
+    index = MemoryIndex(path, **kwargs)
+    index.open("embed")
+    return index
+
+
+def test_search_ranks_by_cosine(tmp_path, backend):
+    """Test that results come back best first with their scores and rows"""
+    index = open_index(tmp_path)
+    index.add("m1", "c1", "user", "about cats", [1.0, 0.0, 0.0])
+    index.add("m2", "c1", "assistant", "about dogs", [0.0, 2.0, 0.0])
+    index.add("m3", "c2", "user", "cats and dogs", [1.0, 1.0, 0.0])
+    
+    hits = index.search([3.0, 0.1, 0.0], k=2)
+    assert [hit["id"] for hit in hits] == ["m1", "m3"]
+    assert hits[0]["content"] == "about cats"
+    assert hits[0]["conversationId"] == "c1"
+    assert hits[0]["score"] == pytest.approx(0.9994, abs=1e-3)
+    
+    hits = index.search([3.0, 0.1, 0.0], k=5, exclude_conversation="c1")
+    assert [hit["id"] for hit in hits] == ["m3"]
+
+
+def test_resave_and_remove_conversation(tmp_path, backend):
+    """Test that a re-saved message replaces its old row and deleted conversations disappear"""
+    index = open_index(tmp_path)
+    index.add("m1", "c1", "user", "old text", [1.0, 0.0])
+    index.add("m1", "c1", "user", "new text", [0.0, 1.0])
+    index.add("m2", "c2", "user", "other", [1.0, 1.0])
+    
+    assert index.contains("m1", "new text")
+    assert not index.contains("m1", "old text")
+    assert [hit["content"] for hit in index.search([1.0, 0.0], k=5)] == ["other", "new text"]
+    
+    assert index.remove_conversation("c1") == 1
+    assert [hit["id"] for hit in index.search([1.0, 0.0], k=5)] == ["m2"]
+    assert index.live_count == 1
+
+
+def test_reopen_restores_state(tmp_path, backend):
+    """Test that rows and deletions persist, and a changed model starts over"""
+    index = open_index(tmp_path)
+    index.add("m1", "c1", "user", "kept", [1.0, 0.0])
+    index.add("m2", "c2", "user", "deleted", [1.0, 0.1])
+    index.remove_conversation("c2")
+    index.close()
+    
+    index = open_index(tmp_path)
+    assert [hit["id"] for hit in index.search([1.0, 0.0], k=5)] == ["m1"]
+    index.add("m3", "c3", "user", "after reopen", [0.0, 1.0])
+    assert index.search([0.0, 1.0], k=1)[0]["id"] == "m3"
+    index.close()
+    
+    index = MemoryIndex(tmp_path)
+    index.open("another-model")
+    assert index.live_count == 0
+    assert index.search([1.0, 0.0], k=5) == []
+
+
+def test_partial_write_is_dropped(tmp_path, backend):
+    """Test that a row cut off by a crash is discarded on open"""
+    index = open_index(tmp_path)
+    index.add("m1", "c1", "user", "complete", [1.0, 0.0])
+    index.add("m2", "c1", "user", "torn", [0.0, 1.0])
+    index.close()
+    with open(tmp_path / "vectors.f32", "r+b") as vectors:
+        vectors.truncate(12)
+    
+    index = open_index(tmp_path)
+    assert index.count == 1
+    index.add("m3", "c1", "user", "next", [0.0, 1.0])
+    assert [hit["id"] for hit in index.search([0.0, 1.0], k=5)] == ["m3", "m1"]
+
+
+def test_dimension_mismatch(tmp_path, backend):
+    """Test that vectors from a different model shape are refused"""
+    index = open_index(tmp_path)
+    index.add("m1", "c1", "user", "text", [1.0, 0.0])
+    with pytest.raises(ValueError):
+        index.add("m2", "c1", "user", "text", [1.0, 0.0, 0.0])
+    assert index.search([1.0, 0.0, 0.0], k=1) == []
+
+
+def test_ivf_matches_brute_force(tmp_path):
+    """Test that the trained inverted file finds the same neighbours for clustered data"""
+    np = pytest.importorskip("numpy")
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(16, 32))
+    index = open_index(tmp_path, ivf_min_vectors=2000, ivf_probes=4)
+    for row in range(2400):
+        vector = centers[row % 16] + rng.normal(scale=0.05, size=32)
+        index.add(f"m{row}", f"c{row % 50}", "user", f"message {row}", vector.tolist())
+        if index.needs_training():
+            index.train()
+    assert index.ivf_lists > 1
+    assert not index.needs_training()
+    
+    queries = [centers[i] + rng.normal(scale=0.05, size=32) for i in random.Random(0).sample(range(16), 5)]
+    index.ivf_probes = index.ivf_lists
+    exact = [[hit["id"] for hit in index.search(q.tolist(), k=10)] for q in queries]
+    index.ivf_probes = 4
+    approximate = [[hit["id"] for hit in index.search(q.tolist(), k=10)] for q in queries]
+    assert exact == approximate
+    
+    # Rows added after training are assigned to a list, and survive a reopen
+    index.add("late", "c-late", "user", "late message", centers[3].tolist())
+    assert index.search(centers[3].tolist(), k=1)[0]["id"] == "late"
+    index.close()
+    index = open_index(tmp_path, ivf_min_vectors=2000, ivf_probes=4)
+    assert index.ivf_lists > 1
+    assert index.search(centers[3].tolist(), k=1)[0]["id"] == "late"
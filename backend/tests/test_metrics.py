@@ -0,0 +1,88 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from services.metrics import ChatMetrics, MetricsRegistry, registry
+from services.ollama_service import OllamaService
+
+
+def test_histogram_render():
+    """Test Prometheus text rendering of a labelled histogram"""
+    reg = MetricsRegistry()
+    hist = reg.histogram("test_latency_seconds", "Test latency", ["model"], buckets=(0.1, 1.0))
+    hist.observe(0.05, model="llama2")
+    hist.observe(0.5, model="llama2")
+    hist.observe(5.0, model="llama2")
+    
+    text = reg.render()
+    assert "# TYPE test_latency_seconds histogram" in text
+    assert 'test_latency_seconds_bucket{model="llama2",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{model="llama2",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{model="llama2",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{model="llama2"} 3' in text
+
+
+def test_registry_reuses_metric():
+    """Test that registering the same name returns the existing metric"""
+    reg = MetricsRegistry()
+    counter = reg.counter("test_total", "Test counter")
+    assert reg.counter("test_total", "Test counter") is counter
+    
+    with pytest.raises(ValueError):
+        reg.gauge("test_total", "Test gauge")
+
+
+def test_chat_metrics_summary():
+    """Test per-request chat metrics and Ollama stats"""
+    metrics = ChatMetrics("metrics-test-model", known=True)
+    metrics.start()
+    metrics.chunk()
+    metrics.chunk()
+    metrics.ollama_stats.update({"eval_count": 2, "eval_duration": 500_000_000})
+    
+    summary = metrics.finish()
+    assert summary["chunks"] == 2
+    assert summary["tokens"] == 2
+    assert summary["time_to_first_chunk"] is not None
+    assert metrics.finish() is summary
+    
+    text = registry.render()
+    assert 'zeno_chat_requests_total{model="metrics-test-model",status="ok"} 1' in text
+    assert 'zeno_ollama_tokens_per_second_count{model="metrics-test-model"} 1' in text
+
+
+def test_chat_metrics_rate_and_unknown_model():
+    """Test that tokens/sec excludes the first token and unknown models share one label"""
+    metrics = ChatMetrics("client-supplied-name")
+    metrics.first_chunk_at, metrics.last_chunk_at = 10.0, 12.0
+    metrics.ollama_stats["eval_count"] = 5
+    
+    assert metrics.finish()["tokens_per_second"] == 2.0
+    text = registry.render()
+    assert 'model="other"' in text
+    assert "client-supplied-name" not in text
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_collects_stats():
+    """Test that chat_stream reports Ollama's done-frame timings"""
+    service = OllamaService()
+    
+    async def aiter_lines():
+        yield '{"message": {"content": "Hi"}}'
+        yield '{"done": true, "eval_count": 1, "eval_duration": 1000, "prompt_eval_duration": 20}'
+    
+    response = MagicMock()
+    response.status_code = 200
+    response.aiter_lines = aiter_lines
+    stream = MagicMock()
+    stream.__aenter__ = AsyncMock(return_value=response)
+    stream.__aexit__ = AsyncMock(return_value=False)
+    
+    client = MagicMock()
+    client.is_closed = False
+    client.stream.return_value = stream
+    service.upstreams.upstreams[0]._client = client
+    
+    stats = {}
+    chunks = [chunk async for chunk in service.chat_stream([], "llama2", stats=stats)]
+    assert chunks == ["Hi"]
+    assert stats == {"eval_count": 1, "eval_duration": 1000, "prompt_eval_duration": 20}
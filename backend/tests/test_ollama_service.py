@@ -1,59 +1,89 @@
+import asyncio
+import httpx
+import time
 import pytest
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock
 from services.ollama_service import OllamaService
 
 
+def make_client():
+    """Build a mock of the shared httpx.AsyncClient"""
+    client = MagicMock()
+    client.is_closed = False
+    client.get = AsyncMock()
+    client.post = AsyncMock()
+    client.aclose = AsyncMock()
+    return client
+
+
+def make_stream(lines, status_code=200):
+    """Build a mock streaming response context manager"""
+    async def aiter_lines():
+        for line in lines:
+            yield line
+    
+    response = MagicMock()
+    response.status_code = status_code
+    response.aiter_lines = aiter_lines
+    response.aread = AsyncMock(return_value=b"")
+    
+    stream = MagicMock()
+    stream.__aenter__ = AsyncMock(return_value=response)
+    stream.__aexit__ = AsyncMock(return_value=False)
+    return stream
+
+
 @pytest.mark.asyncio
 async def test_is_connected_success():
     """Test successful Ollama connection check"""
     service = OllamaService()
+    service.upstreams.upstreams[0]._client = make_client()
     
-    with patch('httpx.AsyncClient') as mock_client:
-        mock_response = AsyncMock()
-        mock_response.status_code = 200
-        mock_client.return_value.__aenter__.return_value.get.return_value = mock_response
-        
-        result = await service.is_connected()
-        assert result is True
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    service.client.get.return_value = mock_response
+    
+    result = await service.is_connected()
+    assert result is True
 
 
 @pytest.mark.asyncio
 async def test_is_connected_failure():
     """Test failed Ollama connection check"""
     service = OllamaService()
+    service.upstreams.upstreams[0]._client = make_client()
+    service.client.get.side_effect = Exception("Connection failed")
     
-    with patch('httpx.AsyncClient') as mock_client:
-        mock_client.return_value.__aenter__.return_value.get.side_effect = Exception("Connection failed")
-        
-        result = await service.is_connected()
-        assert result is False
+    result = await service.is_connected()
+    assert result is False
 
 
 @pytest.mark.asyncio
 async def test_list_models():
     """Test listing Ollama models"""
     service = OllamaService()
+    service.upstreams.upstreams[0]._client = make_client()
     
     mock_models = [
         {"name": "llama2", "size": 3825819519},
         {"name": "mistral", "size": 4109865159},
     ]
     
-    with patch('httpx.AsyncClient') as mock_client:
-        mock_response = AsyncMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {"models": mock_models}
-        mock_client.return_value.__aenter__.return_value.get.return_value = mock_response
-        
-        models = await service.list_models()
-        assert len(models) == 2
-        assert models[0]["name"] == "llama2"
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = {"models": mock_models}
+    service.client.get.return_value = mock_response
+    
+    models = await service.list_models()
+    assert len(models) == 2
+    assert models[0]["name"] == "llama2"
 
 
 @pytest.mark.asyncio
 async def test_chat_stream():
     """Test streaming chat responses"""
     service = OllamaService()
+    service.upstreams.upstreams[0]._client = make_client()
     
     messages = [{"role": "user", "content": "Hello"}]
     
@@ -63,21 +93,171 @@ async def test_chat_stream():
         '{"message": {"content": " there"}}',
         '{"done": true}',
     ]
+    service.client.stream.return_value = make_stream(mock_lines)
+    
+    chunks = []
+    async for chunk in service.chat_stream(messages, "llama2"):
+        chunks.append(chunk)
+    
+    assert len(chunks) == 2
+    assert chunks[0] == "Hello"
+    assert chunks[1] == " there"
+
+
+@pytest.mark.asyncio
+async def test_client_is_shared_and_closed():
+    """Test that one pooled client is reused across calls and closed on shutdown"""
+    service = OllamaService()
+    await service.start()
+    
+    client = service.client
+    assert service.client is client
+    assert client.base_url == service.base_url
+    
+    await service.close()
+    assert client.is_closed
+    assert service.upstreams.upstreams[0]._client is None
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_sets_keep_alive_and_system_prefix(monkeypatch):
+    """Test that chat requests carry keep_alive and a stable system prompt"""
+    monkeypatch.setattr("config.settings.OLLAMA_MODEL_KEEP_ALIVE", {"llama2": "-1"})
+    service = OllamaService()
+    service.system_prompt = "You are Zeno."
+    service.upstreams.upstreams[0]._client = make_client()
+    service.client.stream.return_value = make_stream(['{"done": true}'])
+    
+    async for _ in service.chat_stream([{"role": "user", "content": "Hi"}], "llama2"):
+        pass
+    
+    payload = service.client.stream.call_args.kwargs["json"]
+    assert payload["keep_alive"] == "-1"
+    assert payload["messages"][0] == {"role": "system", "content": "You are Zeno."}
+    assert payload["options"] == {"num_ctx": service.base_options["num_ctx"], "temperature": 0.7}
+
+
+@pytest.mark.asyncio
+async def test_refresh_loaded_models():
+    """Test tracking of resident models via /api/ps"""
+    service = OllamaService()
+    service.upstreams.upstreams[0]._client = make_client()
+    
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"models": [{"name": "llama2:latest", "size_vram": 1}]}
+    service.client.get.return_value = mock_response
+    
+    loaded = await service.refresh_loaded_models()
+    assert list(loaded) == ["llama2:latest"]
+    assert service.is_model_loaded("llama2")
+    assert not service.is_model_loaded("mistral")
+    service.client.get.assert_awaited_with("/api/ps", timeout=service.probe_timeout)
+
+
+@pytest.mark.asyncio
+async def test_list_models_cached_and_coalesced():
+    """Test that concurrent and repeated lookups share one /api/tags request"""
+    service = OllamaService()
+    service.upstreams.upstreams[0]._client = make_client()
+    release = asyncio.Event()
+    
+    async def get(*args, **kwargs):
+        await release.wait()
+        response = MagicMock()
+        response.json.return_value = {"models": [{"name": "llama2"}]}
+        return response
+    
+    service.client.get.side_effect = get
+    
+    callers = [asyncio.create_task(service.list_models()) for _ in range(10)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*callers)
+    
+    assert all(models == [{"name": "llama2"}] for models in results)
+    assert await service.list_models() == [{"name": "llama2"}]
+    assert await service.is_connected() is True
+    assert service.client.get.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_list_models_stale_while_revalidate():
+    """Test that an expired list is served immediately and refreshed in the background"""
+    service = OllamaService()
+    service.upstreams.upstreams[0]._client = make_client()
+    service._models = [{"name": "old"}]
+    service._models_at = time.monotonic() - service.models_ttl - 1
+    
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"models": [{"name": "new"}]}
+    service.client.get.return_value = mock_response
+    
+    assert await service.list_models() == [{"name": "old"}]
+    await service._models_fetch
+    assert await service.list_models() == [{"name": "new"}]
+    
+    service.invalidate_models()
+    assert service._models is None
+
+
+def make_multi_service(monkeypatch, count=2):
+    """Build a service balancing over several mocked upstreams"""
+    monkeypatch.setattr("config.settings.OLLAMA_UPSTREAMS", [f"http://gpu-{i}:11434" for i in range(count)])
+    service = OllamaService()
+    for upstream in service.upstreams:
+        upstream._client = make_client()
+    return service, service.upstreams.upstreams
+
+
+@pytest.mark.asyncio
+async def test_chat_fails_over_before_first_token(monkeypatch):
+    """Test that a host that refuses the connection is skipped transparently"""
+    service, (first, second) = make_multi_service(monkeypatch)
+    refused = MagicMock()
+    refused.__aenter__ = AsyncMock(side_effect=httpx.ConnectError("refused"))
+    refused.__aexit__ = AsyncMock(return_value=False)
+    first.client.stream.return_value = refused
+    second.client.stream.return_value = make_stream(['{"message": {"content": "Hi"}}', '{"done": true}'])
+    
+    chunks = [chunk async for chunk in service.chat_stream([{"role": "user", "content": "Hello"}], "llama2")]
+    
+    assert chunks == ["Hi"]
+    assert not first.healthy
+    assert second.healthy and second.latency is not None
+    assert first.outstanding == second.outstanding == 0
+    assert service.upstreams.route("llama2")[0] is second
+
+
+@pytest.mark.asyncio
+async def test_route_prefers_loaded_model_then_least_outstanding(monkeypatch):
+    """Test model-aware and least-outstanding ordering of upstreams"""
+    service, (a, b, c) = make_multi_service(monkeypatch, count=3)
+    a.models = {"mistral:latest"}
+    b.models = {"llama2:latest"}
+    c.models = {"llama2:latest"}
+    b.outstanding = 3
+    
+    assert service.upstreams.route("llama2") == [c, b]
+    
+    b.loaded = {"llama2:latest"}
+    assert service.upstreams.route("llama2") == [b, c]
+    
+    # No host is known to have the model: try them all
+    assert len(service.upstreams.route("phi")) == 3
+
+
+@pytest.mark.asyncio
+async def test_list_models_merges_upstreams(monkeypatch):
+    """Test that model lists from reachable hosts are merged and failures tracked"""
+    service, (first, second) = make_multi_service(monkeypatch)
+    
+    first_response = MagicMock()
+    first_response.json.return_value = {"models": [{"name": "llama2:latest"}]}
+    first.client.get.return_value = first_response
+    second.client.get.side_effect = httpx.ConnectError("down")
+    
+    models = await service.list_models()
     
-    with patch('httpx.AsyncClient') as mock_client:
-        mock_response = AsyncMock()
-        mock_response.aiter_lines.return_value = mock_lines
-        mock_response.raise_for_status = AsyncMock()
-        
-        mock_stream = AsyncMock()
-        mock_stream.__aenter__.return_value = mock_response
-        
-        mock_client.return_value.__aenter__.return_value.stream.return_value = mock_stream
-        
-        chunks = []
-        async for chunk in service.chat_stream(messages, "llama2"):
-            chunks.append(chunk)
-        
-        assert len(chunks) == 2
-        assert chunks[0] == "Hello"
-        assert chunks[1] == " there"
+    assert models == [{"name": "llama2:latest"}]
+    assert first.has_model("llama2") and second.models is None
+    assert not second.healthy
@@ -0,0 +1,50 @@
+import pytest
+
+from api import protocols
+from api.connection import ClientConnection
+
+
+class BinarySocket:
+    """Records binary frames sent by a connection"""
+    
+    def __init__(self, incoming):
+        self.incoming = list(incoming)
+        self.sent = []
+    
+    async def receive_bytes(self):
+        return self.incoming.pop(0)
+    
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+
+def test_plain_clients_get_json_without_subprotocol():
+    """Test that clients offering nothing keep the JSON text protocol"""
+    protocol, subprotocol = protocols.negotiate([])
+    assert protocol is protocols.JSON and subprotocol is None
+    
+    protocol, subprotocol = protocols.negotiate(["zeno.json"])
+    assert protocol is protocols.JSON and subprotocol == "zeno.json"
+
+
+def test_msgpack_offer_without_package_falls_back(monkeypatch):
+    """Test that MessagePack is only chosen when msgpack is importable"""
+    monkeypatch.setattr(protocols, "msgpack", None)
+    protocol, subprotocol = protocols.negotiate(["zeno.msgpack", "zeno.json"])
+    assert protocol is protocols.JSON and subprotocol == "zeno.json"
+
+
+@pytest.mark.asyncio
+async def test_msgpack_connection_round_trip():
+    """Test that a MessagePack connection decodes and encodes binary frames"""
+    msgpack = pytest.importorskip("msgpack")
+    protocol, subprotocol = protocols.negotiate(["zeno.msgpack"])
+    assert subprotocol == "zeno.msgpack"
+    
+    message = {"type": "models", "requestId": "r1", "data": {}}
+    websocket = BinarySocket([msgpack.packb(message)])
+    connection = ClientConnection(websocket, protocol=protocol)
+    
+    assert await connection.receive() == message
+    await connection.send_json({"type": "stream", "data": {"chunk": "hé", "done": False}, "requestId": "r1"})
+    assert msgpack.unpackb(websocket.sent[0]) == {"type": "stream", "data": {"chunk": "hé", "done": False}, "requestId": "r1"}
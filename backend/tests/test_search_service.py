@@ -0,0 +1,107 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from services.search_service import (
+    SearchService, fts5_expression, highlight, mysql_expression, search_terms,
+)
+
+
+async def make_local(tmp_path):
+    """Build a service on the local FTS5 index (no MySQL pool)"""
+    db = MagicMock()
+    db.pool = None
+    service = SearchService(db, path=tmp_path / "search.db")
+    await service.start()
+    assert service.backend == "sqlite"
+    return service
+
+
+def test_query_parsing():
+    """Test that queries become required terms with a prefix on the word being typed"""
+    assert search_terms("Sour dough? sour") == (["sour", "dough"], True)
+    assert search_terms("bake bread ") == (["bake", "bread"], False)
+    assert search_terms("  ") == ([], False)
+    
+    assert fts5_expression(["near", "or"], True) == '"near" "or"*'
+    assert mysql_expression(["to", "bake", "br"], True) == "+bake +br*"
+    assert mysql_expression(["to", "bake"], False) == "+bake"
+
+
+def test_highlight_ranges_are_utf16_offsets():
+    """Test that match ranges index the snippet the way JavaScript strings do"""
+    snippet, ranges = highlight("😀 Bread and breadcrumbs", ["bread"], False, 100)
+    assert snippet == "😀 Bread and breadcrumbs"
+    assert ranges == [[3, 8]]
+    
+    _, ranges = highlight("😀 Bread and breadcrumbs", ["bread"], True, 100)
+    assert ranges == [[3, 8], [13, 24]]
+
+
+def test_highlight_windows_long_text():
+    """Test that long messages are cut to a window around the first match"""
+    content = " ".join(["filler"] * 100) + " the sourdough starter " + " ".join(["more"] * 100)
+    snippet, ranges = highlight(content, ["sourdough"], False, 80)
+    assert snippet.startswith("…") and snippet.endswith("…")
+    assert len(snippet) <= 82
+    start, end = ranges[0]
+    assert snippet[start:end] == "sourdough"
+
+
+@pytest.mark.asyncio
+async def test_local_index_ranks_and_pages(tmp_path):
+    """Test that local results are ranked, paginated and follow edits and deletes"""
+    service = await make_local(tmp_path)
+    await service.index_conversation("c1", "Baking")
+    await service.index_message("m1", "c1", "user", "How do I bake sourdough bread?")
+    await service.index_message("m2", "c1", "assistant", "Sourdough bread needs a starter. Bread flour helps bread rise.")
+    await service.index_message("m3", "c2", "user", "Completely unrelated")
+    
+    page = await service.search("bread", limit=1)
+    assert [r["messageId"] for r in page["results"]] == ["m2"]
+    assert page["results"][0]["conversationTitle"] == "Baking"
+    assert page["results"][0]["highlights"][0] == [10, 15]
+    assert page["next_cursor"]
+    
+    page = await service.search("bread", limit=1, cursor=page["next_cursor"])
+    assert [r["messageId"] for r in page["results"]] == ["m1"]
+    assert page["next_cursor"] is None
+    
+    # Prefix while typing, and a re-saved message replaces its text
+    assert {r["messageId"] for r in (await service.search("sourd"))["results"]} == {"m1", "m2"}
+    await service.index_message("m1", "c1", "user", "How do I bake rye?")
+    assert [r["messageId"] for r in (await service.search("sourdough "))["results"]] == ["m2"]
+    
+    # Query syntax is treated as plain words
+    assert (await service.search('bread" OR NEAR(')) == {"results": [], "next_cursor": None}
+    
+    await service.forget_conversation("c1")
+    assert (await service.search("bread"))["results"] == []
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_invalid_cursor_rejected(tmp_path):
+    service = await make_local(tmp_path)
+    with pytest.raises(ValueError):
+        await service.search("bread", cursor="not-a-cursor")
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_uses_mysql_fulltext_when_connected(tmp_path):
+    """Test that a connected database with a FULLTEXT index serves searches and skips the local index"""
+    db = MagicMock()
+    db.fulltext = True
+    db.search_messages = AsyncMock(return_value=[{
+        "id": "m1", "conversation_id": "c1", "title": "Baking", "role": "user",
+        "content": "Sourdough bread", "created_at": "2024-01-15T10:30:00", "score": 1.5,
+    }])
+    service = SearchService(db, path=tmp_path / "search.db")
+    await service.start()
+    assert service.backend == "mysql"
+    assert service.local is None
+    
+    page = await service.search("sourdough bre", limit=10)
+    db.search_messages.assert_awaited_once_with("+sourdough +bre*", 11, 0)
+    assert page["results"][0]["highlights"] == [[0, 9], [10, 15]]
+    await service.close()
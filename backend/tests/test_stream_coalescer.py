@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from api.stream_coalescer import StreamCoalescer
+
+
+@pytest.mark.asyncio
+async def test_first_chunk_sent_immediately():
+    """Test that the first chunk bypasses the buffer"""
+    sent = []
+    
+    async def send(text):
+        sent.append(text)
+    
+    coalescer = StreamCoalescer(send, enabled=True, window=10.0, max_bytes=1024)
+    await coalescer.add("Hello")
+    assert sent == ["Hello"]
+    
+    await coalescer.add(" there")
+    await coalescer.add("!")
+    assert sent == ["Hello"]
+    
+    await coalescer.close()
+    assert sent == ["Hello", " there!"]
+
+
+@pytest.mark.asyncio
+async def test_flush_on_byte_threshold():
+    """Test that a full buffer is flushed without waiting for the window"""
+    sent = []
+    
+    async def send(text):
+        sent.append(text)
+    
+    coalescer = StreamCoalescer(send, enabled=True, window=10.0, max_bytes=4)
+    for chunk in ["a", "bb", "cc", "d"]:
+        await coalescer.add(chunk)
+    
+    assert sent == ["a", "bbcc"]
+    await coalescer.close()
+    assert sent == ["a", "bbcc", "d"]
+
+
+@pytest.mark.asyncio
+async def test_flush_on_time_window():
+    """Test that buffered text is sent once the window elapses"""
+    sent = []
+    
+    async def send(text):
+        sent.append(text)
+    
+    coalescer = StreamCoalescer(send, enabled=True, window=0.01, max_bytes=1024)
+    await coalescer.add("a")
+    await coalescer.add("b")
+    await coalescer.add("c")
+    await asyncio.sleep(0.05)
+    
+    assert sent == ["a", "bc"]
+    await coalescer.close()
+    assert sent == ["a", "bc"]
+
+
+@pytest.mark.asyncio
+async def test_disabled_sends_every_chunk():
+    """Test that coalescing can be turned off"""
+    sent = []
+    
+    async def send(text):
+        sent.append(text)
+    
+    coalescer = StreamCoalescer(send, enabled=False)
+    for chunk in ["a", "b", "c"]:
+        await coalescer.add(chunk)
+    await coalescer.close()
+    
+    assert sent == ["a", "b", "c"]
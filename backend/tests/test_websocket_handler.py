@@ -0,0 +1,217 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from fastapi import WebSocketDisconnect
+
+from api.websocket_handler import WebSocketHandler
+from services.scheduler import ChatScheduler
+
+
+class FakeWebSocket:
+    """In-memory stand-in for a FastAPI WebSocket"""
+    
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.sent = []
+    
+    async def receive_text(self):
+        message = await self.incoming.get()
+        if message is None:
+            raise WebSocketDisconnect()
+        return json.dumps(message)
+    
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+    
+    def frames(self, request_id):
+        return [frame for frame in self.sent if frame.get("requestId") == request_id]
+
+
+def make_handler():
+    """Build a handler whose chat stream never finishes on its own"""
+    ollama = MagicMock()
+    ollama.list_models = AsyncMock(return_value=[{"name": "llama2"}])
+    ollama.has_model = AsyncMock(side_effect=lambda model: model == "llama2")
+    ollama.upstream_closed = asyncio.Event()
+    
+    async def chat_stream(messages, model, temperature=0.7, stats=None):
+        try:
+            yield "Hello"
+            await asyncio.sleep(3600)
+        finally:
+            ollama.upstream_closed.set()
+    
+    ollama.chat_stream = chat_stream
+    return WebSocketHandler(ollama, MagicMock()), ollama
+
+
+async def wait_for(predicate, timeout=1.0):
+    """Poll until predicate() is true"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.005)
+
+
+@pytest.mark.asyncio
+async def test_requests_are_multiplexed():
+    """Test that a long chat stream does not block other requests"""
+    handler, _ = make_handler()
+    websocket = FakeWebSocket()
+    connection = asyncio.create_task(handler.handle_connection(websocket))
+    
+    await websocket.incoming.put({"type": "chat", "requestId": "chat-1", "data": {"messages": []}})
+    await wait_for(lambda: websocket.frames("chat-1"))
+    
+    await websocket.incoming.put({"type": "models", "requestId": "models-1", "data": {}})
+    await wait_for(lambda: websocket.frames("models-1"))
+    assert websocket.frames("models-1")[0]["data"]["models"] == [{"name": "llama2"}]
+    
+    await websocket.incoming.put(None)
+    with pytest.raises(WebSocketDisconnect):
+        await connection
+
+
+@pytest.mark.asyncio
+async def test_cancel_stops_stream():
+    """Test that cancel aborts the in-flight chat and closes the upstream stream"""
+    handler, ollama = make_handler()
+    websocket = FakeWebSocket()
+    connection = asyncio.create_task(handler.handle_connection(websocket))
+    
+    await websocket.incoming.put({"type": "chat", "requestId": "chat-1", "data": {"messages": []}})
+    await wait_for(lambda: websocket.frames("chat-1"))
+    
+    await websocket.incoming.put({"type": "cancel", "requestId": "cancel-1", "data": {"requestId": "chat-1"}})
+    await wait_for(lambda: websocket.frames("cancel-1"))
+    assert websocket.frames("cancel-1")[0]["data"]["success"] is True
+    
+    await asyncio.wait_for(ollama.upstream_closed.wait(), timeout=1.0)
+    await wait_for(lambda: websocket.frames("chat-1")[-1]["data"].get("cancelled"))
+    
+    await websocket.incoming.put(None)
+    with pytest.raises(WebSocketDisconnect):
+        await connection
+
+
+@pytest.mark.asyncio
+async def test_cancel_during_send_closes_upstream():
+    """Test that a cancel landing while a chunk is being sent closes the Ollama stream before replying"""
+    handler, ollama = make_handler()
+    websocket = FakeWebSocket()
+    sending = asyncio.Event()
+    send_text = websocket.send_text
+    
+    closed_before_reply = []
+    
+    async def stalled_send_text(text):
+        if '"chunk"' in text:
+            sending.set()
+            await asyncio.sleep(3600)
+        if '"cancelled"' in text:
+            closed_before_reply.append(ollama.upstream_closed.is_set())
+        await send_text(text)
+    
+    websocket.send_text = stalled_send_text
+    connection = asyncio.create_task(handler.handle_connection(websocket))
+    
+    await websocket.incoming.put({"type": "chat", "requestId": "chat-1", "data": {"messages": []}})
+    await asyncio.wait_for(sending.wait(), timeout=1.0)
+    await websocket.incoming.put({"type": "cancel", "requestId": "cancel-1", "data": {"requestId": "chat-1"}})
+    
+    await asyncio.wait_for(ollama.upstream_closed.wait(), timeout=1.0)
+    await wait_for(lambda: websocket.frames("chat-1"))
+    assert websocket.frames("chat-1")[-1]["data"] == {"done": True, "cancelled": True}
+    # Closed by the handler itself, not later by garbage collection
+    assert closed_before_reply == [True]
+    
+    await websocket.incoming.put(None)
+    with pytest.raises(WebSocketDisconnect):
+        await connection
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_inflight_requests():
+    """Test that closing the socket tears down running streams"""
+    handler, ollama = make_handler()
+    websocket = FakeWebSocket()
+    connection = asyncio.create_task(handler.handle_connection(websocket))
+    
+    await websocket.incoming.put({"type": "chat", "requestId": "chat-1", "data": {"messages": []}})
+    await wait_for(lambda: websocket.frames("chat-1"))
+    
+    await websocket.incoming.put(None)
+    with pytest.raises(WebSocketDisconnect):
+        await connection
+    assert ollama.upstream_closed.is_set()
+
+
+@pytest.mark.asyncio
+async def test_action_output_streams_only_on_request(tmp_path):
+    """Test that plain action requests get a single action frame and stream frames are opt-in"""
+    handler, _ = make_handler()
+    handler.action_service.sandbox.SAFE_DIRECTORIES = [tmp_path]
+    target = tmp_path / "notes.txt"
+    target.write_text("hello")
+    websocket = FakeWebSocket()
+    connection = asyncio.create_task(handler.handle_connection(websocket))
+    
+    await websocket.incoming.put({"type": "action", "requestId": "a-1", "data": {"type": "file", "command": f"read:{target}"}})
+    await wait_for(lambda: websocket.frames("a-1"))
+    frames = websocket.frames("a-1")
+    assert [frame["type"] for frame in frames] == ["action"]
+    assert frames[0]["data"]["output"] == "hello"
+    
+    await websocket.incoming.put({"type": "action", "requestId": "a-2", "data": {"type": "file", "command": f"read:{target}", "stream": True}})
+    await wait_for(lambda: any(frame["type"] == "action" for frame in websocket.frames("a-2")))
+    frames = websocket.frames("a-2")
+    assert [frame["type"] for frame in frames] == ["stream", "action"]
+    assert frames[0]["data"]["chunk"] == "hello"
+    
+    await websocket.incoming.put(None)
+    with pytest.raises(WebSocketDisconnect):
+        await connection
+
+
+@pytest.mark.asyncio
+async def test_queued_chat_sends_only_stream_frames():
+    """Test that a queued chat reports its position in chunk-less stream frames, then streams"""
+    handler, _ = make_handler()
+    handler.scheduler = ChatScheduler(max_per_model=1)
+    websocket = FakeWebSocket()
+    connection = asyncio.create_task(handler.handle_connection(websocket))
+    
+    await websocket.incoming.put({"type": "chat", "requestId": "chat-1", "data": {"messages": []}})
+    await wait_for(lambda: websocket.frames("chat-1"))
+    await websocket.incoming.put({"type": "chat", "requestId": "chat-2", "data": {"messages": []}})
+    await wait_for(lambda: websocket.frames("chat-2"))
+    
+    await websocket.incoming.put({"type": "cancel", "requestId": "cancel-1", "data": {"requestId": "chat-1"}})
+    await wait_for(lambda: any("chunk" in frame["data"] for frame in websocket.frames("chat-2")))
+    
+    frames = websocket.frames("chat-2")
+    assert [frame["type"] for frame in frames] == ["stream", "stream"]
+    assert frames[0]["data"] == {"done": False, "queue": {"position": 1, "model": "llama2"}}
+    assert frames[1]["data"] == {"chunk": "Hello", "done": False}
+    
+    await websocket.incoming.put(None)
+    with pytest.raises(WebSocketDisconnect):
+        await connection
+
+
+@pytest.mark.asyncio
+async def test_unknown_model_rejected():
+    """Test that a chat for a model Ollama doesn't have fails before it is queued"""
+    handler, _ = make_handler()
+    websocket = FakeWebSocket()
+    connection = asyncio.create_task(handler.handle_connection(websocket))
+    
+    await websocket.incoming.put({"type": "chat", "requestId": "chat-1", "data": {"messages": [], "model": "nope"}})
+    await wait_for(lambda: websocket.frames("chat-1"))
+    assert websocket.frames("chat-1")[0]["data"]["error"] == "Unknown model: nope"
+    assert handler.scheduler.stats() == {}
+    
+    await websocket.incoming.put(None)
+    with pytest.raises(WebSocketDisconnect):
+        await connection
@@ -0,0 +1,48 @@
+from websockets.extensions.permessage_deflate import PerMessageDeflate
+from websockets.frames import Frame, Opcode
+
+from api.ws_compression import ThresholdDeflate, ThresholdDeflateFactory
+
+
+def make_pair(min_size=1024):
+    """Server-side thresholded extension and a client-side decoder"""
+    server = ThresholdDeflate(PerMessageDeflate(False, False, 15, 15), min_size)
+    client = PerMessageDeflate(False, False, 15, 15)
+    return server, client
+
+
+def test_small_messages_skip_compression():
+    """Test that frames under the threshold go out uncompressed"""
+    server, client = make_pair()
+    frame = Frame(Opcode.TEXT, b'{"type":"stream","data":{"chunk":"Hi"}}')
+    
+    encoded = server.encode(frame)
+    assert encoded.rsv1 is False
+    assert encoded.data == frame.data
+    assert client.decode(encoded).data == frame.data
+
+
+def test_large_messages_are_compressed():
+    """Test that large frames are compressed and decode back on the client"""
+    server, client = make_pair()
+    payload = b'{"role":"assistant","content":"The quick brown fox"},' * 200
+    
+    for _ in range(2):
+        encoded = server.encode(Frame(Opcode.TEXT, payload))
+        assert encoded.rsv1 is True
+        assert len(encoded.data) < len(payload) / 5
+        assert client.decode(encoded).data == payload
+    
+    # A small frame between compressed ones leaves the shared context intact
+    assert client.decode(server.encode(Frame(Opcode.TEXT, b"{}"))).data == b"{}"
+    assert client.decode(server.encode(Frame(Opcode.TEXT, payload))).data == payload
+
+
+def test_factory_negotiates_threshold_extension():
+    """Test that accepting permessage-deflate yields the thresholded extension"""
+    factory = ThresholdDeflateFactory(min_size=512, server_max_window_bits=12)
+    response_params, extension = factory.process_request_params([], [])
+    
+    assert isinstance(extension, ThresholdDeflate)
+    assert extension.min_size == 512
+    assert ("server_max_window_bits", "12") in response_params
@@ -159,8 +159,44 @@ export class BackendService {
     });
   }
 
-  async executeAction(action: ActionRequest): Promise<ActionResponse> {
-    return this.sendMessage('action', action);
+  async executeAction(
+    action: ActionRequest,
+    onOutput?: (chunk: string, stream: string) => void
+  ): Promise<ActionResponse> {
+    if (!onOutput) {
+      return this.sendMessage('action', action);
+    }
+
+    return new Promise((resolve, reject) => {
+      if (!this.ws || this.ws.readyState !== WebSocket.OPEN) {
+        reject(new Error('WebSocket not connected'));
+        return;
+      }
+
+      const requestId = crypto.randomUUID();
+
+      // Output arrives as stream frames; the action frame carries the result
+      this.messageHandlers.set(requestId, (data) => {
+        if (data.chunk !== undefined && data.stream) {
+          onOutput(data.chunk, data.stream);
+          return;
+        }
+        this.messageHandlers.delete(requestId);
+        if (data.error) {
+          reject(new Error(data.error));
+        } else {
+          resolve(data);
+        }
+      });
+
+      const message: WSMessage = {
+        type: 'action',
+        data: { ...action, stream: true },
+        requestId,
+      };
+
+      this.ws.send(JSON.stringify(message));
+    });
   }
 
   async updateSettings(settings: any): Promise<void> {
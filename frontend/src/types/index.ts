@@ -88,6 +88,8 @@ export interface ActionRequest {
   command: string;
   description: string;
   requiresConfirmation: boolean;
+  offset?: number;
+  length?: number;
 }
 
 export interface ActionResponse {